@@ -109,37 +109,61 @@ try:
         register_student,
         get_all_students,
         get_subjects,
-        mark_attendance,
+        mark_attendance_bulk,
         get_attendance_report,
         get_class_attendance_report,
         get_student_attendance_report,
         get_student_attendance_summary,
         get_student_details,
-        get_class_attendance_summary,
         get_student_enrolled_subjects,
         update_student,
         delete_student,
         get_students_by_subject,
         enroll_all_students_in_all_subjects,
-        enroll_student_in_all_subjects
+        enroll_student_in_all_subjects,
+        get_auto_enroll_policy,
+        set_auto_enroll_policy,
+        record_visualization_time,
+        get_recognition_runs,
+        use_division,
+        list_shards,
+        get_college_attendance_summary,
+        SHARDING_ENABLED
     )
+    # Class and Student Reports slice the in-memory attendance cube
+    from utils.analytics_cube import get_cube
 except ImportError as e:
     logger.error(f"Error importing database utilities: {str(e)}")
     st.error(f"Database utilities not found: {str(e)}")
 
 # Try importing DeepFace with error handling
 try:
-    from utils.deepface_utils import (
-        verify_faces,
-        detect_faces_with_details,
-        save_session_stats
-    )
+    # Recognition itself runs in the job queue workers (utils.job_queue)
+    from utils.deepface_utils import save_session_stats
     deepface_available = True
 except ImportError as e:
     logger.error(f"Error importing DeepFace: {str(e)}")
     deepface_available = False
     st.error(f"Error loading DeepFace module. Please check installation: {str(e)}")
 
+# Import background recognition job queue
+try:
+    from utils.job_queue import (
+        submit_recognition_batch,
+        get_batch_jobs,
+        get_job_image,
+        get_pending_batch_for_user,
+        get_queue_position,
+        mark_batch_consumed,
+        cancel_batch,
+        start_recognition_workers,
+        FINISHED_STATUSES as RECOGNITION_FINISHED_STATUSES
+    )
+    from config import RECOGNITION_JOB_POLL_INTERVAL, RECOGNITION_JOB_STALE_AFTER
+except ImportError as e:
+    logger.error(f"Error importing recognition job queue: {str(e)}")
+    deepface_available = False
+
 # Try importing Google Sheets utilities
 try:
     from utils.sheets_utils import (
@@ -155,35 +179,32 @@ except ImportError as e:
 
 # Initialize the database
 try:
-    from config import DB_PATH
-    logger.info(f"Database path: {DB_PATH}")
-    logger.info(f"Database file exists: {os.path.exists(str(DB_PATH))}")
+    # Script threads are reused across sessions: start every run on the directory database
+    use_division(None, None)
     
+    # Applies pending schema migrations once per process; a no-op on later reruns
     init_db()
     
-    # Verify database connection and show status
+    # Start the background recognition workers (once per process)
+    if deepface_available:
+        try:
+            start_recognition_workers()
+        except Exception as e:
+            logger.error(f"Error starting recognition workers: {str(e)}")
+    
+    # Start the email outbox dispatcher (once per process); attendance saves only queue emails
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM students")
-        student_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM subjects")
-        subject_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM attendance")
-        attendance_count = cursor.fetchone()[0]
-        conn.close()
-        logger.info(f"Database ready - Students: {student_count}, Subjects: {subject_count}, Attendance: {attendance_count}")
+        from utils.email_outbox import start_email_dispatcher
+        start_email_dispatcher()
     except Exception as e:
-        logger.warning(f"Could not verify database status: {str(e)}")
-    
-    # Auto-enroll all existing students in all subjects on startup
+        logger.error(f"Error starting email dispatcher: {str(e)}")
+
+    # Scheduled online backups (only when BACKUP_INTERVAL_HOURS is set)
     try:
-        enrolled_count = enroll_all_students_in_all_subjects()
-        if enrolled_count > 0:
-            logger.info(f"Auto-enrolled {enrolled_count} student-subject relationships on startup")
+        from utils.backup_utils import start_backup_scheduler
+        start_backup_scheduler()
     except Exception as e:
-        logger.error(f"Error auto-enrolling students on startup: {str(e)}")
-        # Don't fail app startup if enrollment fails
+        logger.error(f"Error starting backup scheduler: {str(e)}")
 except Exception as e:
     logger.error(f"Database initialization error: {str(e)}")
     logger.error(f"Error type: {type(e).__name__}")
@@ -298,6 +319,14 @@ if not st.session_state.authenticated or not st.session_state.user:
 # User is authenticated - show main application
 user = st.session_state.user
 
+# With per-division databases, route this run to the user's division; department-wide users (HOD) pick one
+active_division = user.get('division')
+if SHARDING_ENABLED and not active_division:
+    divisions = [division for _, division, _ in list_shards(user['department'])]
+    if divisions:
+        active_division = st.sidebar.selectbox("Division", options=divisions, key="active_division")
+use_division(user['department'], active_division)
+
 # Initialize session state for navigation
 if "page" not in st.session_state:
     st.session_state.page = "Teacher Dashboard"
@@ -396,6 +425,8 @@ if can_access_feature(user, 'manage_students'):
 if can_access_feature(user, 'manage_users'):
     if st.sidebar.button("📧 Email Settings", key="nav_email_settings", use_container_width=True):
         st.session_state.page = "Email Settings"
+    if st.sidebar.button("🗄️ DB Performance", key="nav_db_performance", use_container_width=True):
+        st.session_state.page = "DB Performance"
 
 # Get current page from session state
 page = st.session_state.page
@@ -431,6 +462,11 @@ except ImportError:
     ESP32_DEFAULT_PASSWORD = "admin"
     REQUEST_TIMEOUT = 10
 
+# Registration, page headers and export file names follow the signed-in user's department and the
+# division this run is routed to; the configured values are only defaults for department-wide users
+department = user.get('department') or department
+division = active_division or division
+
 # Import validators
 try:
     from utils.validators import validate_esp32_url, validate_roll_number, validate_name, validate_email
@@ -445,9 +481,327 @@ except ImportError:
 def is_uploaded_file(file_obj):
     return hasattr(file_obj, 'name') and hasattr(file_obj, 'getvalue')
 
+# Helper function to read raw bytes from an uploaded file, captured bytes or an image path
+# (recognition jobs store and decode these bytes directly, nothing is written to the working directory)
+def read_image_bytes(image_source):
+    if is_uploaded_file(image_source):
+        return image_source.getvalue()
+    if isinstance(image_source, (bytes, bytearray)):
+        return bytes(image_source)
+    with open(image_source, "rb") as f:
+        return f.read()
+
+# Function to save a period's attendance: present students plus everyone else enrolled as absent
+def save_period_attendance(subject_id, selected_date, selected_period, present_ids, enrolled_ids,
+                           capture_source="manual", capture_metadata=None):
+    """Save attendance for a whole period in one transaction and return (present_count, absent_count) saved"""
+    statuses = {student_id: "absent" for student_id in enrolled_ids}
+    statuses.update({student_id: "present" for student_id in present_ids})
+    
+    # The class session records who took attendance and how it was captured
+    outcomes = mark_attendance_bulk(
+        subject_id, selected_date, selected_period, statuses,
+        taken_by=st.session_state.user.get('username'),
+        capture_source=capture_source,
+        capture_metadata=capture_metadata
+    )
+    
+    saved = {student_id for student_id, outcome in outcomes.items() if outcome != "failed"}
+    failed = len(outcomes) - len(saved)
+    if failed:
+        logger.warning(f"Failed to mark attendance for {failed} students (subject_id={subject_id}, date={selected_date})")
+    
+    present_count = sum(1 for student_id, status in statuses.items() if status == "present" and student_id in saved)
+    return present_count, len(saved) - present_count
+
+# Function to report the attendance a recognition worker saved when the batch finished
+def show_saved_recognition_attendance(job, context):
+    """Show the outcome of the attendance saved for a finished recognition batch"""
+    saved = job.get('attendance_result') or {}
+    if saved.get('error'):
+        st.error(f"❌ Error marking attendance: {saved['error']}")
+        st.info("Please check the logs for more details.")
+    elif saved.get('present') or saved.get('absent'):
+        message = f"✅ Attendance automatically saved for {saved['present']} present students"
+        if saved['absent'] > 0:
+            message += f" and {saved['absent']} absent students"
+        message += f" on {context.get('selected_date')}!"
+        st.success(message)
+        
+        # Store attendance data in session state
+        st.session_state.last_attendance = {
+            'subject': context.get('selected_subject'),
+            'date': context.get('selected_date'),
+            'period': context.get('selected_period'),
+            'count': saved['present']
+        }
+    else:
+        st.warning("⚠️ No attendance was marked. Please check the logs.")
+
+# Function to display photos of recognized students with their confidence scores
+def display_student_photos(present_students, confidence_scores):
+    st.markdown("### Student Photos")
+    cols = st.columns(4)
+    col_idx = 0
+    
+    for student in present_students:
+        # Display student face image
+        with cols[col_idx]:
+            try:
+                img = Image.open(student["image_path"])
+                st.image(img, caption=f"{student['roll_no']}\n{student['name']}", width=150)
+                
+                # Add confidence score if available
+                idx = present_students.index(student)
+                if idx < len(confidence_scores):
+                    st.caption(f"Confidence: {confidence_scores[idx]:.2f}")
+            except Exception as e:
+                st.error(f"Error loading image: {str(e)}")
+            
+            # Move to next column
+            col_idx = (col_idx + 1) % 4
+
+# Function to display the result of a single-image recognition job
+def render_single_recognition_result(job, context):
+    result = job['result'] or {}
+    present_students = result.get('present_students', [])
+    confidence_scores = result.get('confidence_scores', [])
+    detected_face_count = result.get('detected_faces', 0)
+    face_locations = result.get('face_locations', [])
+    processing_time = result.get('processing_time', 0)
+    selected_subject = context.get('selected_subject')
+    selected_period = context.get('selected_period')
+    
+    # Save statistics to session state
+    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
+    recognition_rate = (len(present_students) / detected_face_count * 100) if detected_face_count else 0
+    
+    pipeline_stats = result.get('pipeline_stats', {})
+    
+    stats = {
+        'datetime': current_time,
+        'subject': selected_subject,
+        'period': selected_period,
+        'processing_time': processing_time,
+        'detected_faces': detected_face_count,
+        'recognized_students': len(present_students),
+        'recognition_rate': recognition_rate,
+        'avg_confidence': avg_confidence,
+        'detection_scale': pipeline_stats.get('detection_scale', 1.0),
+        'detection_time': pipeline_stats.get('detection_time', 0)
+    }
+    
+    save_session_stats(stats)
+    
+    # Display statistics
+    display_recognition_stats(
+        processing_time=processing_time,
+        detected_faces=detected_face_count,
+        recognized_students=present_students,
+        confidence_scores=confidence_scores,
+        model_name=job['params'].get('model_name', 'Unknown'),
+        pipeline_stats=pipeline_stats
+    )
+    
+    # Display face detection visualization
+    classroom_image = get_job_image(job['id'])
+    if classroom_image:
+        visualization_start = time.perf_counter()
+        visualize_detected_faces(classroom_image, face_locations, present_students)
+        record_visualization_time(job['id'], time.perf_counter() - visualization_start)
+    
+    # Display attendance summary
+    st.subheader("Attendance Summary")
+    
+    # Show comparison of detected vs recognized faces
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.info(f"**Detected Faces:** {detected_face_count}")
+        
+    with col2:
+        st.success(f"**Recognized Students:** {len(present_students)}")
+    
+    if detected_face_count > len(present_students):
+        st.warning(f"⚠️ {detected_face_count - len(present_students)} faces detected but not recognized. These may be students not registered in the system or false detections.")
+    
+    # Attendance was saved by the recognition worker when the job finished
+    show_saved_recognition_attendance(job, context)
+    
+    # Display recognized students in a table for reference
+    if present_students:
+        st.markdown("### Recognized Students (Reference)")
+        student_data = []
+        for student in present_students:
+            student_data.append({
+                "Roll No": student["roll_no"],
+                "Name": student["name"],
+                "Status": "✅ Present"
+            })
+        
+        student_df = pd.DataFrame(student_data)
+        st.dataframe(student_df, use_container_width=True)
+        
+        # Visual representation of recognized students
+        display_student_photos(present_students, confidence_scores)
+    else:
+        st.warning("No students were recognized in any of the images.")
+
+# Function to display the combined result of a multi-image recognition batch
+def render_batch_recognition_results(jobs, context):
+    st.subheader("Processing Multiple Images")
+    
+    # Create a container for all results
+    all_results_container = st.container()
+    
+    # Initialize combined results
+    all_detected_faces = 0
+    all_recognized_students = set()  # Use a set to avoid duplicates
+    all_confidence_scores = []
+    total_processing_time = 0
+    present_students = []
+    confidence_scores = []
+    
+    for idx, job in enumerate(jobs):
+        result = job['result'] or {}
+        present_students = result.get('present_students', [])
+        confidence_scores = result.get('confidence_scores', [])
+        processing_time = result.get('processing_time', 0)
+        
+        # Update combined results
+        all_detected_faces += result.get('detected_faces', 0)
+        all_recognized_students.update([student["id"] for student in present_students])
+        all_confidence_scores.extend(confidence_scores)
+        total_processing_time += processing_time
+        
+        # Display individual image results
+        st.write(f"### Image {idx+1} Results")
+        st.write(f"Detected faces: {result.get('detected_faces', 0)}")
+        st.write(f"Recognized students: {len(present_students)}")
+        st.write(f"Processing time: {processing_time:.2f} seconds")
+    
+    # Display combined results
+    with all_results_container:
+        st.subheader("Combined Results")
+        
+        # Display metrics
+        cols = st.columns(4)
+        with cols[0]:
+            st.metric("Total Processing Time", f"{total_processing_time:.2f} sec")
+        with cols[1]:
+            st.metric("Total Faces Detected", f"{all_detected_faces}")
+        with cols[2]:
+            st.metric("Total Students Recognized", f"{len(all_recognized_students)}")
+        with cols[3]:
+            recognition_rate = (len(all_recognized_students) / all_detected_faces * 100) if all_detected_faces > 0 else 0
+            st.metric("Overall Recognition Rate", f"{recognition_rate:.1f}%")
+        
+        # Display recognized students
+        st.markdown("### All Recognized Students")
+        
+        # Get full details of all recognized students
+        recognized_student_details = []
+        for student_id in all_recognized_students:
+            student_details = get_student_details(student_id)
+            if student_details:
+                recognized_student_details.append(student_details)
+        
+        # Display in a grid
+        if recognized_student_details:
+            grid_cols = st.columns(4)
+            for i, student in enumerate(recognized_student_details):
+                with grid_cols[i % 4]:
+                    try:
+                        img = Image.open(student["image_path"])
+                        st.image(img, caption=f"{student['roll_no']}\n{student['name']}", width=150)
+                    except Exception as e:
+                        st.error(f"Error loading image: {str(e)}")
+            
+            # Attendance was saved by the recognition worker when the batch finished
+            show_saved_recognition_attendance(jobs[0], context)
+            
+            # Visual representation of recognized students
+            display_student_photos(present_students, confidence_scores)
+        else:
+            st.warning("No students were recognized in any of the images.")
+
+# Function to poll a queued recognition batch and render it once every job has finished
+def render_recognition_batch(batch_id):
+    jobs = get_batch_jobs(batch_id)
+    if not jobs:
+        st.session_state.recognition_batch_id = None
+        return
+    
+    context = (jobs[0]['params'] or {}).get('context', {})
+    pending_jobs = [job for job in jobs if job['status'] not in RECOGNITION_FINISHED_STATUSES]
+    # The worker finishing the batch saves its attendance; wait for the outcome unless that worker went away
+    saving_attendance = not pending_jobs and any(job['status'] == 'completed' for job in jobs) \
+        and jobs[0].get('attendance_result') is None \
+        and (not jobs[0].get('attendance_saved_at')
+             or datetime.datetime.fromisoformat(jobs[0]['attendance_saved_at'])
+             > datetime.datetime.now() - datetime.timedelta(seconds=RECOGNITION_JOB_STALE_AFTER))
+    
+    if pending_jobs or saving_attendance:
+        st.subheader("⏳ Recognition in Progress")
+        st.caption(f"{context.get('selected_subject', '')} | {context.get('selected_date', '')} | {context.get('selected_period', '')}. "
+                   "You can refresh or leave this page; the job keeps running and results will be shown here.")
+        
+        overall_progress = sum(job['progress'] or 0 for job in jobs) / len(jobs)
+        st.progress(min(max(overall_progress, 0.0), 1.0))
+        
+        for idx, job in enumerate(jobs):
+            label = f"Image {idx+1}" if len(jobs) > 1 else "Image"
+            if job['status'] == 'queued':
+                st.write(f"{label}: waiting in queue (position {get_queue_position(job['id']) + 1})")
+            elif job['status'] == 'running':
+                st.write(f"{label}: {job['stage'] or 'running'} ({(job['progress'] or 0) * 100:.0f}%)")
+            else:
+                st.write(f"{label}: {job['status']}")
+            
+            # Show students matched so far
+            partial = job['partial_result'] or {}
+            matched = partial.get('matched', [])
+            if matched and job['status'] == 'running':
+                st.caption("Recognized so far: " + ", ".join(f"{m['roll_no']} ({m['confidence']:.2f})" for m in matched))
+        
+        if saving_attendance:
+            st.write("Saving attendance...")
+        
+        if st.button("Cancel Recognition", key="cancel_recognition"):
+            cancel_batch(batch_id)
+            st.session_state.recognition_batch_id = None
+            st.experimental_rerun()
+        
+        time.sleep(RECOGNITION_JOB_POLL_INTERVAL)
+        st.experimental_rerun()
+        return
+    
+    # Every job has finished - render the results once
+    mark_batch_consumed(batch_id)
+    st.session_state.recognition_batch_id = None
+    
+    for idx, job in enumerate(jobs):
+        if job['status'] == 'failed':
+            st.error(f"Error processing image {idx+1}: {job.get('error') or 'Unknown error'}")
+    
+    completed_jobs = [job for job in jobs if job['status'] == 'completed']
+    if not completed_jobs:
+        return
+    
+    try:
+        if context.get('mode') == 'batch':
+            render_batch_recognition_results(completed_jobs, context)
+        else:
+            render_single_recognition_result(completed_jobs[0], context)
+    except Exception as e:
+        logger.error(f"Error processing attendance: {str(e)}\n{traceback.format_exc()}")
+        st.error(f"Error processing attendance: {str(e)}")
+
 # Function to display recognition statistics
-def display_recognition_stats(processing_time, detected_faces, recognized_students, confidence_scores, model_name="Unknown"):
+def display_recognition_stats(processing_time, detected_faces, recognized_students, confidence_scores, model_name="Unknown", pipeline_stats=None):
     """Display recognition statistics in a visually appealing way"""
+    pipeline_stats = pipeline_stats or {}
     st.subheader("📊 Recognition Statistics")
     
     cols = st.columns(5)
@@ -463,6 +817,28 @@ def display_recognition_stats(processing_time, detected_faces, recognized_studen
     with cols[4]:
         st.metric("Model", model_name)
     
+    # Detection runs on a downscaled copy of large images
+    if 'detection_scale' in pipeline_stats:
+        st.caption(
+            f"Detection: {pipeline_stats.get('detection_time', 0):.2f} sec on a "
+            f"{pipeline_stats.get('detection_scale', 1.0):.0%} scale copy of the "
+            f"{pipeline_stats.get('image_width', '?')}x{pipeline_stats.get('image_height', '?')} image"
+        )
+    
+    # Per-stage breakdown of where the processing time went
+    stages = pipeline_stats.get('stages', {})
+    if stages:
+        with st.expander("⏱️ Stage Timing"):
+            stage_df = pd.DataFrame({
+                'Stage': list(stages.keys()),
+                'Seconds': [round(seconds, 3) for seconds in stages.values()]
+            }).set_index('Stage')
+            st.bar_chart(stage_df)
+            per_face = pipeline_stats.get('embedding_per_face', [])
+            if per_face:
+                st.caption(f"Embedding: {sum(per_face) / len(per_face) * 1000:.0f} ms per face over {len(per_face)} faces, "
+                           f"roster of {pipeline_stats.get('tags', {}).get('roster_size', 0)} students")
+    
     # Display confidence information if available
     if confidence_scores:
         avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
@@ -480,7 +856,7 @@ def visualize_detected_faces(image_path, face_locations, recognized_students=Non
     around detected faces, highlighting recognized students
     
     Args:
-        image_path: Path to the classroom image
+        image_path: Path to the classroom image, or its raw encoded bytes
         face_locations: List of face location dictionaries with x, y, w, h
         recognized_students: List of recognized student dictionaries
     """
@@ -488,7 +864,11 @@ def visualize_detected_faces(image_path, face_locations, recognized_students=Non
         import cv2
         
         # Load image with OpenCV
-        image = cv2.imread(image_path)
+        if isinstance(image_path, (bytes, bytearray)):
+            image = cv2.imdecode(np.frombuffer(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            image_path = "<image bytes>"
+        else:
+            image = cv2.imread(image_path)
         if image is None:
             st.error(f"Failed to load image for visualization: {image_path}")
             return
@@ -551,7 +931,7 @@ def visualize_detected_faces(image_path, face_locations, recognized_students=Non
 # Main page content
 if page == "Teacher Dashboard":
     st.title("📊 Teacher Dashboard")
-    st.markdown('<div class="dashboard-card"><p>View and manage student information for ENTC B.Tech b division.</p></div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="dashboard-card"><p>View and manage student information for {department} {year} {division} division.</p></div>', unsafe_allow_html=True)
     st.subheader(f"Department: {department} | Year: {year} | Division: {division}")
     
     # Get all students
@@ -807,6 +1187,7 @@ elif page == "User Management":
                             'Role': u['role'],
                             'Email': u['email'] or 'N/A',
                             'Department': u['department'],
+                            'Division': u['division'] or 'All',
                             'Status': 'Active' if u['is_active'] else 'Inactive',
                             'Last Login': u['last_login'] or 'Never',
                             'Created': u['created_at']
@@ -843,6 +1224,7 @@ elif page == "User Management":
                         new_role = st.selectbox("Role *", options=list(ROLES.keys()), 
                                                format_func=lambda x: ROLES[x]['name'])
                         new_department = st.text_input("Department", value=user['department'])
+                        new_division = st.text_input("Division", help="Leave empty for department-wide users (e.g. HOD)")
                         new_password = st.text_input("Password *", type="password", 
                                                     help="Minimum 6 characters recommended")
                     
@@ -856,7 +1238,7 @@ elif page == "User Management":
                         else:
                             success, error_msg = create_user(
                                 new_username, new_password, new_role, 
-                                new_name, new_email, new_department
+                                new_name, new_email, new_department, new_division.strip() or None
                             )
                             if success:
                                 st.success(f"✅ User '{new_username}' created successfully!")
@@ -1185,6 +1567,20 @@ elif page == "Enroll All Students":
                 
                 st.markdown("---")
                 
+                # New students and subjects are enrolled by database triggers while this is on
+                auto_enroll = get_auto_enroll_policy()
+                new_auto_enroll = st.checkbox(
+                    "Automatically enroll new students and subjects",
+                    value=auto_enroll,
+                    help="When on, every newly registered student is enrolled in all subjects and every new subject is added for all students"
+                )
+                if new_auto_enroll != auto_enroll:
+                    if set_auto_enroll_policy(new_auto_enroll):
+                        st.success("✅ Enrollment policy updated")
+                        st.experimental_rerun()
+                    else:
+                        st.error("❌ Failed to update enrollment policy")
+                
                 if st.button("🚀 Enroll All Students in All Subjects", type="primary", use_container_width=True):
                     with st.spinner("Enrolling students in subjects..."):
                         enrolled_count = enroll_all_students_in_all_subjects()
@@ -1375,6 +1771,8 @@ elif page == "Take Attendance":
         )
     
     image_files = []
+    image_file = None
+    process_all = False
     if image_source == "Upload Image":
         allow_multiple = st.checkbox("Upload multiple images", value=False, 
                                     help="Enable to upload multiple classroom images at once")
@@ -1522,17 +1920,14 @@ elif page == "Take Attendance":
                     response = requests.get(capture_url, auth=auth, timeout=REQUEST_TIMEOUT)
                     
                     if response.status_code == 200:
-                        # Save the captured image
-                        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                        image_path = f"captured_{timestamp}.jpg"
-                        with open(image_path, "wb") as f:
-                            f.write(response.content)
+                        # Keep the captured JPEG bytes in memory; recognition decodes them directly
+                        st.session_state.esp32_captured_image = response.content
                         
-                        image = Image.open(image_path)
+                        image = Image.open(io.BytesIO(response.content))
                         st.success("✅ Image captured successfully!")
                         st.image(image, caption="Captured Image from ESP32-CAM", width=600)
-                        image_file = image_path
-                        image_files = [image_path]
+                        image_file = response.content
+                        image_files = [response.content]
                     elif response.status_code == 401:
                         st.error("❌ Authentication failed. Please check your username and password.")
                         logger.error(f"ESP32-CAM authentication failed. Status code: {response.status_code}")
@@ -1548,16 +1943,13 @@ elif page == "Take Attendance":
                             try:
                                 alt_response = requests.get(alt_url, auth=auth, timeout=REQUEST_TIMEOUT)
                                 if alt_response.status_code == 200 and alt_response.headers.get('content-type', '').startswith('image'):
-                                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                                    image_path = f"captured_{timestamp}.jpg"
-                                    with open(image_path, "wb") as f:
-                                        f.write(alt_response.content)
+                                    st.session_state.esp32_captured_image = alt_response.content
                                     
-                                    image = Image.open(image_path)
+                                    image = Image.open(io.BytesIO(alt_response.content))
                                     st.success(f"✅ Image captured from {alt_url}!")
                                     st.image(image, caption="Captured Image from ESP32-CAM", width=600)
-                                    image_file = image_path
-                                    image_files = [image_path]
+                                    image_file = alt_response.content
+                                    image_files = [alt_response.content]
                                     captured = True
                                     break
                             except:
@@ -1580,6 +1972,11 @@ elif page == "Take Attendance":
             except Exception as e:
                 logger.error(f"Error capturing image: {str(e)}")
                 st.error(f"❌ Error: {str(e)}")
+        elif st.session_state.get('esp32_captured_image'):
+            # Reuse the last capture on reruns (e.g. when "Analyze Image" is clicked)
+            image_file = st.session_state.esp32_captured_image
+            image_files = [image_file]
+            st.image(Image.open(io.BytesIO(image_file)), caption="Last Captured Image from ESP32-CAM", width=600)
     
     # Check for form submissions first (outside button conditional)
     # This ensures form submission works even after rerun
@@ -1609,33 +2006,13 @@ elif page == "Take Attendance":
                 st.error("❌ Error: Subject ID is not available.")
                 logger.error("Subject ID is None when trying to mark attendance")
             else:
-                success_count = 0
-                absent_count = 0
-                
                 logger.info(f"Processing batch attendance: {len(marked_ids)} students. Subject: {subject_id_val}, Date: {selected_date}, Period: {selected_period}")
                 
-                # Mark present students
-                if marked_ids:
-                    for student_id in marked_ids:
-                        try:
-                            success = mark_attendance(student_id, subject_id_val, selected_date, selected_period, status="present")
-                            if success:
-                                success_count += 1
-                        except Exception as e:
-                            logger.error(f"Error marking attendance for student_id={student_id}: {str(e)}")
-                
-                # Mark absent students
-                all_enrolled_ids = [s["id"] for s in all_enrolled_students]
-                absent_student_ids = [sid for sid in all_enrolled_ids if sid not in marked_ids]
-                
-                if absent_student_ids:
-                    for student_id in absent_student_ids:
-                        try:
-                            success = mark_attendance(student_id, subject_id_val, selected_date, selected_period, status="absent")
-                            if success:
-                                absent_count += 1
-                        except Exception as e:
-                            logger.error(f"Error marking absent attendance for student_id={student_id}: {str(e)}")
+                # Selected students are present, the rest of the enrolled students absent
+                success_count, absent_count = save_period_attendance(
+                    subject_id_val, selected_date, selected_period,
+                    marked_ids, [s["id"] for s in all_enrolled_students]
+                )
                 
                 if success_count > 0 or absent_count > 0:
                     message = f"✅ Attendance saved for {success_count} present students"
@@ -1683,33 +2060,13 @@ elif page == "Take Attendance":
                 st.error("❌ Error: Subject ID is not available.")
                 logger.error("Subject ID is None when trying to mark attendance")
             else:
-                success_count = 0
-                absent_count = 0
-                
                 logger.info(f"Processing attendance: {len(marked_ids)} students. Subject: {subject_id_val}, Date: {selected_date}, Period: {selected_period}")
                 
-                # Mark present students
-                if marked_ids:
-                    for student_id in marked_ids:
-                        try:
-                            success = mark_attendance(student_id, subject_id_val, selected_date, selected_period, status="present")
-                            if success:
-                                success_count += 1
-                        except Exception as e:
-                            logger.error(f"Error marking attendance for student_id={student_id}: {str(e)}")
-                
-                # Mark absent students
-                all_enrolled_ids = [s["id"] for s in all_enrolled_students]
-                absent_student_ids = [sid for sid in all_enrolled_ids if sid not in marked_ids]
-                
-                if absent_student_ids:
-                    for student_id in absent_student_ids:
-                        try:
-                            success = mark_attendance(student_id, subject_id_val, selected_date, selected_period, status="absent")
-                            if success:
-                                absent_count += 1
-                        except Exception as e:
-                            logger.error(f"Error marking absent attendance for student_id={student_id}: {str(e)}")
+                # Selected students are present, the rest of the enrolled students absent
+                success_count, absent_count = save_period_attendance(
+                    subject_id_val, selected_date, selected_period,
+                    marked_ids, [s["id"] for s in all_enrolled_students]
+                )
                 
                 if success_count > 0 or absent_count > 0:
                     message = f"✅ Attendance saved for {success_count} present students"
@@ -1735,424 +2092,61 @@ elif page == "Take Attendance":
             st.error(f"❌ Error marking attendance: {str(e)}")
             st.session_state.attendance_form_submitted = False
     
-    # Process attendance button - just analyze, don't save yet
+    # Process attendance button - queue recognition jobs, results are polled below
     if deepface_available and st.button("Analyze Image") and len(image_files) > 0 and subject_id is not None:
-        # If processing all images is enabled and there are multiple images
-        if process_all and len(image_files) > 1:
-            st.subheader("Processing Multiple Images")
-            
-            # Create a container for all results
-            all_results_container = st.container()
-            
-            # Initialize combined results
-            all_detected_faces = 0
-            all_recognized_students = set()  # Use a set to avoid duplicates
-            all_confidence_scores = []
-            total_processing_time = 0
-            
-            # Process each image
-            for idx, img_file in enumerate(image_files):
-                with st.spinner(f"Processing image {idx+1} of {len(image_files)}..."):
-                    try:
-                        # Record start time for performance metrics
-                        start_time = time.time()
-                        
-                        # Prepare parameters for DeepFace verification
-                        temp_image_path = None
-                        
-                        if is_uploaded_file(img_file):
-                            # For uploaded files, save to a temporary file
-                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                            temp_image_path = f"temp_image_{idx}_{timestamp}.jpg"
-                            with open(temp_image_path, "wb") as f:
-                                f.write(img_file.getvalue())
-                            classroom_image = temp_image_path
-                        else:
-                            # For paths from ESP32-CAM
-                            classroom_image = img_file
-                        
-                        # Detect all faces first to get count
-                        detected_faces, face_locations = detect_faces_with_details(classroom_image, detector_backend=detector_backend)
-                        
-                        # Use the selected model with adjusted threshold for better recognition
-                        present_students, confidence_scores = verify_faces(
-                            classroom_image_path=classroom_image, 
-                            students=get_all_students(),
-                            threshold=threshold,
-                            model_name=model_name,
-                            return_confidence=True,
-                            detector_backend=detector_backend
-                        )
-                        
-                        # Calculate processing time
-                        end_time = time.time()
-                        processing_time = end_time - start_time
-                        
-                        # Update combined results
-                        all_detected_faces += len(detected_faces)
-                        all_recognized_students.update([student["id"] for student in present_students])
-                        all_confidence_scores.extend(confidence_scores)
-                        total_processing_time += processing_time
-                        
-                        # Display individual image results
-                        st.write(f"### Image {idx+1} Results")
-                        st.write(f"Detected faces: {len(detected_faces)}")
-                        st.write(f"Recognized students: {len(present_students)}")
-                        st.write(f"Processing time: {processing_time:.2f} seconds")
-                        
-                        # Clean up temporary file if created
-                        if temp_image_path and os.path.exists(temp_image_path):
-                            os.remove(temp_image_path)
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing image {idx+1}: {str(e)}\n{traceback.format_exc()}")
-                        st.error(f"Error processing image {idx+1}: {str(e)}")
-            
-            # Display combined results
-            with all_results_container:
-                st.subheader("Combined Results")
-                
-                # Display metrics
-                cols = st.columns(4)
-                with cols[0]:
-                    st.metric("Total Processing Time", f"{total_processing_time:.2f} sec")
-                with cols[1]:
-                    st.metric("Total Faces Detected", f"{all_detected_faces}")
-                with cols[2]:
-                    st.metric("Total Students Recognized", f"{len(all_recognized_students)}")
-                with cols[3]:
-                    recognition_rate = (len(all_recognized_students) / all_detected_faces * 100) if all_detected_faces > 0 else 0
-                    st.metric("Overall Recognition Rate", f"{recognition_rate:.1f}%")
-                
-                # Display recognized students
-                st.markdown("### All Recognized Students")
-                
-                # Get full details of all recognized students
-                recognized_student_details = []
-                for student_id in all_recognized_students:
-                    student_details = get_student_details(student_id)
-                    if student_details:
-                        recognized_student_details.append(student_details)
-                
-                # Display in a grid
-                if recognized_student_details:
-                    grid_cols = st.columns(4)
-                    for i, student in enumerate(recognized_student_details):
-                        with grid_cols[i % 4]:
-                            try:
-                                img = Image.open(student["image_path"])
-                                st.image(img, caption=f"{student['roll_no']}\n{student['name']}", width=150)
-                            except Exception as e:
-                                st.error(f"Error loading image: {str(e)}")
-                    
-                    # Automatically mark attendance for batch processing
-                    # Get all enrolled students and recognized student IDs
-                    all_enrolled_students = get_students_by_subject(subject_id)
-                    recognized_student_ids = [student["id"] for student in recognized_student_details] if recognized_student_details else []
-                    selected_date = attendance_date.strftime("%Y-%m-%d")
-                    
-                    # Automatically mark attendance
-                    try:
-                        logger.info(f"Auto-marking batch attendance: {len(recognized_student_ids)} recognized students. Subject: {subject_id}, Date: {selected_date}, Period: {selected_period}")
-                        
-                        if subject_id is None:
-                            st.error("❌ Error: Subject ID is not available. Please select a subject and try again.")
-                            logger.error("Subject ID is None when trying to mark attendance")
-                        else:
-                            success_count = 0
-                            absent_count = 0
-                            
-                            # Mark present students (recognized)
-                            if recognized_student_ids:
-                                for student_id in recognized_student_ids:
-                                    try:
-                                        success = mark_attendance(student_id, subject_id, selected_date, selected_period, status="present")
-                                        if success:
-                                            success_count += 1
-                                        else:
-                                            logger.warning(f"Failed to mark attendance for student_id={student_id}")
-                                    except Exception as e:
-                                        logger.error(f"Error marking attendance for student_id={student_id}: {str(e)}")
-                                        st.warning(f"Failed to mark attendance for student {student_id}: {str(e)}")
-                            
-                            # Mark absent students (those enrolled but not recognized)
-                            all_enrolled_ids = [s["id"] for s in all_enrolled_students]
-                            absent_student_ids = [sid for sid in all_enrolled_ids if sid not in recognized_student_ids]
-                            
-                            if absent_student_ids:
-                                for student_id in absent_student_ids:
-                                    try:
-                                        success = mark_attendance(student_id, subject_id, selected_date, selected_period, status="absent")
-                                        if success:
-                                            absent_count += 1
-                                    except Exception as e:
-                                        logger.error(f"Error marking absent attendance for student_id={student_id}: {str(e)}")
-                            
-                            if success_count > 0 or absent_count > 0:
-                                message = f"✅ Attendance automatically saved for {success_count} present students"
-                                if absent_count > 0:
-                                    message += f" and {absent_count} absent students"
-                                message += f" on {selected_date}!"
-                                st.success(message)
-                                logger.info(f"Successfully saved attendance for {success_count} present and {absent_count} absent students")
-                                
-                                # Store attendance data in session state
-                                st.session_state.last_attendance = {
-                                    'subject': selected_subject,
-                                    'date': selected_date,
-                                    'period': selected_period,
-                                    'count': success_count
-                                }
-                            else:
-                                st.warning("⚠️ No attendance was marked. Please check the logs.")
-                                logger.warning("No students were successfully marked for attendance")
-                    except Exception as e:
-                        logger.error(f"Error in automatic batch attendance marking: {str(e)}\n{traceback.format_exc()}")
-                        st.error(f"❌ Error marking attendance: {str(e)}")
-                        st.info("Please check the logs for more details.")
-                    
-                    # Visual representation of recognized students
-                    st.markdown("### Student Photos")
-                    cols = st.columns(4)
-                    col_idx = 0
-                    
-                    for student in present_students:
-                        # Display student face image
-                        with cols[col_idx]:
-                            try:
-                                img = Image.open(student["image_path"])
-                                st.image(img, caption=f"{student['roll_no']}\n{student['name']}", width=150)
-                                
-                                # Add confidence score if available
-                                idx = present_students.index(student)
-                                if idx < len(confidence_scores):
-                                    st.caption(f"Confidence: {confidence_scores[idx]:.2f}")
-                            except Exception as e:
-                                st.error(f"Error loading image: {str(e)}")
-                            
-                            # Move to next column
-                            col_idx = (col_idx + 1) % 4
-                    
-                    # Clean up temporary file if created
-                    if temp_image_path and os.path.exists(temp_image_path):
-                        os.remove(temp_image_path)
-                    
-                else:
-                    st.warning("No students were recognized in any of the images.")
+        # Get all registered students to match against
+        all_students = get_all_students()
+        
+        # Check if we have students in database
+        if not all_students:
+            st.error("❌ No students found in database.")
+            st.info("""
+            **To fix this:**
+            1. Go to **👤 Student Registration** page to add students
+            2. Make sure students are enrolled in the selected subject
+            3. Check database connection in logs
+            
+            **Quick Check:**
+            - Database file: `db/attendance.db`
+            - Check if file exists and has proper permissions
+            """)
         else:
-            # Process single image (existing code)
-            with st.spinner("Processing image using facial recognition..."):
-                try:
-                    # Record start time for performance metrics
-                    start_time = time.time()
-                    
-                    # Get all students enrolled in the selected subject
-                    all_students = get_all_students()
-                    
-                    # Check if we have students in database
-                    if not all_students:
-                        st.error("❌ No students found in database.")
-                        st.info("""
-                        **To fix this:**
-                        1. Go to **👤 Student Registration** page to add students
-                        2. Make sure students are enrolled in the selected subject
-                        3. Check database connection in logs
-                        
-                        **Quick Check:**
-                        - Database file: `db/attendance.db`
-                        - Check if file exists and has proper permissions
-                        """)
-                    else:
-                        # Prepare parameters for DeepFace verification
-                        # Handle both uploaded file objects and file paths
-                        temp_image_path = None
-                        
-                        if is_uploaded_file(image_file):
-                            # For uploaded files, save to a temporary file
-                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                            temp_image_path = f"temp_image_{timestamp}.jpg"
-                            with open(temp_image_path, "wb") as f:
-                                f.write(image_file.getvalue())
-                            classroom_image = temp_image_path
-                        else:
-                            # For paths from ESP32-CAM
-                            classroom_image = image_file
-                        
-                        # Detect all faces first to get count
-                        detected_faces, face_locations = detect_faces_with_details(classroom_image)
-                        
-                        # Use the selected model with adjusted threshold for better recognition
-                        present_students, confidence_scores = verify_faces(
-                            classroom_image_path=classroom_image, 
-                            students=all_students,
-                            threshold=threshold,
-                            model_name=model_name,
-                            return_confidence=True
-                        )
-                        
-                        # Calculate processing time
-                        end_time = time.time()
-                        processing_time = end_time - start_time
-                        
-                        # Save statistics to session state
-                        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
-                        recognition_rate = (len(present_students) / len(detected_faces) * 100) if detected_faces else 0
-                        
-                        stats = {
-                            'datetime': current_time,
-                            'subject': selected_subject,
-                            'period': selected_period,
-                            'processing_time': processing_time,
-                            'detected_faces': len(detected_faces),
-                            'recognized_students': len(present_students),
-                            'recognition_rate': recognition_rate,
-                            'avg_confidence': avg_confidence
-                        }
-                        
-                        save_session_stats(stats)
-                        
-                        # Display statistics
-                        display_recognition_stats(
-                            processing_time=processing_time,
-                            detected_faces=len(detected_faces),
-                            recognized_students=present_students,
-                            confidence_scores=confidence_scores,
-                            model_name=model_name
-                        )
-                        
-                        # Display face detection visualization
-                        visualize_detected_faces(classroom_image, face_locations, present_students)
-                        
-                        # Display attendance summary
-                        st.subheader("Attendance Summary")
-                        
-                        # Show comparison of detected vs recognized faces
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.info(f"**Detected Faces:** {len(detected_faces)}")
-                            
-                        with col2:
-                            st.success(f"**Recognized Students:** {len(present_students)}")
-                        
-                        if len(detected_faces) > len(present_students):
-                            st.warning(f"⚠️ {len(detected_faces) - len(present_students)} faces detected but not recognized. These may be students not registered in the system or false detections.")
-                        
-                        # Automatically mark attendance for recognized students
-                        selected_date = attendance_date.strftime("%Y-%m-%d")
-                        
-                        # Get all students enrolled in this subject
-                        all_enrolled_students = get_students_by_subject(subject_id)
-                        present_student_ids = [student["id"] for student in present_students] if present_students else []
-                        
-                        # Automatically mark attendance
-                        try:
-                            logger.info(f"Auto-marking attendance: {len(present_student_ids)} recognized students. Subject: {subject_id}, Date: {selected_date}, Period: {selected_period}")
-                            
-                            if subject_id is None:
-                                st.error("❌ Error: Subject ID is not available. Please select a subject and try again.")
-                                logger.error("Subject ID is None when trying to mark attendance")
-                            else:
-                                success_count = 0
-                                absent_count = 0
-                                
-                                # Mark present students (recognized)
-                                if present_student_ids:
-                                    for student_id in present_student_ids:
-                                        try:
-                                            success = mark_attendance(student_id, subject_id, selected_date, selected_period, status="present")
-                                            if success:
-                                                success_count += 1
-                                            else:
-                                                logger.warning(f"Failed to mark attendance for student_id={student_id}")
-                                        except Exception as e:
-                                            logger.error(f"Error marking attendance for student_id={student_id}: {str(e)}")
-                                            st.warning(f"Failed to mark attendance for student {student_id}: {str(e)}")
-                                
-                                # Mark absent students (those enrolled but not recognized)
-                                all_enrolled_ids = [s["id"] for s in all_enrolled_students]
-                                absent_student_ids = [sid for sid in all_enrolled_ids if sid not in present_student_ids]
-                                
-                                if absent_student_ids:
-                                    for student_id in absent_student_ids:
-                                        try:
-                                            success = mark_attendance(student_id, subject_id, selected_date, selected_period, status="absent")
-                                            if success:
-                                                absent_count += 1
-                                        except Exception as e:
-                                            logger.error(f"Error marking absent attendance for student_id={student_id}: {str(e)}")
-                                
-                                if success_count > 0 or absent_count > 0:
-                                    message = f"✅ Attendance automatically saved for {success_count} present students"
-                                    if absent_count > 0:
-                                        message += f" and {absent_count} absent students"
-                                    message += f" on {selected_date}!"
-                                    st.success(message)
-                                    logger.info(f"Successfully saved attendance for {success_count} present and {absent_count} absent students")
-                                    
-                                    # Store attendance data in session state
-                                    st.session_state.last_attendance = {
-                                        'subject': selected_subject,
-                                        'date': selected_date,
-                                        'period': selected_period,
-                                        'count': success_count
-                                    }
-                                else:
-                                    st.warning("⚠️ No attendance was marked. Please check the logs.")
-                                    logger.warning("No students were successfully marked for attendance")
-                        except Exception as e:
-                            logger.error(f"Error in automatic attendance marking: {str(e)}\n{traceback.format_exc()}")
-                            st.error(f"❌ Error marking attendance: {str(e)}")
-                            st.info("Please check the logs for more details.")
-                        
-                        # Display recognized students in a table for reference
-                        if present_students:
-                            st.markdown("### Recognized Students (Reference)")
-                            student_data = []
-                            for student in present_students:
-                                student_data.append({
-                                    "Roll No": student["roll_no"],
-                                    "Name": student["name"],
-                                    "Status": "✅ Present"
-                                })
-                            
-                            student_df = pd.DataFrame(student_data)
-                            st.dataframe(student_df, use_container_width=True)
-                            
-                            # Visual representation of recognized students
-                            st.markdown("### Student Photos")
-                            cols = st.columns(4)
-                            col_idx = 0
-                            
-                            for student in present_students:
-                                # Display student face image
-                                with cols[col_idx]:
-                                    try:
-                                        img = Image.open(student["image_path"])
-                                        st.image(img, caption=f"{student['roll_no']}\n{student['name']}", width=150)
-                                        
-                                        # Add confidence score if available
-                                        idx = present_students.index(student)
-                                        if idx < len(confidence_scores):
-                                            st.caption(f"Confidence: {confidence_scores[idx]:.2f}")
-                                    except Exception as e:
-                                        st.error(f"Error loading image: {str(e)}")
-                                    
-                                    # Move to next column
-                                    col_idx = (col_idx + 1) % 4
-                            
-                            # Clean up temporary file if created
-                            if temp_image_path and os.path.exists(temp_image_path):
-                                os.remove(temp_image_path)
-                        
-                        else:
-                            st.warning("No students were recognized in any of the images.")
-                except Exception as e:
-                    logger.error(f"Error processing attendance: {str(e)}\n{traceback.format_exc()}")
-                    st.error(f"Error processing attendance: {str(e)}")
+            # If processing all images is enabled and there are multiple images
+            batch_mode = process_all and len(image_files) > 1
+            images_to_process = image_files if batch_mode else [image_file]
+            
+            try:
+                batch_id = submit_recognition_batch(
+                    images=[read_image_bytes(img) for img in images_to_process],
+                    students=all_students,
+                    params={
+                        'threshold': threshold,
+                        'model_name': model_name,
+                        'detector_backend': detector_backend
+                    },
+                    queue_key=user.get('username', 'anonymous'),
+                    submitted_by=user.get('username'),
+                    context={
+                        'mode': 'batch' if batch_mode else 'single',
+                        'subject_id': subject_id,
+                        'selected_subject': selected_subject,
+                        'selected_date': attendance_date.strftime("%Y-%m-%d"),
+                        'selected_period': selected_period
+                    }
+                )
+                st.session_state.recognition_batch_id = batch_id
+            except Exception as e:
+                logger.error(f"Error queueing recognition job: {str(e)}\n{traceback.format_exc()}")
+                st.error(f"Error processing attendance: {str(e)}")
     elif not deepface_available and st.button("Analyze Image"):
         st.error("DeepFace module is not available. Please check installation and dependencies.")
+    
+    # Poll queued recognition jobs. Unfinished jobs are picked up again after a refresh or reconnect.
+    if deepface_available:
+        recognition_batch_id = st.session_state.get('recognition_batch_id') or get_pending_batch_for_user(user.get('username'))
+        if recognition_batch_id:
+            st.session_state.recognition_batch_id = recognition_batch_id
+            render_recognition_batch(recognition_batch_id)
 
 elif page == "Attendance Reports":
     # Check permission
@@ -2471,6 +2465,29 @@ elif page == "Recognition Stats":
         View statistics on recognition accuracy, processing times, and system performance.
         """)
         
+        # Stage timings are persisted for every recognition run, so they survive across sessions
+        recognition_runs = get_recognition_runs()
+        if recognition_runs:
+            st.subheader("Pipeline Stage Timing")
+            runs_df = pd.DataFrame(recognition_runs)
+            stage_columns = [col for col in runs_df.columns
+                             if col.endswith('_time') and col != 'total_time' and runs_df[col].notna().any()]
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Recorded Runs", len(runs_df))
+            with col2:
+                st.metric("Avg. Total Time", f"{runs_df['total_time'].mean():.2f} sec")
+            with col3:
+                st.metric("Avg. Faces per Image", f"{runs_df['face_count'].mean():.1f}")
+            
+            st.bar_chart(runs_df[stage_columns].mean().rename(lambda col: col[:-len('_time')]))
+            st.caption("Average seconds per stage over the most recent runs")
+            
+            # Compare configurations, since model and detector choice dominate the timings
+            by_config = runs_df.groupby(['model_name', 'detector_backend'])[['total_time'] + stage_columns].mean()
+            st.dataframe(by_config.round(3), use_container_width=True)
+        
         # Get latest stats if available
         if 'recognition_stats' in st.session_state:
             stats = st.session_state.recognition_stats
@@ -2505,7 +2522,10 @@ elif page == "Recognition Stats":
                 if 'recognition_rate' in history_df.columns:
                     st.line_chart(history_df[['recognition_rate']])
                 if 'processing_time' in history_df.columns:
-                    st.line_chart(history_df[['processing_time']])
+                    time_columns = [col for col in ['processing_time', 'detection_time'] if col in history_df.columns]
+                    st.line_chart(history_df[time_columns])
+                if 'detection_scale' in history_df.columns:
+                    st.caption(f"Average detection downscale factor: {history_df['detection_scale'].mean():.2f}")
             
             # Display most recent recognition details
             if 'last_session' in stats:
@@ -2673,10 +2693,21 @@ elif page == "Class Reports":
             st.error("Error: End date must fall after start date.")
         else:
             # Get summary statistics
-            summary_data = get_class_attendance_summary(
-                date_from.strftime("%Y-%m-%d"), 
-                date_to.strftime("%Y-%m-%d")
-            )
+            cube = get_cube()
+            all_divisions = SHARDING_ENABLED and not user.get('division') \
+                and st.checkbox("All divisions of the department")
+            if all_divisions:
+                # Read every division database in parallel
+                summary_data = get_college_attendance_summary(
+                    date_from.strftime("%Y-%m-%d"),
+                    date_to.strftime("%Y-%m-%d"),
+                    department=user['department']
+                )
+            else:
+                summary_data = cube.class_summary(
+                    date_from.strftime("%Y-%m-%d"), 
+                    date_to.strftime("%Y-%m-%d")
+                )
             
             if summary_data:
                 # Convert to DataFrame
@@ -2772,7 +2803,11 @@ elif page == "Class Reports":
                 # Create tabs for each subject
                 try:
                     subjects = get_subjects()
-                    if subjects:
+                    if all_divisions:
+                        # The subject breakdown is read from the division selected in the sidebar only
+                        st.info("Subject-wise attendance is shown per division. Clear \"All divisions of the "
+                                "department\" to see it for the division selected in the sidebar.")
+                    elif subjects:
                         subject_tabs = st.tabs([subject[1] for subject in subjects])
                         
                         for i, subject in enumerate(subjects):
@@ -2782,61 +2817,40 @@ elif page == "Class Reports":
                                 # Note: get_subjects() returns (id, code, name), but we're using code as the display name
                                 # So subject[1] is the code, which is what we need for SUBJECT_WEEKLY_CLASSES lookup
                                 
-                                # Get all dates in range
-                                dates = []
-                                current_date = date_from
-                                while current_date <= date_to:
-                                    dates.append(current_date.strftime("%Y-%m-%d"))
-                                    current_date += datetime.timedelta(days=1)
-                                
-                                # Create a dictionary to store all attendance records
-                                attendance_by_date = {}
+                                subject_name = subject[2]
                                 
-                                # For each date, get attendance report
-                                for date_str in dates:
-                                    attendance_data = get_attendance_report(subject_id, date_str)
-                                    if attendance_data:
-                                        attendance_by_date[date_str] = {
-                                            data[1]: data[4] for data in attendance_data
-                                        }
+                                # Student x (date, period) status matrix for the whole range, sliced from the cube
+                                attendance_matrix = cube.subject_matrix(
+                                    subject_id,
+                                    date_from.strftime("%Y-%m-%d"),
+                                    date_to.strftime("%Y-%m-%d")
+                                )
                                 
-                                if attendance_by_date:
-                                    # Create a pivot table with students as rows and dates as columns
-                                    rows = []
-                                    for student in df_summary.to_dict('records'):
-                                        roll_no = student["Roll No"]
-                                        name = student["Name"]
-                                        
-                                        row = {"Roll No": roll_no, "Name": name}
-                                        
-                                        # Add attendance status for each date
-                                        present_count = 0
-                                        total_count = 0
-                                        
-                                        for date_str in dates:
-                                            if date_str in attendance_by_date and roll_no in attendance_by_date[date_str]:
-                                                status = attendance_by_date[date_str][roll_no]
-                                                row[date_str] = "✅" if status == "present" else "❌"
-                                                total_count += 1
-                                                if status == "present":
-                                                    present_count += 1
-                                            else:
-                                                row[date_str] = ""
-                                        
-                                        # Add summary statistics
-                                        if total_count > 0:
-                                            row["Present"] = present_count
-                                            row["Total"] = total_count
-                                            row["Attendance %"] = round(present_count / total_count * 100, 1)
-                                        else:
-                                            row["Present"] = 0
-                                            row["Total"] = 0
-                                            row["Attendance %"] = 0.0
-                                            
-                                        rows.append(row)
+                                if len(attendance_matrix.columns) > 0:
+                                    # One column per class held, labelled by date (plus period when a day had several)
+                                    periods_per_day = attendance_matrix.columns.get_level_values("date").value_counts()
+                                    dates = [
+                                        date_str if periods_per_day[date_str] == 1 else f"{date_str} ({period})"
+                                        for date_str, period in attendance_matrix.columns
+                                    ]
                                     
-                                    # Convert to DataFrame
-                                    subject_df = pd.DataFrame(rows)
+                                    statuses = attendance_matrix.to_numpy()
+                                    present_counts = (statuses == "present").sum(axis=1)
+                                    total_counts = ((statuses == "present") | (statuses == "absent")).sum(axis=1)
+                                    
+                                    subject_df = pd.DataFrame(
+                                        np.where(statuses == "present", "✅", np.where(statuses == "absent", "❌", "")),
+                                        columns=dates
+                                    )
+                                    subject_df.insert(0, "Roll No", attendance_matrix.index.get_level_values("roll_no"))
+                                    subject_df.insert(1, "Name", attendance_matrix.index.get_level_values("name"))
+                                    subject_df["Present"] = present_counts
+                                    subject_df["Total"] = total_counts
+                                    subject_df["Attendance %"] = np.where(
+                                        total_counts > 0,
+                                        np.round(present_counts / np.maximum(total_counts, 1) * 100, 1),
+                                        0.0
+                                    )
                                     
                                     # Calculate expected classes based on weekly schedule
                                     try:
@@ -2973,7 +2987,8 @@ elif page == "Class Reports":
                     st.error(f"Error displaying subject-wise attendance: {str(e)}")
                 
                 # Export overall class report to Excel
-                excel_path = os.path.join("excel_exports", f"Class_Report_{department}_{year}{division}_{date_from}_to_{date_to}.xlsx")
+                report_division = "AllDivisions" if all_divisions else division
+                excel_path = os.path.join("excel_exports", f"Class_Report_{department}_{year}{report_division}_{date_from}_to_{date_to}.xlsx")
                 try:
                     # Using context manager to ensure the file is properly closed
                     with pd.ExcelWriter(excel_path, mode='w') as writer:
@@ -3093,6 +3108,7 @@ elif page == "Student Reports":
                                         "Subject Name": row["subject_name"],
                                         "Present": row["present_count"],
                                         "Total Classes": row["total_classes"],
+                                        "Classes Held": row["held_classes"],
                                         "Expected Classes": row.get("expected_classes", "N/A"),
                                         "Attendance %": round(row["present_count"] / row["total_classes"] * 100, 1) if row["total_classes"] > 0 else 0
                                     }
@@ -3199,10 +3215,9 @@ elif page == "Student Reports":
                                 # Add day of week column
                                 df_report["Day"] = df_report["Date"].dt.day_name()
                                 
-                                # Group by date to create calendar view
-                                cal_data = df_report.groupby("Date")["Status"].agg(
-                                    lambda x: "✅" if all(s == "✅" for s in x) else 
-                                              "❌" if all(s == "❌" for s in x) else "⚠️"
+                                # Day-level status for the calendar view, from the attendance cube
+                                cal_data = get_cube().student_days(student_id).map(
+                                    {"present": "✅", "absent": "❌", "mixed": "⚠️"}
                                 )
                                 
                                 st.markdown("### Attendance Calendar")
@@ -3223,34 +3238,20 @@ elif page == "Student Reports":
                                     _, num_days = calendar.monthrange(month_start.year, month_start.month)
                                     
                                     # Create a 7x6 calendar layout (7 days per week, up to 6 weeks)
-                                    calendar_data = []
                                     day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-                                    
-                                    # Create week rows
                                     first_day_weekday = month_start.replace(day=1).weekday()  # 0 is Monday
-                                    day_count = 1
                                     
-                                    for week in range(6):  # Max 6 weeks in a month
-                                        week_data = []
-                                        for weekday in range(7):  # 7 days in a week
-                                            if (week == 0 and weekday < first_day_weekday) or day_count > num_days:
-                                                # Empty cell
-                                                week_data.append("")
-                                            else:
-                                                date_str = f"{month_start.year}-{month_start.month:02d}-{day_count:02d}"
-                                                date = pd.Timestamp(date_str)
-                                                
-                                                if date in month_data.index:
-                                                    week_data.append(f"{day_count} {month_data[date]}")
-                                                else:
-                                                    week_data.append(f"{day_count}")
-                                                
-                                                day_count += 1
-                                        
-                                        calendar_data.append(week_data)
+                                    # Day labels with the day's status, placed into the grid in one step
+                                    month_days = pd.date_range(month_start, periods=num_days, freq="D")
+                                    marks = month_data.reindex(month_days).fillna("").to_numpy(dtype=object)
+                                    labels = np.char.add(np.arange(1, num_days + 1).astype(str),
+                                                         np.where(marks != "", " " + marks, "").astype(str))
+                                    cells = np.full(42, "", dtype=object)
+                                    cells[first_day_weekday:first_day_weekday + num_days] = labels
+                                    calendar_data = cells.reshape(6, 7)
                                     
                                     # Only include weeks that have days
-                                    calendar_data = [week for week in calendar_data if any(cell != "" for cell in week)]
+                                    calendar_data = calendar_data[(calendar_data != "").any(axis=1)]
                                     
                                     # Create DataFrame for display
                                     calendar_df = pd.DataFrame(calendar_data, columns=day_names)
@@ -3437,24 +3438,22 @@ elif page == "Edit Attendance":
                     
                     if submit:
                         try:
-                            update_count = 0
-                            
-                            for student_id, is_present in attendance_status.items():
-                                status = "present" if is_present else "absent"
-                                
-                                # Use mark_attendance function which handles email sending
-                                success = mark_attendance(
-                                    student_id, 
-                                    subject_id, 
-                                    report_date.strftime("%Y-%m-%d"), 
-                                    selected_period,
-                                    status=status
-                                )
-                                
-                                if success:
-                                    update_count += 1
+                            # Save every student's status in one transaction; emails go out in the background
+                            outcomes = mark_attendance_bulk(
+                                subject_id,
+                                report_date.strftime("%Y-%m-%d"),
+                                selected_period,
+                                {student_id: "present" if is_present else "absent"
+                                 for student_id, is_present in attendance_status.items()},
+                                taken_by=user.get('username'),
+                                capture_source="edit"
+                            )
+                            update_count = sum(1 for outcome in outcomes.values() if outcome == "updated")
+                            failed_count = sum(1 for outcome in outcomes.values() if outcome == "failed")
                             
-                            st.success(f"Successfully updated attendance for {update_count} students! Emails have been sent to students.")
+                            st.success(f"Successfully updated attendance for {update_count} students! Students whose status changed are being notified by email.")
+                            if failed_count:
+                                st.warning(f"⚠️ Attendance could not be saved for {failed_count} students. Please check the logs.")
                             
                             # Add button to refresh the page
                             st.button("Refresh", key="refresh_attendance")
@@ -3496,12 +3495,15 @@ elif page == "Edit Attendance":
                         
                         if submit:
                             try:
-                                success_count = 0
-                                
-                                for student_id, is_present in attendance_status.items():
-                                    if is_present:
-                                        mark_attendance(student_id, subject_id, report_date.strftime("%Y-%m-%d"), selected_period)
-                                        success_count += 1
+                                outcomes = mark_attendance_bulk(
+                                    subject_id,
+                                    report_date.strftime("%Y-%m-%d"),
+                                    selected_period,
+                                    {student_id: "present" for student_id, is_present in attendance_status.items() if is_present},
+                                    taken_by=user.get('username'),
+                                    capture_source="edit"
+                                )
+                                success_count = sum(1 for outcome in outcomes.values() if outcome != "failed")
                                 
                                 st.success(f"Successfully created attendance record with {success_count} present students!")
                                 
@@ -3580,12 +3582,35 @@ elif page == "Email Settings":
                 st.markdown("#### Email Notification Settings")
                 st.info("""
                 **How Email Notifications Work:**
-                - When attendance is marked (present or absent), an email is automatically sent to the student
+                - When attendance is marked (present or absent), an email is queued for the student in the same save
+                - A background dispatcher sends queued emails and retries failures with increasing delays
                 - Emails include: Subject name, Date, Period, Roll Number, and Status
                 - Students receive a nicely formatted HTML email with their attendance status
                 - Email sending failures won't prevent attendance from being saved
                 """)
                 
+                st.markdown("---")
+                st.markdown("#### 📬 Email Outbox")
+                
+                try:
+                    from utils.email_outbox import get_outbox_stats, retry_failed_emails
+                    
+                    outbox_stats = get_outbox_stats()
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Queued", outbox_stats['pending'] + outbox_stats['sending'])
+                    with col2:
+                        st.metric("Sent", outbox_stats['sent'])
+                    with col3:
+                        st.metric("Failed", outbox_stats['failed'])
+                    
+                    if outbox_stats['failed'] and st.button("🔁 Retry Failed Emails", use_container_width=True):
+                        retried = retry_failed_emails()
+                        st.success(f"✅ {retried} emails queued for another attempt")
+                except Exception as e:
+                    st.error(f"Error reading email outbox: {str(e)}")
+                    logger.error(f"Error reading email outbox: {str(e)}")
+                
                 st.markdown("---")
                 st.markdown("#### 📋 Recent Email Logs")
                 
@@ -3675,6 +3700,80 @@ elif page == "Email Settings":
             logger.error(f"Error in Email Settings page: {str(e)}\n{traceback.format_exc()}")
             st.error(f"Error: {str(e)}")
 
+elif page == "DB Performance":
+    # Check permission - Only HOD can access
+    if not can_access_feature(user, 'manage_users'):
+        st.error("❌ Access Denied: You do not have permission to view database performance.")
+        st.info("Only HOD can view database performance.")
+    else:
+        st.title("🗄️ DB Performance")
+        st.markdown('<div class="dashboard-card"><p>Timing of every SQL statement run by this app process since it started (or since the last reset).</p></div>', unsafe_allow_html=True)
+        
+        try:
+            from utils.query_stats import (
+                get_query_stats,
+                get_caller_stats,
+                get_slow_queries,
+                reset_query_stats,
+                HISTOGRAM_BUCKETS_MS
+            )
+            from config import QUERY_SLOW_MS
+            
+            query_stats = get_query_stats()
+            slow_queries = get_slow_queries()
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Statements", sum(s['count'] for s in query_stats))
+            with col2:
+                st.metric("Query Shapes", len(query_stats))
+            with col3:
+                st.metric("Total DB Time", f"{sum(s['total_ms'] for s in query_stats) / 1000:.2f} sec")
+            with col4:
+                st.metric(f"Slow (≥ {QUERY_SLOW_MS:g} ms)", len(slow_queries))
+            
+            if st.button("🔄 Reset Statistics"):
+                reset_query_stats()
+                st.experimental_rerun()
+            
+            if not query_stats:
+                st.info("No statements recorded yet.")
+            else:
+                st.subheader("Time by Function")
+                st.dataframe(pd.DataFrame(get_caller_stats()).rename(columns={
+                    'caller': 'Function', 'statements': 'Statements', 'total_ms': 'Total (ms)'
+                }), use_container_width=True, hide_index=True)
+                
+                st.subheader("Query Shapes")
+                bucket_labels = [f"<{bound:g}ms" for bound in HISTOGRAM_BUCKETS_MS] + [f"≥{HISTOGRAM_BUCKETS_MS[-1]:g}ms"]
+                shape_rows = []
+                for s in query_stats:
+                    row = {
+                        'Query': s['shape'][:200],
+                        'Calls': s['count'],
+                        'Total (ms)': s['total_ms'],
+                        'Avg (ms)': s['avg_ms'],
+                        'Max (ms)': s['max_ms'],
+                        'Rows': s['rows'],
+                        'Called From': ", ".join(s['callers'])
+                    }
+                    row.update(dict(zip(bucket_labels, s['histogram'])))
+                    shape_rows.append(row)
+                st.dataframe(pd.DataFrame(shape_rows), use_container_width=True, hide_index=True)
+            
+            st.subheader("Slow Queries")
+            if not slow_queries:
+                st.success(f"No statements took {QUERY_SLOW_MS:g} ms or longer.")
+            for entry in slow_queries:
+                with st.expander(f"{entry['time']} · {entry['ms']} ms · {entry['caller']}"):
+                    st.code(entry['shape'], language="sql")
+                    if entry['plan']:
+                        st.markdown("**Query plan:**")
+                        st.code("\n".join(entry['plan']))
+        except Exception as e:
+            logger.error(f"Error in DB Performance page: {str(e)}\n{traceback.format_exc()}")
+            st.error(f"Error: {str(e)}")
+
 # Footer
 st.sidebar.divider()
 st.sidebar.info(
@@ -31,6 +31,35 @@ if os.getenv("DATABASE_PATH"):
 else:
     DB_PATH = DB_DIR / "attendance.db"
 
+# SQLite connection tuning (connections are pooled per thread by utils.db_utils)
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "10.0"))  # seconds to wait for a lock
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")  # WAL lets readers and a writer work concurrently
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))  # page cache per connection
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", "268435456"))  # bytes of the file to memory-map
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))  # idle connections kept per thread
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))  # prepared statements per connection
+DB_READ_CACHE_MAX_ENTRIES = int(os.getenv("DB_READ_CACHE_MAX_ENTRIES", "2048"))  # cached roster/subject/report reads per process
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS_ENABLED", "true").lower() == "true"  # time every SQL statement
+QUERY_SLOW_MS = float(os.getenv("QUERY_SLOW_MS", "100"))  # log statements slower than this with their query plan
+QUERY_SLOW_LOG_SIZE = int(os.getenv("QUERY_SLOW_LOG_SIZE", "100"))  # slow statements kept for the admin page
+
+# Online backups (python -m utils.backup_utils); snapshots are copied a few pages at a time so writers keep going
+BACKUP_DIR = Path(os.getenv("BACKUP_DIR", str(DB_DIR / "backups")))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))  # pages copied per step
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.05"))  # seconds between steps
+BACKUP_RETENTION_COUNT = int(os.getenv("BACKUP_RETENTION_COUNT", "14"))  # newest snapshots kept
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "0"))  # in-app scheduled backups; 0 disables
+BACKUP_VERIFY = os.getenv("BACKUP_VERIFY", "quick")  # "quick" (quick_check) or "integrity" (integrity_check)
+BULK_LOAD_CACHE_SIZE_KB = int(os.getenv("BULK_LOAD_CACHE_SIZE_KB", "262144"))  # page cache while bulk loading (python -m utils.bulk_loader)
+BENCHMARK_DIR = Path(os.getenv("BENCHMARK_DIR", str(BASE_DIR / "benchmarks")))  # results of python -m utils.db_benchmark
+ANALYTICS_EXPORT_DIR = Path(os.getenv("ANALYTICS_EXPORT_DIR", str(DB_DIR / "analytics")))  # columnar attendance snapshot
+ANALYTICS_EXPORT_FORMAT = os.getenv("ANALYTICS_EXPORT_FORMAT", "auto")  # "parquet" (needs pyarrow), "npz" or "auto"
+# Per-division databases: each department/division writes its own SQLite file, so their writers never share a lock.
+# Users and recognition jobs stay in DB_PATH (the directory database).
+SHARDING_ENABLED = os.getenv("SHARDING_ENABLED", "false").lower() == "true"
+SHARD_DIR = Path(os.getenv("SHARD_DIR", str(DB_DIR / "shards")))
+
 # Application settings
 APP_TITLE = "ENTC B.Tech b Facial Attendance System"
 APP_ICON = "👨‍🎓"
@@ -86,6 +115,24 @@ ESP32_DEFAULT_PASSWORD = os.getenv("ESP32_CAM_PASSWORD", "admin")  # Should be c
 DEEPFACE_MODEL = os.getenv("DEEPFACE_MODEL", "Facenet512")
 DEEPFACE_THRESHOLD = float(os.getenv("DEEPFACE_THRESHOLD", "0.6"))
 DEEPFACE_DETECTOR_BACKEND = os.getenv("DEEPFACE_DETECTOR", "opencv")
+# Long-edge size (px) of the copy faces are detected on; crops still come from the full image. 0 disables.
+DETECTION_MAX_EDGE = int(os.getenv("DETECTION_MAX_EDGE", "1280"))
+
+# Shared inference server (python -m utils.inference_server); leave URL empty to run models in-process
+INFERENCE_SERVER_URL = os.getenv("INFERENCE_SERVER_URL", "")
+INFERENCE_SERVER_HOST = os.getenv("INFERENCE_SERVER_HOST", "127.0.0.1")
+INFERENCE_SERVER_PORT = int(os.getenv("INFERENCE_SERVER_PORT", "8765"))
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "32"))  # faces per model invocation
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "20"))  # max time a request waits for a batch to fill
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "512"))  # queued faces before the server returns 503
+INFERENCE_TIMEOUT = int(os.getenv("INFERENCE_TIMEOUT", "30"))  # seconds the server waits for a batch (clients allow a reply margin on top)
+
+# Background recognition job settings
+RECOGNITION_WORKERS = int(os.getenv("RECOGNITION_WORKERS", "2"))
+RECOGNITION_JOB_POLL_INTERVAL = float(os.getenv("RECOGNITION_JOB_POLL_INTERVAL", "1.0"))  # seconds
+RECOGNITION_JOB_STALE_AFTER = int(os.getenv("RECOGNITION_JOB_STALE_AFTER", "300"))  # seconds without heartbeat
+RECOGNITION_JOB_MAX_ATTEMPTS = int(os.getenv("RECOGNITION_JOB_MAX_ATTEMPTS", "3"))
+RECOGNITION_JOB_RETENTION_HOURS = int(os.getenv("RECOGNITION_JOB_RETENTION_HOURS", "24"))
 
 # Request settings
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "10"))
@@ -105,6 +152,15 @@ EMAIL_FROM = os.getenv("EMAIL_FROM", "attendance@shuence.com")
 EMAIL_SEND_ON_PRESENT = os.getenv("EMAIL_SEND_ON_PRESENT", "true").lower() == "true"
 EMAIL_SEND_ON_ABSENT = os.getenv("EMAIL_SEND_ON_ABSENT", "true").lower() == "true"
 
+# Email outbox settings (attendance saves queue emails, a background dispatcher sends them)
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.getenv("EMAIL_OUTBOX_POLL_INTERVAL", "5.0"))  # seconds
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "20"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
+EMAIL_OUTBOX_BACKOFF_BASE = int(os.getenv("EMAIL_OUTBOX_BACKOFF_BASE", "30"))  # seconds, doubled per attempt
+EMAIL_OUTBOX_BACKOFF_MAX = int(os.getenv("EMAIL_OUTBOX_BACKOFF_MAX", "3600"))  # seconds
+EMAIL_OUTBOX_STALE_AFTER = int(os.getenv("EMAIL_OUTBOX_STALE_AFTER", "300"))  # seconds in 'sending'
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", "30"))
+
 # Google Sheets settings (can be overridden via environment variables)
 GOOGLE_SHEETS_ENABLED = os.getenv("GOOGLE_SHEETS_ENABLED", "true").lower() == "true"
 GOOGLE_SHEETS_CREDENTIALS_FILE = os.getenv("GOOGLE_SHEETS_CREDENTIALS_FILE", str(BASE_DIR / "google_credentials.json"))
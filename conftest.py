@@ -0,0 +1,65 @@
+"""
+Shared fixtures: every test database lives in the test's tmp_path.
+"""
+import pytest
+
+from utils import db_utils
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Point db_utils at a database file in tmp_path (not created yet)"""
+    path = str(tmp_path / "attendance.db")
+    monkeypatch.setattr(db_utils, "DB_PATH", path)
+    yield path
+    db_utils.close_idle_connections()
+
+
+@pytest.fixture
+def fresh_db(db_path):
+    """A migrated database with the default subjects and no students"""
+    db_utils.init_db()
+    return db_path
+
+
+@pytest.fixture
+def subject_ids(fresh_db):
+    """Ids of the default subjects, in id order"""
+    conn = db_utils.get_connection()
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM subjects ORDER BY id")]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def add_students(fresh_db):
+    """
+    Insert students R01, R02, ... named "Student 1", ... and return their ids
+
+    Usage:
+        student_ids = add_students(range(1, 4), division="A")
+        student_ids = add_students([5, 3, 1], division=lambda i: "A" if i < 3 else "B")
+
+    Extra columns are constants or functions of the student number. Students
+    are enrolled in every subject by the auto-enroll policy.
+    """
+    def add(numbers, **columns):
+        numbers = list(numbers)
+        names = ["roll_no", "name", "image_path"] + list(columns)
+        rows = [
+            (f"R{i:02d}", f"Student {i}", "") + tuple(value(i) if callable(value) else value for value in columns.values())
+            for i in numbers
+        ]
+        conn = db_utils.get_connection()
+        try:
+            cursor = conn.cursor()
+            ids = []
+            for row in rows:
+                cursor.execute(f"INSERT INTO students ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})", row)
+                ids.append(cursor.lastrowid)
+            conn.commit()
+        finally:
+            conn.close()
+        return ids
+    return add
@@ -0,0 +1,109 @@
+"""
+Checks that the attendance cube gives the same report tables as the SQL
+readers and follows attendance writes without reloading.
+"""
+import datetime
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+from utils import db_utils, analytics_cube  # noqa: E402
+
+
+@pytest.fixture
+def db(add_students, subject_ids):
+    student_ids = add_students([5, 3, 1, 4, 2], division="A")
+    subject_ids = subject_ids[:3]
+    # Students are enrolled in every subject; drop some from the third
+    conn = db_utils.get_connection()
+    conn.execute('''
+        DELETE FROM student_subjects
+        WHERE subject_id = (SELECT id FROM subjects ORDER BY id LIMIT 1 OFFSET 2)
+          AND student_id IN (SELECT id FROM students WHERE roll_no >= 'R03')
+    ''')
+    conn.commit()
+    conn.close()
+
+    start = datetime.date(2025, 3, 3)
+    for day in range(6):
+        date = (start + datetime.timedelta(days=day)).isoformat()
+        for n, subject_id in enumerate(subject_ids):
+            statuses = {sid: "absent" if (sid + day + n) % 3 == 0 else "present" for sid in student_ids}
+            db_utils.mark_attendance_bulk(subject_id, date, "P1" if day % 2 else "P2", statuses, notify=False)
+    return student_ids, subject_ids
+
+
+def test_reports_match_sql(db):
+    _, subject_ids = db
+    cube = analytics_cube.get_cube()
+    for date_from, date_to in [("2025-03-01", "2025-03-31"), ("2025-03-04", "2025-03-06")]:
+        assert cube.class_summary(date_from, date_to) == db_utils.get_class_attendance_summary(date_from, date_to)
+        for subject_id in subject_ids:
+            pd.testing.assert_frame_equal(cube.subject_matrix(subject_id, date_from, date_to),
+                                          db_utils.get_subject_attendance_matrix(subject_id, date_from, date_to))
+
+
+def test_subject_summary_and_student_days(db):
+    student_ids, subject_ids = db
+    cube = analytics_cube.get_cube()
+    present, total = cube.subject_summary("2025-03-01", "2025-03-31")
+    summary = db_utils.get_student_attendance_summary(student_ids[0], "2025-03-01", "2025-03-31")
+    row = np.searchsorted(cube.student_ids, student_ids[0])
+    for subject in summary:
+        column = np.searchsorted(cube.subject_ids, subject['subject_id'])
+        assert (present[row, column], total[row, column]) == (subject['present_count'], subject['total_classes'])
+
+    days = cube.student_days(student_ids[0])
+    report = pd.DataFrame(db_utils.get_student_attendance_report(student_ids[0]))
+    for date, statuses in report.groupby("date")["status"]:
+        expected = "present" if (statuses == "present").all() else "absent" if (statuses == "absent").all() else "mixed"
+        assert days[pd.Timestamp(date)] == expected
+
+
+def test_writes_are_applied_in_place(db):
+    student_ids, subject_ids = db
+    cube = analytics_cube.get_cube()
+    classes = cube.class_count
+
+    db_utils.mark_attendance_bulk(subject_ids[0], "2025-03-10", "P1", {sid: "present" for sid in student_ids},
+                                  notify=False)
+    db_utils.mark_attendance(student_ids[1], subject_ids[0], "2025-03-03", "P2", "absent")
+    assert analytics_cube.get_cube() is cube
+    assert cube.class_count == classes + 1
+    assert cube.class_summary("2025-03-01", "2025-03-31") == \
+        db_utils.get_class_attendance_summary("2025-03-01", "2025-03-31")
+
+
+def test_readers_wait_for_writes_in_progress(db):
+    student_ids, subject_ids = db
+    cube = analytics_cube.get_cube()
+    results = {}
+    readers = [
+        threading.Thread(target=lambda: results.update(summary=cube.class_summary("2025-03-01", "2025-03-31"))),
+        threading.Thread(target=lambda: results.update(subjects=cube.subject_summary("2025-03-01", "2025-03-31"))),
+        threading.Thread(target=lambda: results.update(matrix=cube.subject_matrix(subject_ids[0], "2025-03-01",
+                                                                                  "2025-03-31"))),
+        threading.Thread(target=lambda: results.update(days=cube.student_days(student_ids[0]))),
+    ]
+    # Stand in for apply() growing the arrays: every reader blocks until it is done
+    with cube._lock:
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join(timeout=0.2)
+        assert results == {}
+    for reader in readers:
+        reader.join()
+    assert sorted(results) == ["days", "matrix", "subjects", "summary"]
+
+
+def test_reloads_after_other_changes(db):
+    student_ids, _ = db
+    cube = analytics_cube.get_cube()
+    assert db_utils.delete_student(student_ids[0])
+    reloaded = analytics_cube.get_cube()
+    assert reloaded is not cube
+    assert student_ids[0] not in reloaded.student_ids
@@ -0,0 +1,91 @@
+"""
+Checks that archiving a term moves its attendance out of the live tables
+while reports over its dates still see it, and that restoring brings it back.
+"""
+import pytest
+
+from utils import db_utils, archive_utils
+
+
+@pytest.fixture
+def db(add_students, subject_ids):
+    student_ids = add_students(range(1, 4))
+    subject_id = subject_ids[0]
+
+    # Old term on 2025-03-03 .. 2025-03-06 (Mon-Thu), current term from 2025-03-07 (Fri, same week)
+    for offset, date in enumerate(["2025-03-03", "2025-03-04", "2025-03-06", "2025-03-07", "2025-03-10"]):
+        statuses = {sid: "present" if (sid + offset) % 2 else "absent" for sid in student_ids}
+        assert db_utils.mark_attendance_bulk(subject_id, date, "P1", statuses, notify=False)
+    return student_ids, subject_id
+
+
+def live_count(table):
+    conn = db_utils.get_connection()
+    count = conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0]
+    conn.close()
+    return count
+
+
+def snapshot(student_ids, subject_id):
+    return {
+        'class': db_utils.get_class_attendance_summary("2025-03-01", "2025-03-31"),
+        'old_term': db_utils.get_class_attendance_summary("2025-03-03", "2025-03-04"),
+        'student': db_utils.get_student_attendance_summary(student_ids[0], "2025-03-01", "2025-03-31"),
+        'student_all': db_utils.get_student_attendance_summary(student_ids[0]),
+        'history': db_utils.get_student_attendance_report(student_ids[0]),
+        'sessions': [s['present_count'] for s in db_utils.get_class_sessions(subject_id, "2025-03-01", "2025-03-31")],
+        'held': db_utils.count_held_classes("2025-03-01", "2025-03-31"),
+        'report': db_utils.get_attendance_report(subject_id, "2025-03-04"),
+    }
+
+
+def test_archived_term_still_reported(db):
+    student_ids, subject_id = db
+    before = snapshot(student_ids, subject_id)
+
+    entry = archive_utils.archive_term("2025-spring", "2025-03-01", "2025-03-06")
+    assert entry['attendance_rows'] == 9 and entry['session_rows'] == 3
+    assert live_count('attendance') == 6
+    assert live_count('class_sessions') == 2
+    assert [t['term'] for t in archive_utils.list_terms()] == ["2025-spring"]
+
+    assert snapshot(student_ids, subject_id) == before
+
+
+def test_current_term_queries_skip_archive(db):
+    _, subject_id = db
+    archive_utils.archive_term("2025-spring", "2025-03-01", "2025-03-06")
+    conn = db_utils.get_connection()
+    try:
+        assert db_utils._partition(conn, 'attendance', "2025-03-07", "2025-03-31") == 'attendance'
+        assert db_utils._partition(conn, 'attendance', "2025-03-03", "2025-03-04") == 'archive.attendance_2025_spring'
+        assert 'UNION ALL' in db_utils._partition(conn, 'attendance', "2025-03-01", "2025-03-31")
+    finally:
+        conn.close()
+
+
+def test_archived_dates_are_read_only(db):
+    student_ids, subject_id = db
+    archive_utils.archive_term("2025-spring", "2025-03-01", "2025-03-06")
+    assert not db_utils.mark_attendance(student_ids[0], subject_id, "2025-03-04", "P2")
+    assert db_utils.mark_attendance(student_ids[0], subject_id, "2025-03-11", "P2")
+    # Overlapping terms are refused
+    assert archive_utils.archive_term("2025-overlap", "2025-03-05", "2025-03-07") is None
+
+
+def test_restore_term(db):
+    student_ids, subject_id = db
+    before = snapshot(student_ids, subject_id)
+    archive_utils.archive_term("2025-spring", "2025-03-01", "2025-03-06")
+
+    assert archive_utils.restore_term("2025-spring")
+    assert live_count('attendance') == 15
+    assert archive_utils.list_terms() == []
+    assert snapshot(student_ids, subject_id) == before
+
+    conn = db_utils.get_connection()
+    daily = conn.execute("SELECT SUM(total_count) FROM attendance_daily").fetchone()[0]
+    weekly = conn.execute("SELECT SUM(total_count) FROM attendance_weekly").fetchone()[0]
+    conn.close()
+    assert daily == weekly == 15
+    assert db_utils.mark_attendance(student_ids[0], subject_id, "2025-03-04", "P2")
@@ -0,0 +1,47 @@
+"""
+Checks the per-student outcomes of mark_attendance_bulk and that a period is
+written in one transaction.
+"""
+from utils import db_utils
+
+
+def _statuses(subject_id, date="2025-03-03"):
+    return {row['id']: row['status'] for row in db_utils.get_attendance_report(subject_id, date)}
+
+
+def test_outcomes(add_students, subject_ids):
+    first, second, third = add_students(range(1, 4))
+    subject_id = subject_ids[0]
+
+    outcomes = db_utils.mark_attendance_bulk(subject_id, "2025-03-03", "P1",
+                                             {first: "present", second: "absent"}, notify=False)
+    assert outcomes == {first: "inserted", second: "inserted"}
+
+    outcomes = db_utils.mark_attendance_bulk(subject_id, "2025-03-03", "P1",
+                                             {first: "present", second: "present", third: "absent", 999: "present"},
+                                             notify=False)
+    assert outcomes == {first: "unchanged", second: "updated", third: "inserted", 999: "failed"}
+    assert _statuses(subject_id) == {first: "present", second: "present", third: "absent"}
+    assert db_utils.mark_attendance_bulk(subject_id, "2025-03-03", "P1", {}, notify=False) == {}
+
+
+def test_failed_transaction_writes_nothing(add_students, subject_ids):
+    first, second = add_students(range(1, 3))
+    subject_id = subject_ids[0]
+
+    # A date in an archived term is refused before anything is written
+    conn = db_utils.get_connection()
+    conn.execute('''
+        INSERT INTO attendance_terms (term, date_from, date_to, table_suffix, archived_at)
+        VALUES ('old', '2025-01-01', '2025-01-31', 'old', '2025-02-01')
+    ''')
+    conn.commit()
+    conn.close()
+    db_utils.invalidate_reference_cache('attendance')
+
+    outcomes = db_utils.mark_attendance_bulk(subject_id, "2025-01-15", "P1", {first: "present", second: "absent"},
+                                             notify=False)
+    assert outcomes == {first: "failed", second: "failed"}
+    conn = db_utils.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0] == 0
+    conn.close()
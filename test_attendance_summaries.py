@@ -0,0 +1,86 @@
+"""
+Checks that the trigger-maintained attendance summary tables agree with the
+raw attendance table and that range summaries match counting raw rows.
+"""
+import datetime
+
+import pytest
+
+from utils import db_utils
+
+
+@pytest.fixture
+def db(add_students, subject_ids):
+    return add_students(range(1, 5)), subject_ids[:2]
+
+
+def raw_counts(date_from, date_to):
+    conn = db_utils.get_connection()
+    rows = conn.execute('''
+        SELECT student_id, subject_id, COUNT(CASE WHEN status = 'present' THEN 1 END), COUNT(*)
+        FROM attendance WHERE date BETWEEN ? AND ?
+        GROUP BY student_id, subject_id
+    ''', (date_from, date_to)).fetchall()
+    conn.close()
+    return {(row[0], row[1]): (row[2], row[3]) for row in rows}
+
+
+def summary_counts(date_from, date_to):
+    sql, params = db_utils._summary_counts_sql(date_from, date_to)
+    conn = db_utils.get_connection()
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return {(row[0], row[1]): (row[2], row[3]) for row in rows if row[3]}
+
+
+def fill_attendance(student_ids, subject_ids, start, days):
+    for offset in range(days):
+        date = (start + datetime.timedelta(days=offset)).isoformat()
+        for subject_id in subject_ids:
+            statuses = {sid: "present" if (sid + offset) % 3 else "absent" for sid in student_ids}
+            db_utils.mark_attendance_bulk(subject_id, date, "P1", statuses, notify=False)
+
+
+@pytest.mark.parametrize("date_from,date_to", [
+    ("2025-01-01", "2025-03-31"),   # partial weeks at both ends
+    ("2025-01-06", "2025-01-19"),   # whole weeks only
+    ("2025-01-08", "2025-01-10"),   # inside a single week
+    ("2025-02-03", "2025-02-03"),   # a single day
+])
+def test_range_summaries_match_raw_counts(db, date_from, date_to):
+    student_ids, subject_ids = db
+    fill_attendance(student_ids, subject_ids, datetime.date(2024, 12, 30), 100)
+    assert summary_counts(date_from, date_to) == raw_counts(date_from, date_to)
+
+
+def test_updates_and_deletes_keep_summaries_consistent(db):
+    student_ids, subject_ids = db
+    fill_attendance(student_ids, subject_ids, datetime.date(2025, 1, 6), 14)
+
+    # Flip statuses, then remove a student (cascades to attendance)
+    db_utils.mark_attendance_bulk(subject_ids[0], "2025-01-07", "P1",
+                                  {sid: "present" for sid in student_ids}, notify=False)
+    db_utils.mark_attendance(student_ids[1], subject_ids[1], "2025-01-08", "P1", "absent")
+    db_utils.delete_student(student_ids[0])
+
+    assert summary_counts("2025-01-01", "2025-01-31") == raw_counts("2025-01-01", "2025-01-31")
+
+    rebuilt_before = summary_counts("2025-01-01", "2025-01-31")
+    assert db_utils.rebuild_attendance_summaries()
+    assert summary_counts("2025-01-01", "2025-01-31") == rebuilt_before
+
+
+def test_summary_functions_use_summary_tables(db):
+    student_ids, subject_ids = db
+    fill_attendance(student_ids, subject_ids, datetime.date(2025, 1, 6), 10)
+    raw = raw_counts("2025-01-01", "2025-01-31")
+
+    summary = db_utils.get_student_attendance_summary(student_ids[0], "2025-01-01", "2025-01-31")
+    by_subject = {row["subject_id"]: (row["present_count"], row["total_classes"]) for row in summary}
+    for subject_id in subject_ids:
+        assert by_subject[subject_id] == raw[(student_ids[0], subject_id)]
+
+    for row in db_utils.get_class_attendance_summary("2025-01-01", "2025-01-31"):
+        expected = [counts for (sid, _), counts in raw.items() if sid == row["id"]]
+        assert row["present_count"] == sum(present for present, _ in expected)
+        assert row["total_classes"] == sum(total for _, total in expected)
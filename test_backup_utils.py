@@ -0,0 +1,114 @@
+"""
+Checks that online backups produce verified snapshots while the database is
+in use, that retention keeps only the newest snapshots, and that restoring a
+snapshot brings back its data and refreshes cached reads.
+"""
+import os
+import sqlite3
+
+import pytest
+
+from utils import db_utils, backup_utils
+
+
+@pytest.fixture
+def db(fresh_db, tmp_path):
+    db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    return str(tmp_path / "backups")
+
+
+def test_backup_is_verified_and_complete(db):
+    # Copy one page per step so the backup spans many steps
+    snapshot, = backup_utils.create_backup(db, pages_per_step=1, step_sleep=0)
+    assert os.path.exists(snapshot['path']) and snapshot['shard'] is None
+    assert not [name for name in os.listdir(db) if name.endswith(".partial")]
+    assert backup_utils.verify_snapshot(snapshot['path'], full=True)
+
+    conn = sqlite3.connect(snapshot['path'])
+    assert conn.execute("SELECT roll_no FROM students").fetchall() == [("R01",)]
+    conn.close()
+
+
+def test_writers_are_not_blocked_between_steps(db, monkeypatch):
+    subject_id = db_utils.get_subjects()[0]["id"]
+    student_id = db_utils.get_all_students()[0]["id"]
+    saved = []
+
+    def copy_with_write(source, target, pages, step_sleep):
+        def progress(status, remaining, total):
+            if remaining and not saved:
+                saved.append(db_utils.mark_attendance(student_id, subject_id, "2025-01-06", "P1", "present"))
+        source.backup(target, pages=1, progress=progress)
+
+    monkeypatch.setattr(backup_utils, "_copy_database", copy_with_write)
+    assert backup_utils.create_backup(db)
+    assert saved == [True]
+
+
+def test_retention_keeps_newest_snapshots(db):
+    os.makedirs(db)
+    for day in range(1, 6):
+        open(os.path.join(db, f"attendance-202501{day:02d}-080000.db"), "wb").close()
+    open(os.path.join(db, "attendance-ENTC_A-20250101-080000.db"), "wb").close()
+    open(os.path.join(db, "attendance-notes.db"), "wb").close()
+
+    # Each database keeps its own newest snapshots
+    assert backup_utils.prune_backups(db, keep=2) == 3
+    assert [s['name'] for s in backup_utils.list_backups(db)] == [
+        "attendance-20250105-080000.db", "attendance-20250104-080000.db", "attendance-ENTC_A-20250101-080000.db"
+    ]
+    assert [s['name'] for s in backup_utils.list_backups(db, shard="ENTC_A")] == ["attendance-ENTC_A-20250101-080000.db"]
+
+
+def test_corrupt_snapshot_is_not_restored(db, tmp_path):
+    bad = tmp_path / "attendance-20250101-080000.db"
+    bad.write_bytes(b"not a database" * 100)
+    assert not backup_utils.verify_snapshot(str(bad))
+    assert not backup_utils.restore_backup(str(bad))
+    assert len(db_utils.get_all_students()) == 1
+
+
+def test_restore_brings_back_snapshot_data(db):
+    snapshot, = backup_utils.create_backup(db, step_sleep=0)
+    student_id = db_utils.get_all_students()[0]["id"]
+    db_utils.update_student(student_id, name="Renamed")
+    db_utils.register_student("R02", "Student 2", "ENTC", "B.Tech", "B", "", [])
+    assert len(db_utils.get_all_students()) == 2
+
+    assert backup_utils.restore_backup(snapshot['path'])
+    students = db_utils.get_all_students()
+    assert [(s["roll_no"], s["name"]) for s in students] == [("R01", "Student 1")]
+
+
+def test_every_shard_is_backed_up_and_restored_in_place(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "SHARDING_ENABLED", True)
+    monkeypatch.setattr(db_utils, "SHARD_DIR", str(tmp_path / "shards"))
+    try:
+        for division in ("A", "B"):
+            db_utils.use_division("ENTC", division)
+            db_utils.register_student(f"{division}1", f"Student {division}1", "ENTC", "B.Tech", division, "", [])
+        db_utils.use_division(None, None)
+
+        snapshots = backup_utils.create_backup(db, step_sleep=0)
+        assert [s['shard'] for s in snapshots] == [None, "ENTC_A", "ENTC_B"]
+        assert len({s['name'][-len("YYYYmmdd-HHMMSS.db"):] for s in snapshots}) == 1
+        assert [s['db_path'] for s in backup_utils.list_backups(db)] == \
+            [db_utils.DB_PATH, db_utils.shard_db_path("ENTC", "A"), db_utils.shard_db_path("ENTC", "B")]
+
+        db_utils.use_division("ENTC", "B")
+        db_utils.register_student("B2", "Student B2", "ENTC", "B.Tech", "B", "", [])
+        db_utils.use_division(None, None)
+
+        # Restored into division B's shard, whatever the caller's route
+        assert backup_utils.restore_backup(snapshots[2]['path'])
+        db_utils.use_division("ENTC", "B")
+        assert [s["roll_no"] for s in db_utils.get_all_students()] == ["B1"]
+        db_utils.use_division("ENTC", "A")
+        assert [s["roll_no"] for s in db_utils.get_all_students()] == ["A1"]
+        db_utils.use_division(None, None)
+        assert [s["roll_no"] for s in db_utils.get_all_students()] == ["R01"]
+    finally:
+        for path in db_utils.database_paths():
+            with db_utils.routed_to(path):
+                db_utils.close_idle_connections()
+        db_utils.use_division(None, None)
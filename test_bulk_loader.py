@@ -0,0 +1,112 @@
+"""
+Checks that the bulk loader restores SQL dumps, loads CSV and Excel exports,
+keeps the summary tables and indexes intact, and rolls back failed loads.
+"""
+import os
+import csv
+import sqlite3
+
+import pytest
+
+from utils import db_utils, bulk_loader
+
+DUMP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database_backup.sql")
+
+
+@pytest.fixture
+def db(fresh_db, tmp_path):
+    return tmp_path
+
+
+def schema_objects():
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    conn.close()
+    return names
+
+
+def test_sql_dump_restore(db):
+    objects = schema_objects()
+    result = bulk_loader.bulk_load([DUMP], truncate=True)
+
+    assert result['inserted']['students'] == 9
+    assert result['inserted']['attendance'] == 10
+    assert schema_objects() == objects
+    assert not [name for name in os.listdir(db) if name.startswith("bulk-load-")]
+
+    students = db_utils.get_all_students()
+    assert len(students) == 9
+    summary = db_utils.get_class_attendance_summary("2025-11-01", "2025-11-30")
+    assert sum(row["present_count"] for row in summary) == 10
+
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM attendance WHERE session_id IS NULL").fetchone()[0] == 0
+    conn.close()
+
+
+def test_csv_load_merges_and_rebuilds_summaries(db):
+    student_id = db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    subject_id = db_utils.get_subjects()[0]["id"]
+    db_utils.mark_attendance(student_id, subject_id, "2025-01-06", "P1", "present")
+    assert db_utils.get_class_attendance_summary("2025-01-01", "2025-03-31")[0]["total_classes"] == 1
+
+    path = db / "attendance.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["student_id", "subject_id", "date", "period", "status", "legacy_column"])
+        writer.writerow([student_id, subject_id, "2025-01-06", "P1", "absent", "x"])  # already present: kept
+        for day in range(7, 28):
+            writer.writerow([student_id, subject_id, f"2025-01-{day:02d}", "P1", "absent", "x"])
+
+    result = bulk_loader.bulk_load([str(path)])
+    assert result['inserted'] == {'attendance': 21}
+
+    # Cached report reads see the loaded rows
+    row = db_utils.get_class_attendance_summary("2025-01-01", "2025-03-31")[0]
+    assert (row["present_count"], row["total_classes"]) == (1, 22)
+
+
+def test_failed_load_changes_nothing(db):
+    objects = schema_objects()
+    path = db / "attendance.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["student_id", "subject_id", "date", "period", "status"])
+        writer.writerow([999, 1, "2025-01-06", "P1", "present"])
+
+    assert bulk_loader.bulk_load([str(path)], strict=True) is None
+    assert schema_objects() == objects
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0] == 0
+    conn.close()
+
+
+def test_unknown_csv_table_is_rejected(db):
+    path = db / "grades.csv"
+    path.write_text("id\n1\n")
+    assert bulk_loader.bulk_load([str(path)]) is None
+
+
+def test_excel_subject_export(db):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    path = db / "DSAJ_ENTC_B.TechB.xlsx"
+    pd.DataFrame({
+        "Roll No": ["EC1", "EC2"], "Name": ["One", "Two"],
+        "2025-11-17": ["✅", "❌"], "2025-11-18 (P2)": ["✅", ""],
+        "Present": [2, 0], "Total": [2, 1], "Attendance %": [100.0, 0.0]
+    }).to_excel(path, index=False)
+
+    result = bulk_loader.bulk_load([str(path)], default_period="P1")
+    assert result['inserted']['students'] == 2
+    assert result['inserted']['attendance'] == 3
+
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    rows = conn.execute('''
+        SELECT s.roll_no, a.date, a.period, a.status FROM attendance a
+        JOIN students s ON s.id = a.student_id JOIN subjects sub ON sub.id = a.subject_id
+        WHERE sub.code = 'DSAJ' ORDER BY 1, 2
+    ''').fetchall()
+    conn.close()
+    assert rows == [("EC1", "2025-11-17", "P1", "present"), ("EC1", "2025-11-18", "P2", "present"),
+                    ("EC2", "2025-11-17", "P1", "absent")]
@@ -0,0 +1,45 @@
+"""
+Checks that attendance rows are linked to the class session they were taken
+in, and that retaking a period reuses its session.
+"""
+from utils import db_utils
+
+
+def _session_ids():
+    conn = db_utils.get_connection()
+    try:
+        return {row['student_id']: row['session_id'] for row in conn.execute("SELECT student_id, session_id FROM attendance")}
+    finally:
+        conn.close()
+
+
+def test_attendance_is_linked_to_its_session(add_students, subject_ids):
+    first, second = add_students(range(1, 3))
+    subject_id = subject_ids[0]
+
+    db_utils.mark_attendance_bulk(subject_id, "2025-03-03", "P1", {first: "present", second: "absent"},
+                                  notify=False, taken_by="teacher", capture_source="recognition",
+                                  capture_metadata={'images': 2, 'detected_faces': 1})
+    session = db_utils.get_class_sessions(subject_id)[0]
+    assert (session['taken_by'], session['capture_source']) == ("teacher", "recognition")
+    assert session['capture_metadata'] == {'images': 2, 'detected_faces': 1}
+    assert (session['present_count'], session['marked_count']) == (1, 2)
+    assert session['updated_at'] is None
+    assert _session_ids() == {first: session['id'], second: session['id']}
+
+    # Retaking the period reuses the session and records who retook it
+    db_utils.mark_attendance_bulk(subject_id, "2025-03-03", "P1", {second: "present"}, notify=False,
+                                  taken_by="hod", capture_source="edit")
+    db_utils.mark_attendance(first, subject_id, "2025-03-03", "P1", "absent")
+    sessions = db_utils.get_class_sessions(subject_id)
+    assert [s['id'] for s in sessions] == [session['id']]
+    assert (sessions[0]['taken_by'], sessions[0]['capture_source']) == ("hod", "edit")
+    assert sessions[0]['capture_metadata'] == {'images': 2, 'detected_faces': 1}
+    assert sessions[0]['updated_at'] is not None
+    assert (sessions[0]['present_count'], sessions[0]['marked_count']) == (1, 2)
+
+    # Another period is a separate session, even with no one present
+    db_utils.mark_attendance_bulk(subject_id, "2025-03-03", "P2", {first: "absent"}, notify=False)
+    assert [s['period'] for s in db_utils.get_class_sessions(subject_id, "2025-03-03", "2025-03-03")] == ["P2", "P1"]
+    assert db_utils.count_held_classes("2025-03-01", "2025-03-31", subject_id) == 2
+    assert db_utils.count_held_classes("2025-03-01", "2025-03-31", subject_ids[1]) == 0
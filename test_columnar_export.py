@@ -0,0 +1,67 @@
+"""
+Checks that the columnar attendance snapshot matches the database and that
+refreshes only rewrite the months that changed.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils import db_utils, columnar_export, archive_utils  # noqa: E402
+
+FORMATS = ["npz"] + (["parquet"] if columnar_export.PYARROW_AVAILABLE else [])
+
+
+@pytest.fixture
+def db(add_students, subject_ids, tmp_path):
+    student_ids = add_students(range(1, 4))
+    subject_id = subject_ids[0]
+    for offset, date in enumerate(["2025-02-26", "2025-02-27", "2025-03-03", "2025-03-04"]):
+        statuses = {sid: "present" if (sid + offset) % 2 else "absent" for sid in student_ids}
+        assert db_utils.mark_attendance_bulk(subject_id, date, "P1", statuses, notify=False)
+    return student_ids, subject_id, str(tmp_path / "analytics")
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_export_matches_database(db, fmt):
+    student_ids, subject_id, export_dir = db
+    result = columnar_export.refresh_export(export_dir, fmt)
+    assert result['written'] == ["2025-02", "2025-03"] and result['rows_written'] == 12
+
+    columns = columnar_export.load_columns("2025-02-27", "2025-03-03", export_dir=export_dir)
+    assert columns['date'].dtype == np.dtype('datetime64[D]')
+    assert columns['present'].dtype == bool
+    assert len(columns['id']) == 6
+    report = db_utils.get_class_attendance_summary("2025-02-27", "2025-03-03")
+    assert int(columns['present'].sum()) == sum(row['present_count'] for row in report)
+
+
+def test_load_frame_joins_students_and_subjects(db):
+    pytest.importorskip("pandas")
+    _, _, export_dir = db
+    columnar_export.refresh_export(export_dir, "npz")
+    frame = columnar_export.load_frame(export_dir=export_dir)
+    assert len(frame) == 12
+    assert set(frame['roll_no']) == {"R01", "R02", "R03"}
+    assert frame['subject_code'].notna().all()
+
+
+def test_refresh_is_incremental(db):
+    student_ids, subject_id, export_dir = db
+    columnar_export.refresh_export(export_dir, "npz")
+    assert columnar_export.refresh_export(export_dir, "npz")['written'] == []
+
+    # Re-marking one student only touches March
+    assert db_utils.mark_attendance(student_ids[0], subject_id, "2025-03-04", "P1", "present")
+    result = columnar_export.refresh_export(export_dir, "npz")
+    assert result['written'] == ["2025-03"] and result['unchanged'] == ["2025-02"]
+    march = columnar_export.load_columns("2025-03-04", "2025-03-04", ["student_id", "present"], export_dir)
+    assert march["present"][march["student_id"] == student_ids[0]].all()
+
+
+def test_archived_terms_are_exported(db):
+    _, _, export_dir = db
+    columnar_export.refresh_export(export_dir, "npz")
+    archive_utils.archive_term("2025-feb", "2025-02-01", "2025-02-28")
+    # Moving rows into the archive does not change what is exported
+    assert columnar_export.refresh_export(export_dir, "npz")['written'] == []
+    assert len(columnar_export.load_columns(export_dir=export_dir)['id']) == 12
@@ -0,0 +1,120 @@
+"""
+Checks that get_connection() reuses connections per thread and database,
+rolls back what a caller left uncommitted, and tunes every new connection
+with the configured PRAGMAs.
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from utils import db_utils
+
+
+@pytest.fixture
+def tuning(monkeypatch, db_path):
+    settings = {
+        "DB_BUSY_TIMEOUT": 2.5,
+        "DB_JOURNAL_MODE": "WAL",
+        "DB_SYNCHRONOUS": "NORMAL",
+        "DB_CACHE_SIZE_KB": 2048,
+        "DB_MMAP_SIZE": 1048576,
+        "DB_POOL_SIZE": 2,
+    }
+    for name, value in settings.items():
+        monkeypatch.setattr(db_utils, name, value)
+    return settings
+
+
+def _pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def test_new_connections_are_tuned(tuning):
+    conn = db_utils.get_connection()
+    try:
+        assert isinstance(conn, db_utils.PooledConnection)
+        assert _pragma(conn, "journal_mode") == "wal"
+        assert _pragma(conn, "busy_timeout") == 2500
+        assert _pragma(conn, "synchronous") == 1  # NORMAL
+        assert _pragma(conn, "foreign_keys") == 1
+        assert _pragma(conn, "cache_size") == -2048
+        assert _pragma(conn, "temp_store") == 2  # MEMORY
+        # SQLite caps mmap_size at its compile-time maximum (0 where mmap is unsupported)
+        assert _pragma(conn, "mmap_size") in (0, 1048576)
+        assert conn.row_factory is sqlite3.Row
+    finally:
+        conn.close()
+
+
+def test_closed_connections_are_reused_and_rolled_back(tuning):
+    conn = db_utils.get_connection()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+    conn.close()  # closing twice does not pool it twice
+
+    again = db_utils.get_connection()
+    try:
+        assert again is conn
+        assert not again.in_transaction
+        assert again.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        # A caller's row_factory change does not leak to the next caller
+        again.row_factory = None
+        again.close()
+        assert db_utils.get_connection().row_factory is sqlite3.Row
+    finally:
+        again.close()
+
+
+def test_pool_keeps_at_most_pool_size_idle_connections(tuning):
+    conns = [db_utils.get_connection() for _ in range(3)]
+    assert len({id(conn) for conn in conns}) == 3
+    for conn in conns:
+        conn.close()
+    # DB_POOL_SIZE is 2: the third connection is really closed
+    with pytest.raises(sqlite3.ProgrammingError):
+        conns[2].execute("SELECT 1")
+    reused = [db_utils.get_connection() for _ in range(2)]
+    assert {id(conn) for conn in reused} == {id(conns[0]), id(conns[1])}
+    for conn in reused:
+        conn.close()
+
+    db_utils.close_idle_connections()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conns[0].execute("SELECT 1")
+    fresh = db_utils.get_connection()
+    assert all(fresh is not conn for conn in conns)
+    fresh.close()
+
+
+def test_pools_are_per_thread_and_per_database(tuning, tmp_path):
+    mine = db_utils.get_connection()
+    mine.close()
+
+    seen = []
+
+    def other_thread():
+        conn = db_utils.get_connection()
+        seen.append(conn)
+        conn.close()
+        seen.append(db_utils.get_connection())
+        seen[1].close()
+        db_utils.close_idle_connections()
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+    # The other thread opened its own connection and reused it, never this thread's
+    assert seen[0] is not mine and seen[1] is seen[0]
+
+    with db_utils.routed_to(str(tmp_path / "other.db")):
+        other = db_utils.get_connection()
+        assert other is not mine
+        other.close()
+        assert db_utils.get_connection() is other
+        other.close()
+
+    assert db_utils.get_connection() is mine
+    mine.close()
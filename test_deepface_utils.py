@@ -0,0 +1,147 @@
+"""
+Checks the image decoding helpers of the recognition pipeline, its stage
+timer and its fallback to local embedding (none of this needs the DeepFace
+models).
+"""
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from utils import deepface_utils  # noqa: E402
+
+
+@pytest.fixture
+def png_bytes():
+    # Red left half, blue right half (RGB)
+    pixels = np.zeros((4, 6, 3), dtype=np.uint8)
+    pixels[:, :3] = (255, 0, 0)
+    pixels[:, 3:] = (0, 0, 255)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _assert_bgr(image):
+    assert image.shape == (4, 6, 3) and image.dtype == np.uint8
+    assert tuple(image[0, 0]) == (0, 0, 255)
+    assert tuple(image[0, 5]) == (255, 0, 0)
+
+
+def test_load_image_sources(png_bytes, tmp_path):
+    _assert_bgr(deepface_utils.load_image(png_bytes))
+    _assert_bgr(deepface_utils.load_image(bytearray(png_bytes)))
+    _assert_bgr(deepface_utils.load_image(io.BytesIO(png_bytes)))
+
+    path = tmp_path / "face.png"
+    path.write_bytes(png_bytes)
+    _assert_bgr(deepface_utils.load_image(str(path)))
+    _assert_bgr(deepface_utils.load_image(path))
+
+    class Upload:
+        """Like a Streamlit UploadedFile: only getvalue() is used"""
+        def getvalue(self):
+            return png_bytes
+
+    _assert_bgr(deepface_utils.load_image(Upload()))
+
+    array = deepface_utils.load_image(png_bytes)
+    assert deepface_utils.load_image(array) is array
+
+    with pytest.raises(FileNotFoundError):
+        deepface_utils.load_image(str(tmp_path / "missing.png"))
+
+
+def test_scale_region_maps_back_to_full_resolution():
+    image = np.zeros((3000, 4000, 3), dtype=np.uint8)
+    small, scale = deepface_utils.downscale_for_detection(image, max_edge=1000)
+    assert small.shape[:2] == (750, 1000) and scale == 0.25
+    assert deepface_utils.downscale_for_detection(image, max_edge=0) == (image, 1.0)
+
+    region = {'x': 100, 'y': 50, 'w': 40, 'h': 60, 'left_eye': None}
+    assert deepface_utils._scale_region(region, scale, 4000, 3000) == \
+        {'x': 400, 'y': 200, 'w': 160, 'h': 240, 'left_eye': None}
+    # Boxes reaching past the edge are clipped to the image
+    assert deepface_utils._scale_region({'x': 980, 'y': 740, 'w': 40, 'h': 40}, scale, 4000, 3000) == \
+        {'x': 3920, 'y': 2960, 'w': 80, 'h': 40}
+    assert deepface_utils._scale_region({'x': -5, 'y': 0, 'w': 10, 'h': 10}, 1.0, 100, 100) == \
+        {'x': 0, 'y': 0, 'w': 10, 'h': 10}
+
+
+def test_faces_the_server_did_not_embed_are_embedded_locally(tmp_path, monkeypatch):
+    gallery = []
+    for i in range(1, 4):
+        path = tmp_path / f"student{i}.jpg"
+        path.write_bytes(b"")
+        gallery.append({'id': i, 'name': f"Student {i}", 'roll_no': f"R0{i}", 'image_path': str(path)})
+    image = np.zeros((30, 90, 3), dtype=np.uint8)
+    faces = [{'facial_area': {'x': 30 * i, 'y': 0, 'w': 30, 'h': 30}} for i in range(3)]
+    vectors = {0: [1.0, 0.0, 0.0], 1: [0.0, 1.0, 0.0], 2: [0.0, 0.0, 1.0]}
+
+    class Server:
+        """Answers with None for the second face and the third student, as after a model error"""
+        def embed(self, model_name, images=None, paths=None):
+            if images is not None:
+                return [vectors[0], None, vectors[2]]
+            return [vectors[0], vectors[1], None]
+
+    local = []
+
+    def extract_embedding(source, model_name):
+        local.append(source if isinstance(source, str) else "face")
+        # Only the second face and the third student's photo are embedded here
+        return vectors[1] if not isinstance(source, str) else vectors[2]
+
+    monkeypatch.setattr(deepface_utils, "deepface_available", True)
+    monkeypatch.setattr(deepface_utils, "get_inference_client", lambda: Server())
+    monkeypatch.setattr(deepface_utils, "detect_faces_with_details", lambda *args, **kwargs: (faces, []))
+    monkeypatch.setattr(deepface_utils, "extract_embedding", extract_embedding)
+
+    present = deepface_utils.verify_faces(image, gallery, threshold=0.1)
+    assert [student['id'] for student in present] == [1, 2, 3]
+    assert local == ["face", gallery[2]['image_path']]
+
+
+def test_exif_orientation_is_applied():
+    # Stored sideways with "rotate 90° clockwise to view" in EXIF, like a portrait phone photo
+    pixels = np.zeros((40, 60, 3), dtype=np.uint8)
+    pixels[:, :30] = (255, 0, 0)
+    pixels[:, 30:] = (0, 0, 255)
+    image = Image.fromarray(pixels)
+    exif = image.getexif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95, exif=exif.tobytes())
+
+    from utils import inference_server
+    for decoded in (deepface_utils.load_image(buffer.getvalue()), inference_server._decode_image(buffer.getvalue())):
+        assert decoded.shape == (60, 40, 3)
+        # The left (red) half is now on top; BGR order
+        assert decoded[5, 20, 2] > 200 and decoded[5, 20, 0] < 50
+        assert decoded[55, 20, 0] > 200 and decoded[55, 20, 2] < 50
+
+
+def test_stage_timer_accumulates_stages_and_tags(monkeypatch):
+    clock = iter([10.0, 10.5, 20.0, 20.25, 30.0, 31.0])
+    monkeypatch.setattr(deepface_utils.time, "perf_counter", lambda: next(clock))
+    stats = {}
+    timer = deepface_utils.StageTimer(stats, model="Facenet512")
+    with timer.stage("detection"):
+        pass
+    with timer.stage("embedding"):
+        pass
+    # A stage that raises is still timed
+    with pytest.raises(RuntimeError):
+        with timer.stage("detection"):
+            raise RuntimeError("detector failed")
+    timer.add("embedding", 0.75)
+    timer.tag(face_count=3)
+
+    assert stats['stages'] == {"detection": 1.5, "embedding": 1.0}
+    assert stats['tags'] == {"model": "Facenet512", "face_count": 3}
+    # A second timer on the same stats keeps adding to it
+    deepface_utils.StageTimer(stats, detector="opencv").add("detection", 0.5)
+    assert stats['stages']['detection'] == 2.0
+    assert stats['tags'] == {"model": "Facenet512", "face_count": 3, "detector": "opencv"}
@@ -0,0 +1,100 @@
+"""
+Checks that attendance notifications are deduplicated by idempotency key,
+re-armed when a later status is saved, and retried with exponential backoff.
+"""
+from datetime import datetime
+
+import pytest
+
+from utils import db_utils, email_outbox
+
+
+@pytest.fixture
+def db(add_students, subject_ids, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_ENABLED", True)
+    monkeypatch.setattr(email_outbox, "EMAIL_SEND_ON_PRESENT", True)
+    monkeypatch.setattr(email_outbox, "EMAIL_SEND_ON_ABSENT", True)
+    student_ids = add_students(range(1, 3), email=lambda i: f"student{i}@example.com" if i == 1 else "")
+    return student_ids, subject_ids[0]
+
+
+def _enqueue(subject_id, statuses):
+    conn = db_utils.get_connection()
+    try:
+        queued = email_outbox.enqueue_attendance_emails(conn.cursor(), subject_id, "2025-03-03", "P1", statuses)
+        conn.commit()
+        return queued
+    finally:
+        conn.close()
+
+
+def _outbox():
+    conn = db_utils.get_connection()
+    try:
+        return [dict(row) for row in conn.execute("SELECT * FROM email_outbox ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_same_status_is_queued_once(db):
+    (with_email, without_email), subject_id = db
+    # The student without an address is skipped
+    assert _enqueue(subject_id, {with_email: "present", without_email: "present"}) == 1
+    _enqueue(subject_id, {with_email: "present"})
+
+    rows = _outbox()
+    assert len(rows) == 1
+    assert rows[0]['idempotency_key'] == f"attendance:{with_email}:{subject_id}:2025-03-03:P1:present"
+    assert rows[0]['state'] == 'pending'
+
+    # While it is being sent, another save of the same status leaves it alone
+    claimed = email_outbox.claim_due_emails()
+    assert [row['id'] for row in claimed] == [rows[0]['id']]
+    _enqueue(subject_id, {with_email: "present"})
+    assert _outbox()[0]['state'] == 'sending'
+
+
+def test_sent_notification_is_rearmed(db):
+    (student_id, _), subject_id = db
+    _enqueue(subject_id, {student_id: "present"})
+    row = email_outbox.claim_due_emails()[0]
+    email_outbox.mark_email_sent(row['id'])
+
+    # A status change is a new key
+    _enqueue(subject_id, {student_id: "absent"})
+    assert [(r['state'], r['payload'].count('"absent"')) for r in _outbox()] == [('sent', 0), ('pending', 1)]
+
+    # Going back to the status that was already delivered sends it again
+    _enqueue(subject_id, {student_id: "present"})
+    rearmed = _outbox()[0]
+    assert (rearmed['state'], rearmed['attempts'], rearmed['sent_at']) == ('pending', 0, None)
+
+
+def test_failures_back_off_exponentially(db, monkeypatch):
+    (student_id, _), subject_id = db
+    monkeypatch.setattr(email_outbox, "EMAIL_OUTBOX_BACKOFF_BASE", 30)
+    monkeypatch.setattr(email_outbox, "EMAIL_OUTBOX_BACKOFF_MAX", 100)
+    monkeypatch.setattr(email_outbox, "EMAIL_OUTBOX_MAX_ATTEMPTS", 3)
+    _enqueue(subject_id, {student_id: "present"})
+
+    delays = []
+    for attempts in (1, 2, 3):
+        row = email_outbox.claim_due_emails()[0]
+        assert row['attempts'] == attempts
+        before = datetime.now()
+        email_outbox.mark_email_failed(row['id'], row['attempts'], "smtp down")
+        stored = _outbox()[0]
+        delays.append(round((datetime.fromisoformat(stored['next_attempt_at']) - before).total_seconds()))
+        if attempts < 3:
+            assert stored['state'] == 'pending'
+            assert email_outbox.claim_due_emails() == []  # not due yet
+            conn = db_utils.get_connection()
+            conn.execute("UPDATE email_outbox SET next_attempt_at = ?", (datetime.now().isoformat(),))
+            conn.commit()
+            conn.close()
+
+    # 30 s, 60 s, then 120 s capped at 100 s; the last attempt gives up
+    assert delays == [30, 60, 100]
+    assert (stored['state'], stored['last_error']) == ('failed', "smtp down")
+    assert email_outbox.retry_failed_emails() == 1
+    assert (_outbox()[0]['state'], _outbox()[0]['attempts']) == ('pending', 0)
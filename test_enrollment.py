@@ -0,0 +1,51 @@
+"""
+Checks the set-based enrollment functions and the enrollment policy triggers.
+"""
+import pytest
+
+from utils import db_utils
+
+
+@pytest.fixture
+def conn(fresh_db):
+    conn = db_utils.get_connection()
+    yield conn
+    conn.close()
+
+
+def enrollment_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM student_subjects").fetchone()[0]
+
+
+def subject_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM subjects").fetchone()[0]
+
+
+def test_policy_enrolls_new_students_and_subjects(conn):
+    assert db_utils.get_auto_enroll_policy()
+
+    student_id = db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    assert enrollment_count(conn) == subject_count(conn)
+
+    conn.execute("INSERT INTO subjects (code, name) VALUES ('NEW', 'New Subject')")
+    conn.commit()
+    enrolled = {row["id"] for row in db_utils.get_student_enrolled_subjects(student_id)}
+    assert len(enrolled) == subject_count(conn)
+
+
+def test_policy_off_keeps_chosen_subjects(conn):
+    assert db_utils.set_auto_enroll_policy(False)
+    assert not db_utils.get_auto_enroll_policy()
+
+    first_subject = conn.execute("SELECT MIN(id) FROM subjects").fetchone()[0]
+    student_id = db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [first_subject])
+    assert [s["id"] for s in db_utils.get_student_enrolled_subjects(student_id)] == [first_subject]
+
+    # Enrolling everyone is one statement and reports only the new rows
+    assert db_utils.enroll_all_students_in_all_subjects() == subject_count(conn) - 1
+    assert db_utils.enroll_all_students_in_all_subjects() == 0
+
+    # Switching the policy back on fills in anything missing
+    db_utils.register_student("R02", "Student 2", "ENTC", "B.Tech", "B", "", [first_subject])
+    assert db_utils.set_auto_enroll_policy(True)
+    assert enrollment_count(conn) == 2 * subject_count(conn)
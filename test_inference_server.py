@@ -0,0 +1,90 @@
+"""
+Checks that the inference server batches concurrent faces, reports model
+failures per face, and gives up on (and drops) faces it cannot embed in time.
+A fake model stands in for DeepFace.
+"""
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL.Image")
+
+from utils import inference_server  # noqa: E402
+
+
+class FakeModel:
+    """Embeds an image as [its first pixel value]; optionally blocks or fails"""
+
+    def __init__(self, model_name="Fake"):
+        self.model_name = model_name
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+
+    def embed_batch(self, images):
+        self.started.set()
+        self.release.wait(5)
+        self.batches.append(len(images))
+        if any(image[0, 0, 0] == 255 for image in images):
+            raise ValueError("bad face")
+        return [[float(image[0, 0, 0])] for image in images]
+
+
+def _face(value):
+    return np.full((2, 2, 3), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def model():
+    fake = FakeModel()
+    yield fake
+    fake.release.set()
+
+
+def test_batcher_fills_batches_up_to_max_batch(model):
+    model.release.clear()
+    batcher = inference_server.DynamicBatcher(model, max_batch=4, max_wait_ms=50)
+    # The first face is picked up alone while the model is busy; the rest queue up behind it
+    first = batcher.submit([_face(0)])
+    assert model.started.wait(5)
+    rest = batcher.submit([_face(value) for value in range(1, 7)])
+    assert batcher.pending == 6
+    model.release.set()
+    for req in first + rest:
+        assert req.done.wait(5)
+
+    assert model.batches == [1, 4, 2]
+    assert [req.embedding for req in first + rest] == [[float(value)] for value in range(7)]
+    assert (batcher.batches_run, batcher.faces_embedded, batcher.pending) == (3, 7, 0)
+
+
+def test_batcher_rejects_work_beyond_max_pending(model):
+    model.release.clear()
+    batcher = inference_server.DynamicBatcher(model, max_batch=1, max_wait_ms=0, max_pending=2)
+    batcher.submit([_face(0)])
+    assert model.started.wait(5)
+    batcher.submit([_face(1), _face(2)])
+    with pytest.raises(OverflowError):
+        batcher.submit([_face(3)])
+
+
+def test_service_returns_none_for_undecodable_and_failed_faces():
+    service = inference_server.InferenceService(max_batch=8, max_wait_ms=10, model_factory=FakeModel)
+    assert service.embed("Fake", [_face(7), None, _face(9)]) == [[7.0], None, [9.0]]
+    # A failing batch leaves every face in it without an embedding
+    assert service.embed("Fake", [_face(255)]) == [None]
+    assert service.status()['models'] == ["Fake"]
+
+
+def test_service_times_out_and_drops_queued_faces(model):
+    model.release.clear()
+    service = inference_server.InferenceService(max_batch=1, max_wait_ms=0, model_factory=lambda name: model)
+    with pytest.raises(TimeoutError):
+        service.embed("Fake", [_face(1), _face(2), _face(3)], timeout=0.1)
+    # The face being embedded finishes, the two still queued are not embedded for nobody
+    assert service.get_batcher("Fake").pending == 0
+    model.release.set()
+    assert service.embed("Fake", [_face(4)]) == [[4.0]]
+    assert model.batches == [1, 1]
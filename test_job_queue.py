@@ -0,0 +1,119 @@
+"""
+Checks that recognition jobs are claimed fairly across queues, that stale
+jobs are requeued without letting their old worker finish them, and that a
+finished batch saves its attendance once, unless one of its images failed.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import db_utils, job_queue
+
+
+@pytest.fixture
+def db(add_students, subject_ids):
+    return add_students(range(1, 4)), subject_ids[0]
+
+
+def _submit(queue_key, images=1, context=None):
+    return job_queue.submit_recognition_batch([b"image"] * images, [], {}, queue_key=queue_key,
+                                              submitted_by=queue_key, context=context)
+
+
+def test_claims_take_turns_across_queues(db):
+    busy = _submit("room-a", images=3)
+    quiet = _submit("room-b")
+    first = job_queue.claim_next_job("w1")
+    second = job_queue.claim_next_job("w2")
+    third = job_queue.claim_next_job("w3")
+    # room-a has a running job when the second claim is made, so room-b goes next
+    assert [first['batch_id'], second['batch_id'], third['batch_id']] == [busy, quiet, busy]
+    assert job_queue.claim_next_job("w4")['batch_id'] == busy
+    assert job_queue.claim_next_job("w5") is None
+
+
+def test_stale_jobs_are_requeued_and_old_worker_is_ignored(db):
+    _submit("room-a")
+    job = job_queue.claim_next_job("w1")
+    old = (datetime.now() - timedelta(seconds=job_queue.RECOGNITION_JOB_STALE_AFTER + 60)).isoformat()
+    conn = db_utils.get_connection()
+    conn.execute("UPDATE recognition_jobs SET heartbeat_at = ? WHERE id = ?", (old, job['id']))
+    conn.commit()
+    conn.close()
+
+    assert job_queue.requeue_stale_jobs() == 1
+    retry = job_queue.claim_next_job("w2")
+    assert (retry['id'], retry['attempts']) == (job['id'], 2)
+
+    # The first worker wakes up late: neither its result nor its failure counts
+    assert not job_queue.complete_job(job['id'], "w1", {'present_students': []})
+    assert not job_queue.fail_job(job['id'], "w1", "late")
+    assert job_queue.complete_job(job['id'], "w2", {'present_students': []})
+    assert job_queue.get_job(job['id'])['status'] == 'completed'
+
+
+def test_finished_batch_saves_attendance_once(db):
+    student_ids, subject_id = db
+    batch_id = _submit("room-a", images=2, context={
+        'subject_id': subject_id, 'selected_date': "2025-03-03", 'selected_period': "P1"})
+    jobs = [job_queue.claim_next_job("w1"), job_queue.claim_next_job("w2")]
+
+    job_queue.complete_job(jobs[0]['id'], "w1", {'present_students': [{'id': student_ids[0]}], 'detected_faces': 1})
+    assert job_queue.save_batch_attendance(batch_id) is None  # second image still running
+    job_queue.complete_job(jobs[1]['id'], "w2", {'present_students': [{'id': student_ids[2]}], 'detected_faces': 1})
+    assert job_queue.save_batch_attendance(batch_id) == {'present': 2, 'absent': 1, 'failed': 0}
+    assert job_queue.save_batch_attendance(batch_id) is None
+
+    report = {row['id']: row['status'] for row in db_utils.get_attendance_report(subject_id, "2025-03-03")}
+    assert report == {student_ids[0]: 'present', student_ids[1]: 'absent', student_ids[2]: 'present'}
+    session = db_utils.get_class_sessions(subject_id, "2025-03-03", "2025-03-03")[0]
+    assert (session['taken_by'], session['capture_source']) == ("room-a", "recognition")
+    assert session['capture_metadata']['images'] == 2
+    assert all(job['attendance_result']['present'] == 2 for job in job_queue.get_batch_jobs(batch_id))
+
+
+def test_batch_with_a_failed_image_is_not_saved(db):
+    student_ids, subject_id = db
+    batch_id = _submit("room-a", images=2, context={
+        'subject_id': subject_id, 'selected_date': "2025-03-03", 'selected_period': "P1"})
+    jobs = [job_queue.claim_next_job("w1"), job_queue.claim_next_job("w2")]
+    job_queue.complete_job(jobs[0]['id'], "w1", {'present_students': [{'id': student_ids[0]}], 'detected_faces': 1})
+    conn = db_utils.get_connection()
+    conn.execute("UPDATE recognition_jobs SET attempts = ? WHERE id = ?",
+                 (job_queue.RECOGNITION_JOB_MAX_ATTEMPTS, jobs[1]['id']))
+    conn.commit()
+    conn.close()
+    job_queue.fail_job(jobs[1]['id'], "w2", "decode error")
+
+    # Students in the failed image would all be marked absent: ask for a retake instead
+    result = job_queue.save_batch_attendance(batch_id)
+    assert "1 of 2 image(s)" in result['error']
+    assert job_queue.save_batch_attendance(batch_id) is None
+    assert job_queue.save_finished_batches() == 0
+    assert db_utils.get_class_sessions(subject_id) == []
+    assert all(job['attendance_result'] == result for job in job_queue.get_batch_jobs(batch_id))
+
+
+def test_save_interrupted_after_the_claim_is_retried(db):
+    student_ids, subject_id = db
+    batch_id = _submit("room-a", context={
+        'subject_id': subject_id, 'selected_date': "2025-03-03", 'selected_period': "P1"})
+    job = job_queue.claim_next_job("w1")
+    job_queue.complete_job(job['id'], "w1", {'present_students': [{'id': student_ids[1]}], 'detected_faces': 1})
+
+    # The saving worker claimed the batch, then died before writing attendance
+    conn = db_utils.get_connection()
+    conn.execute("UPDATE recognition_jobs SET attendance_saved_at = ? WHERE batch_id = ?",
+                 (datetime.now().isoformat(), batch_id))
+    conn.commit()
+    conn.close()
+    assert job_queue.save_finished_batches() == 0  # the claim may still be in progress
+
+    old = (datetime.now() - timedelta(seconds=job_queue.RECOGNITION_JOB_STALE_AFTER + 60)).isoformat()
+    conn = db_utils.get_connection()
+    conn.execute("UPDATE recognition_jobs SET attendance_saved_at = ? WHERE batch_id = ?", (old, batch_id))
+    conn.commit()
+    conn.close()
+    assert job_queue.save_finished_batches() == 1
+    assert job_queue.get_job(job['id'])['attendance_result'] == {'present': 1, 'absent': 2, 'failed': 0}
+    assert job_queue.save_finished_batches() == 0
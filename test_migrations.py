@@ -0,0 +1,69 @@
+"""
+Checks the schema migrations on fresh and pre-versioning databases and that
+init_db only does work once per process.
+"""
+import sqlite3
+
+from utils import db_utils, migrations
+
+
+def schema_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return migrations.get_schema_version(conn.cursor())
+    finally:
+        conn.close()
+
+
+def test_fresh_database_reaches_latest_version(db_path):
+    db_utils.init_db()
+    assert schema_version(db_path) == migrations.latest_version()
+    assert all(applied for _, _, applied in migrations.migration_status())
+
+    conn = db_utils.get_connection()
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"attendance", "class_sessions", "attendance_weekly", "email_outbox", "schema_version"} <= tables
+    assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 3
+    conn.close()
+
+
+def test_unversioned_database_is_upgraded_in_place(db_path):
+    # Shape of a database created before emails, sessions and versioning existed
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE subjects (id INTEGER PRIMARY KEY AUTOINCREMENT, code TEXT UNIQUE NOT NULL, name TEXT NOT NULL);
+        CREATE TABLE students (id INTEGER PRIMARY KEY AUTOINCREMENT, roll_no TEXT UNIQUE NOT NULL,
+                               name TEXT NOT NULL, image_path TEXT NOT NULL);
+        CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id INTEGER NOT NULL,
+                                 subject_id INTEGER NOT NULL, date TEXT NOT NULL, period TEXT NOT NULL,
+                                 status TEXT DEFAULT 'present', UNIQUE (student_id, subject_id, date, period));
+        INSERT INTO subjects (code, name) VALUES ('FOC', 'Fiber Optic Communication');
+        INSERT INTO students (roll_no, name, image_path) VALUES ('R01', 'Student 1', '');
+        INSERT INTO attendance (student_id, subject_id, date, period, status) VALUES (1, 1, '2025-01-06', 'P1', 'present');
+    ''')
+    conn.commit()
+    conn.close()
+
+    assert schema_version(db_path) == 0
+    applied = migrations.migrate()
+    assert applied == [version for version, _, _ in migrations.MIGRATIONS]
+
+    conn = db_utils.get_connection()
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(students)")}
+    assert {"email", "division"} <= columns
+    assert conn.execute("SELECT session_id FROM attendance").fetchone()[0] is not None
+    assert tuple(conn.execute("SELECT present_count, total_count FROM attendance_daily").fetchone()) == (1, 1)
+    conn.close()
+
+    # Nothing left to apply
+    assert migrations.migrate() == []
+
+
+def test_init_db_runs_migrations_once_per_process(db_path, monkeypatch):
+    db_utils.init_db()
+
+    calls = []
+    monkeypatch.setattr(migrations, "migrate", lambda: calls.append(1) or [])
+    db_utils.init_db()
+    db_utils.init_db()
+    assert calls == []
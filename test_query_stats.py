@@ -0,0 +1,50 @@
+"""
+Checks that statements run through db_utils connections are timed, grouped
+by query shape and attributed to their calling function.
+"""
+import pytest
+
+from utils import db_utils, query_stats
+
+
+@pytest.fixture
+def stats(fresh_db):
+    query_stats.reset_query_stats()
+    yield query_stats
+    query_stats.reset_query_stats()
+
+
+def test_query_shape_ignores_literals():
+    assert query_stats.query_shape("SELECT * FROM students  WHERE id = 12 AND name = 'A''b'") == \
+        "SELECT * FROM students WHERE id = ? AND name = ?"
+    assert query_stats.query_shape("SELECT id FROM students WHERE id IN (?, ?, ?)") == \
+        query_stats.query_shape("SELECT id FROM students WHERE id IN (?,?)")
+
+
+def test_statements_are_recorded_per_shape_and_caller(stats):
+    db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    db_utils.invalidate_reference_cache()
+    db_utils.get_subjects()
+    db_utils.get_subjects()
+
+    subjects_query = [s for s in stats.get_query_stats() if s['shape'].startswith("SELECT id, code, name FROM subjects ORDER BY")]
+    assert len(subjects_query) == 1
+    # The second call is served from the read cache
+    assert subjects_query[0]['count'] == 1
+    assert subjects_query[0]['rows'] > 0
+    assert subjects_query[0]['callers'] == {'utils.db_utils.get_subjects': 1}
+    assert sum(subjects_query[0]['histogram']) == 1
+
+    insert = [s for s in stats.get_query_stats() if s['shape'].startswith("INSERT INTO students")]
+    assert insert[0]['rows'] == 1
+    assert 'utils.db_utils.register_student' in insert[0]['callers']
+    assert any(c['caller'] == 'utils.db_utils.register_student' for c in stats.get_caller_stats())
+
+
+def test_slow_statements_keep_their_query_plan(stats, monkeypatch):
+    monkeypatch.setattr(query_stats, "QUERY_SLOW_MS", 0.0)
+    db_utils.get_class_attendance_summary("2025-01-01", "2025-01-31")
+
+    slow = [q for q in stats.get_slow_queries() if q['caller'] == 'utils.db_utils.get_class_attendance_summary']
+    assert slow
+    assert any("attendance_weekly" in step for step in slow[0]['plan'])
@@ -0,0 +1,43 @@
+"""
+Checks that recognition runs are stored with their tags and per-stage timings
+and that the app-side visualization time is added to a job's run.
+"""
+from utils import db_utils
+
+
+def test_run_is_stored_with_stage_timings(fresh_db):
+    stats = {
+        'stages': {'decode': 0.1, 'detection': 0.4, 'embedding': 1.2, 'matching': 0.05},
+        'tags': {'model': "Facenet512", 'detector': "opencv", 'image_width': 1920,
+                 'image_height': 1080, 'face_count': 3, 'roster_size': 40},
+        'embedding_per_face': [0.4, 0.4, 0.4],
+    }
+    first = db_utils.save_recognition_run(stats, 2.0, 2, job_id="job-1")
+    second = db_utils.save_recognition_run({}, 0.5, 0)
+    assert second > first
+
+    runs = db_utils.get_recognition_runs()
+    assert [run['id'] for run in runs] == [second, first]
+    run = runs[1]
+    assert (run['job_id'], run['model_name'], run['detector_backend']) == ("job-1", "Facenet512", "opencv")
+    assert (run['image_width'], run['image_height'], run['face_count'], run['roster_size']) == (1920, 1080, 3, 40)
+    assert (run['recognized_count'], run['total_time']) == (2, 2.0)
+    assert {stage: run[f'{stage}_time'] for stage in db_utils.RECOGNITION_STAGES} == {
+        'decode': 0.1, 'detection': 0.4, 'crop_align': None, 'embedding': 1.2,
+        'gallery_load': None, 'matching': 0.05, 'visualization': None,
+    }
+    assert run['embedding_per_face'] == [0.4, 0.4, 0.4]
+    assert run['created_at']
+
+    # A run without stats stores defaults
+    empty = runs[0]
+    assert (empty['job_id'], empty['face_count'], empty['embedding_per_face']) == (None, 0, [])
+    assert [run['id'] for run in db_utils.get_recognition_runs(limit=1)] == [second]
+
+
+def test_visualization_time_is_added_to_the_jobs_run(fresh_db):
+    db_utils.save_recognition_run({'stages': {'decode': 0.1}}, 1.0, 1, job_id="job-1")
+    assert db_utils.record_visualization_time("job-1", 0.25)
+    assert db_utils.record_visualization_time("job-1", 0.5)
+    assert not db_utils.record_visualization_time("no-such-job", 0.5)
+    assert db_utils.get_recognition_runs()[0]['visualization_time'] == 0.75
@@ -0,0 +1,134 @@
+"""
+Checks that reference-data and report reads are served from the cache, that
+the student, enrollment and attendance writers invalidate it, and that commits
+from another process are noticed.
+"""
+import sqlite3
+
+import pytest
+
+from utils import db_utils
+
+
+@pytest.fixture
+def queries(fresh_db, monkeypatch):
+
+    # Record the data queries run; the coherence check's PRAGMA data_version
+    # and table_versions lookups are not reference-data reads
+    statements = []
+    get_connection = db_utils.get_connection
+
+    def traced_connection():
+        conn = get_connection()
+        conn.set_trace_callback(
+            lambda sql: None if sql.lstrip().startswith("PRAGMA") or "table_versions" in sql
+            else statements.append(sql)
+        )
+        return conn
+
+    monkeypatch.setattr(db_utils, "get_connection", traced_connection)
+    yield statements
+    db_utils.close_idle_connections()
+
+
+def test_repeated_reads_hit_database_once(queries):
+    student_id = db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    queries.clear()
+
+    def read_everything():
+        subjects = db_utils.get_subjects()
+        db_utils.get_subject_by_id(subjects[0]["id"])
+        db_utils.get_student_details(student_id)
+        db_utils.get_all_students()
+        db_utils.get_students_by_subject(subjects[0]["id"])
+        db_utils.get_student_enrolled_subjects(student_id)
+
+    read_everything()
+    first_render = len(queries)
+    assert first_render > 0
+
+    read_everything()
+    read_everything()
+    assert len(queries) == first_render
+
+def test_callers_cannot_modify_cached_values(queries):
+    student_id = db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    db_utils.get_student_details(student_id)["name"] = "Changed"
+    db_utils.get_all_students().clear()
+
+    assert db_utils.get_student_details(student_id)["name"] == "Student 1"
+    assert len(db_utils.get_all_students()) == 1
+
+
+def test_keyword_and_positional_calls_share_an_entry(queries):
+    student_id = db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    first = db_utils.get_student_attendance_summary(student_id, date_from="2025-01-01", date_to="2025-01-31")
+    queries.clear()
+
+    assert db_utils.get_student_attendance_summary(student_id, "2025-01-01", "2025-01-31") == first
+    assert db_utils.get_student_attendance_summary(date_to="2025-01-31", date_from="2025-01-01",
+                                                   student_id=student_id) == first
+    assert queries == []
+
+    # Defaults are part of the key: omitting them is the same call as passing None
+    db_utils.get_student_attendance_summary(student_id)
+    queries.clear()
+    db_utils.get_student_attendance_summary(student_id, None, date_to=None)
+    assert queries == []
+
+    with pytest.raises(TypeError):
+        db_utils.get_student_attendance_summary(student_id, unknown=1)
+
+
+def test_writes_invalidate_cached_reads(queries):
+    student_id = db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    assert db_utils.get_student_details(student_id)["name"] == "Student 1"
+    subject_ids = [subject["id"] for subject in db_utils.get_subjects()]
+
+    db_utils.update_student(student_id, name="Renamed", subject_ids=subject_ids[:1])
+    assert db_utils.get_student_details(student_id)["name"] == "Renamed"
+    assert [s["id"] for s in db_utils.get_student_enrolled_subjects(student_id)] == subject_ids[:1]
+
+    db_utils.enroll_student_in_all_subjects(student_id)
+    assert len(db_utils.get_student_enrolled_subjects(student_id)) == len(subject_ids)
+
+    second_id = db_utils.register_student("R02", "Student 2", "ENTC", "B.Tech", "B", "", [])
+    assert len(db_utils.get_students_by_subject(subject_ids[0])) == 2
+
+    db_utils.delete_student(second_id)
+    assert db_utils.get_student_details(second_id) is None
+    assert [s["id"] for s in db_utils.get_all_students()] == [student_id]
+
+
+def test_attendance_writes_invalidate_cached_reports(queries):
+    student_id = db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    subject_id = db_utils.get_subjects()[0]["id"]
+    assert db_utils.get_class_attendance_summary("2025-01-01", "2025-01-31")[0]["total_classes"] == 0
+
+    db_utils.mark_attendance_bulk(subject_id, "2025-01-06", "P1", {student_id: "present"}, notify=False)
+    assert db_utils.get_class_attendance_summary("2025-01-01", "2025-01-31")[0]["present_count"] == 1
+
+
+def test_commits_from_another_process_are_noticed(queries):
+    student_id = db_utils.register_student("R01", "Student 1", "ENTC", "B.Tech", "B", "", [])
+    subject_id = db_utils.get_subjects()[0]["id"]
+    assert db_utils.get_student_details(student_id)["name"] == "Student 1"
+    assert db_utils.get_class_attendance_summary("2025-01-06", "2025-01-06")[0]["total_classes"] == 0
+    queries.clear()
+
+    # Unchanged database: served from the cache
+    db_utils.get_student_details(student_id)
+    assert queries == []
+
+    # Another worker renames the student and saves attendance on its own connection
+    other = sqlite3.connect(db_utils.DB_PATH)
+    other.execute("UPDATE students SET name = 'Renamed' WHERE id = ?", (student_id,))
+    other.execute(
+        "INSERT INTO attendance (student_id, subject_id, date, period, status) VALUES (?, ?, '2025-01-06', 'P1', 'present')",
+        (student_id, subject_id)
+    )
+    other.commit()
+    other.close()
+
+    assert db_utils.get_student_details(student_id)["name"] == "Renamed"
+    assert db_utils.get_class_attendance_summary("2025-01-06", "2025-01-06")[0]["present_count"] == 1
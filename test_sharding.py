@@ -0,0 +1,129 @@
+"""
+Checks that per-division database shards keep each division's attendance
+apart, that users stay in the directory database and that the HOD summary
+reads every shard.
+"""
+import threading
+
+import pytest
+
+from utils import db_utils, auth_utils, migrations
+
+
+@pytest.fixture
+def shards(db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "SHARDING_ENABLED", True)
+    monkeypatch.setattr(db_utils, "SHARD_DIR", str(tmp_path / "shards"))
+    db_utils.init_db()
+    for division, count in (("A", 3), ("B", 2)):
+        db_utils.use_division("ENTC", division)
+        conn = db_utils.get_connection()
+        conn.executemany(
+            "INSERT INTO students (roll_no, name, department, division, image_path) VALUES (?, ?, 'ENTC', ?, '')",
+            [(f"{division}{i}", f"Student {division}{i}", division) for i in range(1, count + 1)]
+        )
+        conn.commit()
+        conn.close()
+    db_utils.use_division(None, None)
+    yield tmp_path
+    for path in db_utils.database_paths():
+        with db_utils.routed_to(path):
+            db_utils.close_idle_connections()
+    db_utils.use_division(None, None)
+
+
+def _mark_all(division, status):
+    db_utils.use_division("ENTC", division)
+    subject_id = db_utils.get_subjects()[0][0]
+    statuses = {student['id']: status for student in db_utils.get_all_students()}
+    assert db_utils.mark_attendance_bulk(subject_id, "2025-03-03", "P1", statuses, notify=False)
+
+
+def test_divisions_are_isolated(shards):
+    assert db_utils.use_division("ENTC", "A") == str(shards / "shards" / "ENTC_A.db")
+    assert [s['roll_no'] for s in db_utils.get_all_students()] == ["A1", "A2", "A3"]
+    db_utils.use_division("ENTC", "B")
+    assert [s['roll_no'] for s in db_utils.get_all_students()] == ["B1", "B2"]
+    assert [(d, v) for d, v, _ in db_utils.list_shards()] == [("ENTC", "A"), ("ENTC", "B")]
+    assert db_utils.list_shards("Mech") == []
+
+    # Routing is per thread
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(db_utils.current_db_path()))
+    thread.start()
+    thread.join()
+    assert seen == [db_utils.DB_PATH]
+
+
+def test_writers_in_different_divisions_do_not_block(shards):
+    db_utils.use_division("ENTC", "A")
+    holder = db_utils.get_connection()
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        # Division A's write lock is held; division B still commits at once
+        _mark_all("B", "present")
+    finally:
+        holder.rollback()
+        holder.close()
+    db_utils.use_division("ENTC", "A")
+    assert db_utils.get_class_attendance_summary("2025-03-01", "2025-03-31")[0]['total_classes'] == 0
+
+
+def test_college_summary_reads_every_shard(shards):
+    _mark_all("A", "absent")
+    _mark_all("B", "present")
+    db_utils.use_division(None, None)
+    summary = db_utils.get_college_attendance_summary("2025-03-01", "2025-03-31")
+    assert [(row['department'], row['division'], row['roll_no']) for row in summary] == \
+        [("ENTC", "A", "A1"), ("ENTC", "A", "A2"), ("ENTC", "A", "A3"), ("ENTC", "B", "B1"), ("ENTC", "B", "B2")]
+    assert [row['present_count'] for row in summary] == [0, 0, 0, 1, 1]
+    assert all(row['total_classes'] == 1 for row in summary)
+    assert db_utils.get_college_attendance_summary("2025-03-01", "2025-03-31", department="Mech") == []
+
+
+def test_college_summary_includes_attendance_from_before_sharding(shards):
+    # Students and attendance saved in DB_PATH before sharding was turned on
+    _mark_all("A", "present")
+    db_utils.use_division(None, None)
+    student_ids = [db_utils.register_student(roll_no, roll_no, department, "B.Tech", "A", "", [])
+                   for roll_no, department in (("OLD1", "ENTC"), ("OLD2", "Mech"))]
+    subject_id = db_utils.get_subjects()[0][0]
+    db_utils.mark_attendance_bulk(subject_id, "2025-03-03", "P1", dict.fromkeys(student_ids, "present"), notify=False)
+
+    summary = db_utils.get_college_attendance_summary("2025-03-01", "2025-03-31")
+    assert [(row['department'], row['roll_no'], row['present_count']) for row in summary[:3]] == \
+        [("ENTC", "OLD1", 1), ("Mech", "OLD2", 1), ("ENTC", "A1", 1)]
+    assert len(summary) == 7
+    assert [row['roll_no'] for row in db_utils.get_college_attendance_summary(
+        "2025-03-01", "2025-03-31", department="Mech")] == ["OLD2"]
+
+
+def test_users_stay_in_directory_database(shards):
+    db_utils.use_division("ENTC", "A")
+    assert auth_utils.create_user("teacher_a", "secret1", "Teacher", "Teacher A", division="A") == (True, None)
+    user = auth_utils.authenticate_user("teacher_a", "secret1")
+    assert user['division'] == "A"
+    assert auth_utils.authenticate_user("admin", "admin123")['division'] is None
+
+    with db_utils.get_db_connection(directory=True) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users WHERE username = 'teacher_a'").fetchone()[0] == 1
+
+    # Shards hold no users or recognition tables, but are at the same schema version
+    conn = db_utils.get_connection()
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    assert not tables & {"users", "recognition_jobs", "recognition_runs"}
+    assert {"students", "attendance", "class_sessions", "email_outbox"} <= tables
+    assert all(applied for _, _, applied in migrations.migration_status())
+
+
+def test_college_summary_uses_department_names_not_shard_file_names(shards):
+    db_utils.use_division("Computer Science", "A")
+    db_utils.register_student("CS1", "Student CS1", "Computer Science", "B.Tech", "A", "", [])
+    db_utils.use_division(None, None)
+    assert [d for d, _, _ in db_utils.list_shards("Computer Science")] == ["Computer-Science"]
+
+    for department in (None, "Computer Science"):
+        rows = [row for row in db_utils.get_college_attendance_summary("2025-03-01", "2025-03-31", department)
+                if row['roll_no'] == "CS1"]
+        assert [row['department'] for row in rows] == ["Computer Science"]
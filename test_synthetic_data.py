@@ -0,0 +1,83 @@
+"""
+Checks that the synthetic semester follows the configured timetable, is
+reproducible from its seed, and that the benchmark suite covers db_utils and
+flags regressions.
+"""
+import csv
+from collections import Counter
+
+import pytest
+
+from config import SUBJECT_WEEKLY_CLASSES
+from utils import db_utils, synthetic_data, db_benchmark
+
+
+@pytest.fixture
+def db(fresh_db, tmp_path):
+    return tmp_path
+
+
+def read_attendance(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_timetable_matches_weekly_classes():
+    timetable = synthetic_data.build_timetable(synthetic_data.random.Random(1))
+    assert {code: len(slots) for code, slots in timetable.items()} == \
+        {code: SUBJECT_WEEKLY_CLASSES.get(code, 0) for code in timetable}
+    # No two subjects share a slot
+    slots = [slot for subject_slots in timetable.values() for slot in subject_slots]
+    assert len(slots) == len(set(slots))
+
+
+def test_same_seed_gives_same_semester(tmp_path):
+    first = synthetic_data.generate_dataset(str(tmp_path / "a"), students=20, weeks=4, seed=7)
+    second = synthetic_data.generate_dataset(str(tmp_path / "b"), students=20, weeks=4, seed=7)
+    assert read_attendance(first['paths']['attendance']) == read_attendance(second['paths']['attendance'])
+
+    rows = read_attendance(first['paths']['attendance'])
+    assert len(rows) == first['attendance_rows'] == first['classes'] * 20
+    # A class is held at most once per (subject, date, period)
+    assert max(Counter((r['subject_id'], r['date'], r['period'], r['student_id']) for r in rows).values()) == 1
+
+
+def test_absence_patterns_shape_attendance(tmp_path):
+    rates = {}
+    for pattern in ("steady", "chronic"):
+        dataset = synthetic_data.generate_dataset(str(tmp_path / pattern), students=40, weeks=6, pattern=pattern)
+        rows = read_attendance(dataset['paths']['attendance'])
+        rates[pattern] = sum(r['status'] == 'present' for r in rows) / len(rows)
+    assert rates["steady"] > 0.85
+    assert rates["chronic"] < rates["steady"] - 0.1
+
+
+def test_loaded_semester_matches_generated_data(db):
+    dataset = synthetic_data.load_synthetic_semester(students=25, weeks=3)
+    assert len(db_utils.get_all_students()) == 25
+    summary = db_utils.get_class_attendance_summary(dataset['date_from'], dataset['date_to'])
+    assert sum(row['total_classes'] for row in summary) == dataset['attendance_rows']
+    assert db_utils.count_held_classes(dataset['date_from'], dataset['date_to']) == dataset['classes']
+
+
+def test_benchmarks_cover_db_utils():
+    assert db_benchmark.uncovered_functions() == []
+
+
+def test_benchmark_run_and_comparison(db):
+    only = ["get_class_attendance_summary", "mark_attendance_bulk", "register_student", "delete_student"]
+    report = db_benchmark.run_scale(10, weeks=2, repeat=2, only=only)
+    assert set(report['results']) == set(only)
+    assert all(result['median_ms'] > 0 for result in report['results'].values())
+    # The benchmark ran on a scratch database; the configured one is restored
+    assert db_utils.DB_PATH == str(db / "attendance.db")
+    assert db_utils.get_all_students() == []
+
+    baseline = {'scales': {'10': report}}
+    slower = {'scales': {'10': {'results': {
+        name: dict(result, median_ms=result['median_ms'] * 3 + 5) for name, result in report['results'].items()
+    }}}}
+    comparison = db_benchmark.compare_reports(baseline, slower)
+    assert len(comparison) == len(only)
+    assert all(row['regressed'] for row in comparison)
+    assert not any(row['regressed'] for row in db_benchmark.compare_reports(baseline, baseline))
@@ -0,0 +1,317 @@
+"""
+In-memory attendance cube for the report pages.
+
+The cube holds every student's status in every class held as one int8 matrix
+(students x classes; a class is a subject/date/period) with the class's
+subject and date as coordinates, so "student x subject x class" slices by
+date range and subject are NumPy masks and reductions. It is loaded once per
+process and database (each division shard has its own) and kept current
+without reloading:
+
+- attendance saved through db_utils in this process is applied as it is
+  committed (db_utils.add_attendance_listener)
+- anything else (other processes, registrations, bulk loads, archiving) is
+  noticed by comparing the table_versions counters and reloads the cube
+
+Class Reports and Student Reports take their tables and charts from it
+instead of querying and looping per cell.
+"""
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils import db_utils
+
+logger = logging.getLogger(__name__)
+
+# Status codes stored in the cube
+NOT_MARKED, ABSENT, PRESENT = 0, 1, 2
+STATUS_CODES = {'absent': ABSENT, 'present': PRESENT}
+STATUS_NAMES = np.array([None, 'absent', 'present'], dtype=object)
+
+# Tables whose counters must match for the cube to be current
+CUBE_TABLES = ('students', 'subjects', 'student_subjects', 'attendance')
+
+
+class AttendanceCube:
+    """
+    Student x class attendance statuses with student, subject and class coordinates
+
+    Attributes:
+        student_ids, roll_nos, names, divisions: One entry per student, by id
+        subject_ids, subject_codes, subject_names: One entry per subject, by id
+        enrolled: (students x subjects) enrolment flags
+        class_subjects, class_dates, class_periods: One entry per class held
+            (subject position, datetime64[D], period label), in the order loaded
+        statuses: (students x classes) NOT_MARKED, ABSENT or PRESENT
+        versions: table_versions counters of CUBE_TABLES the cube reflects
+        db_path: Database the cube was loaded from
+
+    apply() grows and writes the class arrays in place, so the readers slice
+    them while holding the same lock.
+    """
+
+    def __init__(self, versions: Dict[str, int], students: List[tuple], subjects: List[tuple],
+                 enrolments: List[tuple], classes: List[tuple], marks: List[tuple]):
+        self.versions = versions
+        self.db_path = db_utils.current_db_path()
+        self._lock = threading.Lock()
+
+        columns = list(zip(*students)) or [(), (), (), ()]
+        self.student_ids = np.array(columns[0], dtype=np.int64)
+        self.roll_nos = np.array(columns[1], dtype=object)
+        self.names = np.array(columns[2], dtype=object)
+        self.divisions = np.array(columns[3], dtype=object)
+        # Report order (by roll number, like the SQL readers)
+        self.roll_order = np.argsort(self.roll_nos.astype(str), kind='stable')
+
+        columns = list(zip(*subjects)) or [(), (), ()]
+        self.subject_ids = np.array(columns[0], dtype=np.int64)
+        self.subject_codes = np.array(columns[1], dtype=object)
+        self.subject_names = np.array(columns[2], dtype=object)
+
+        self.enrolled = np.zeros((len(self.student_ids), len(self.subject_ids)), dtype=bool)
+        if enrolments:
+            student_ids, subject_ids = (np.array(column, dtype=np.int64) for column in zip(*enrolments))
+            rows, known_rows = self._positions(self.student_ids, student_ids)
+            cols, known_cols = self._positions(self.subject_ids, subject_ids)
+            known = known_rows & known_cols
+            self.enrolled[rows[known], cols[known]] = True
+
+        # Classes and statuses grow in place as attendance is saved
+        count = len(classes)
+        capacity = max(16, count * 2)
+        self._class_index = {}
+        self.class_subjects = np.zeros(capacity, dtype=np.int64)
+        self.class_dates = np.zeros(capacity, dtype='datetime64[D]')
+        self.class_periods = np.empty(capacity, dtype=object)
+        self.statuses = np.zeros((len(self.student_ids), capacity), dtype=np.int8)
+        self.class_count = 0
+        for subject_id, date, period in classes:
+            self._add_class(subject_id, date, period)
+
+        if marks:
+            student_ids, positions, codes = (np.array(column, dtype=np.int64) for column in zip(*marks))
+            rows, known = self._positions(self.student_ids, student_ids)
+            self.statuses[rows[known], positions[known]] = codes[known]
+
+    @classmethod
+    def load(cls) -> 'AttendanceCube':
+        """Load the cube from the database, archived terms included"""
+        conn = db_utils.get_connection()
+        conn.row_factory = None
+        try:
+            attendance = db_utils._partition(conn, 'attendance')
+            conn.execute("BEGIN")
+            versions = dict(conn.execute(
+                f"SELECT table_name, version FROM table_versions WHERE table_name IN ({', '.join('?' * len(CUBE_TABLES))})",
+                CUBE_TABLES
+            ).fetchall())
+            students = conn.execute("SELECT id, roll_no, name, division FROM students ORDER BY id").fetchall()
+            subjects = conn.execute("SELECT id, code, name FROM subjects ORDER BY id").fetchall()
+            enrolments = conn.execute("SELECT student_id, subject_id FROM student_subjects").fetchall()
+            classes = conn.execute(f'''
+                SELECT DISTINCT subject_id, date, period FROM {attendance}
+                ORDER BY date, period, subject_id
+            ''').fetchall()
+            # Class positions are numbered in the same order as the classes above
+            marks = conn.execute(f'''
+                WITH classes AS (
+                    SELECT subject_id, date, period,
+                           ROW_NUMBER() OVER (ORDER BY date, period, subject_id) - 1 AS position
+                    FROM (SELECT DISTINCT subject_id, date, period FROM {attendance})
+                )
+                SELECT a.student_id, c.position, CASE WHEN a.status = 'present' THEN {PRESENT} ELSE {ABSENT} END
+                FROM {attendance} a
+                JOIN classes c ON c.subject_id = a.subject_id AND c.date = a.date AND c.period = a.period
+            ''').fetchall()
+        finally:
+            conn.close()
+        return cls(versions, students, subjects, enrolments, classes, marks)
+
+    @staticmethod
+    def _positions(sorted_ids: np.ndarray, ids: np.ndarray):
+        """Positions of ids in a sorted id array, and which ids were found"""
+        if not len(sorted_ids):
+            return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return positions, sorted_ids[positions] == ids
+
+    def _add_class(self, subject_id, date, period) -> int:
+        """Position of a class, appending it if it is new"""
+        key = (int(subject_id), str(date), period)
+        position = self._class_index.get(key)
+        if position is not None:
+            return position
+        subject_pos, known = self._positions(self.subject_ids, np.array([key[0]], dtype=np.int64))
+        if not known[0]:
+            raise KeyError(f"Unknown subject_id={subject_id}")
+        if self.class_count == len(self.class_subjects):
+            grow = len(self.class_subjects)
+            self.class_subjects = np.concatenate([self.class_subjects, np.zeros(grow, dtype=np.int64)])
+            self.class_dates = np.concatenate([self.class_dates, np.zeros(grow, dtype='datetime64[D]')])
+            self.class_periods = np.concatenate([self.class_periods, np.empty(grow, dtype=object)])
+            self.statuses = np.concatenate(
+                [self.statuses, np.zeros((len(self.student_ids), grow), dtype=np.int8)], axis=1)
+        position = self.class_count
+        self.class_subjects[position] = subject_pos[0]
+        self.class_dates[position] = np.datetime64(key[1])
+        self.class_periods[position] = period
+        self._class_index[key] = position
+        self.class_count += 1
+        return position
+
+    def apply(self, change: Dict) -> bool:
+        """
+        Apply an attendance write reported by db_utils
+
+        Returns:
+            True if the cube now reflects the write, False if it has to be reloaded
+        """
+        before = {table: change['versions_before'].get(table) for table in CUBE_TABLES}
+        after = {table: change['versions_after'].get(table) for table in CUBE_TABLES}
+        with self._lock:
+            if self.versions == after:
+                return True  # already loaded with this write
+            if self.versions != before:
+                return False
+            student_ids = np.array(list(change['statuses']), dtype=np.int64)
+            rows, known = self._positions(self.student_ids, student_ids)
+            if not known.all():
+                return False
+            try:
+                position = self._add_class(change['subject_id'], change['date'], change['period'])
+            except KeyError:
+                return False
+            self.statuses[rows, position] = [STATUS_CODES.get(status, ABSENT) for status in change['statuses'].values()]
+            self.versions = after
+        return True
+
+    def class_mask(self, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                   subject_id: Optional[int] = None) -> np.ndarray:
+        """Boolean mask over the classes held, for a date range and/or subject (call with _lock held)"""
+        dates = self.class_dates[:self.class_count]
+        mask = np.ones(self.class_count, dtype=bool)
+        if date_from:
+            mask &= dates >= np.datetime64(date_from)
+        if date_to:
+            mask &= dates <= np.datetime64(date_to)
+        if subject_id is not None:
+            subject_pos, known = self._positions(self.subject_ids, np.array([subject_id], dtype=np.int64))
+            mask &= self.class_subjects[:self.class_count] == subject_pos[0] if known[0] else False
+        return mask
+
+    def _counts(self, statuses: np.ndarray):
+        return (statuses == PRESENT).sum(axis=1), (statuses != NOT_MARKED).sum(axis=1)
+
+    def class_summary(self, date_from: str, date_to: str) -> List[Dict]:
+        """Same rows as db_utils.get_class_attendance_summary"""
+        with self._lock:
+            statuses = self.statuses[:, :self.class_count][:, self.class_mask(date_from, date_to)]
+        present, total = self._counts(statuses)
+        return [{'id': int(self.student_ids[i]), 'roll_no': self.roll_nos[i], 'name': self.names[i],
+                 'division': self.divisions[i], 'present_count': int(present[i]), 'total_classes': int(total[i])}
+                for i in self.roll_order]
+
+    def subject_summary(self, date_from: str, date_to: str):
+        """
+        Present and marked counts per student and subject
+
+        Returns:
+            (present, total) arrays of shape (students x subjects), rows in
+            student_ids order and columns in subject_ids order
+        """
+        with self._lock:
+            mask = self.class_mask(date_from, date_to)
+            statuses = self.statuses[:, :self.class_count][:, mask]
+            subjects = self.class_subjects[:self.class_count][mask]
+        one_hot = np.zeros((len(subjects), len(self.subject_ids)), dtype=np.int64)
+        one_hot[np.arange(len(subjects)), subjects] = 1
+        return (statuses == PRESENT).astype(np.int64) @ one_hot, (statuses != NOT_MARKED).astype(np.int64) @ one_hot
+
+    def subject_matrix(self, subject_id: int, date_from: str, date_to: str):
+        """Same DataFrame as db_utils.get_subject_attendance_matrix"""
+        import pandas as pd
+
+        subject_pos, known = self._positions(self.subject_ids, np.array([subject_id], dtype=np.int64))
+        roster = self.roll_order[self.enrolled[self.roll_order, subject_pos[0]]] if known[0] else self.roll_order[:0]
+        index = pd.MultiIndex.from_arrays(
+            [self.student_ids[roster], self.roll_nos[roster], self.names[roster]], names=["student_id", "roll_no", "name"]
+        )
+        with self._lock:
+            classes = np.flatnonzero(self.class_mask(date_from, date_to, subject_id))
+            classes = classes[np.lexsort((self.class_periods[classes].astype(str), self.class_dates[classes]))]
+            dates = self.class_dates[classes]
+            periods = self.class_periods[classes]
+            statuses = self.statuses[np.ix_(roster, classes)]
+        columns = pd.MultiIndex.from_arrays(
+            [np.datetime_as_string(dates, unit='D').astype(object), periods], names=["date", "period"]
+        )
+        return pd.DataFrame(STATUS_NAMES[statuses], index=index, columns=columns, dtype=object)
+
+    def student_days(self, student_id: int, date_from: Optional[str] = None, date_to: Optional[str] = None):
+        """
+        A student's attendance per day they were marked
+
+        Returns:
+            pandas Series indexed by date with "present" (all classes attended),
+            "absent" (none) or "mixed"
+        """
+        import pandas as pd
+
+        row, known = self._positions(self.student_ids, np.array([student_id], dtype=np.int64))
+        if not known[0]:
+            return pd.Series([], index=pd.DatetimeIndex([]), dtype=object)
+        with self._lock:
+            statuses = self.statuses[row[0], :self.class_count].copy()
+            marked = self.class_mask(date_from, date_to) & (statuses != NOT_MARKED)
+            dates = self.class_dates[:self.class_count][marked]
+        days, day_of_class = np.unique(dates, return_inverse=True)
+        present = np.bincount(day_of_class, weights=statuses[marked] == PRESENT, minlength=len(days))
+        total = np.bincount(day_of_class, minlength=len(days))
+        status = np.where(present == total, "present", np.where(present == 0, "absent", "mixed"))
+        return pd.Series(status.astype(object), index=pd.DatetimeIndex(days))
+
+
+# Cubes by database path (one per division shard when sharding is enabled)
+_cubes: Dict[str, 'AttendanceCube'] = {}
+_cube_lock = threading.Lock()
+_listening = False
+
+
+def _current_versions() -> Dict[str, int]:
+    conn = db_utils.get_connection()
+    try:
+        rows = conn.execute(
+            f"SELECT table_name, version FROM table_versions WHERE table_name IN ({', '.join('?' * len(CUBE_TABLES))})",
+            CUBE_TABLES
+        ).fetchall()
+        return {row['table_name']: row['version'] for row in rows}
+    finally:
+        conn.close()
+
+
+def _on_attendance_write(change: Dict):
+    cube = _cubes.get(change['db_path'])
+    if cube is not None and not cube.apply(change):
+        logger.debug("Attendance cube out of step with the database; reloading on next use")
+
+
+def get_cube() -> AttendanceCube:
+    """
+    The attendance cube of the thread's database, loaded on first use and
+    reloaded when the database changed in ways it could not follow
+    """
+    global _listening
+    with _cube_lock:
+        if not _listening:
+            db_utils.add_attendance_listener(_on_attendance_write)
+            _listening = True
+        cube = _cubes.get(db_utils.current_db_path())
+        if cube is None or cube.versions != _current_versions():
+            cube = AttendanceCube.load()
+            _cubes[cube.db_path] = cube
+            logger.info(f"Loaded attendance cube: {len(cube.student_ids)} students x {cube.class_count} classes")
+        return cube
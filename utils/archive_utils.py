@@ -0,0 +1,254 @@
+"""
+Per-term archival of attendance history.
+
+Closing a term moves its attendance, class sessions and summary rows out of
+the live tables into tables of their own (``attendance_<term>``,
+``class_sessions_<term>``, ``attendance_daily_<term>``,
+``attendance_weekly_<term>``) in an archive database next to the main one
+(``attendance_archive.db``). The term is then listed in ``attendance_terms``.
+
+The live tables and their indexes therefore only hold the terms still open.
+Report readers in db_utils add an archived term's tables to a query only when
+its date range reaches into that term (see ``db_utils._partition``), and
+attendance for archived dates cannot be changed until the term is restored.
+
+Archiving runs in two steps: the rows are copied into the archive and that
+commit is made durable first, then they are deleted from the live tables in a
+second transaction. A crash in between leaves unreferenced archive tables,
+which the next attempt replaces.
+
+    python -m utils.archive_utils archive 2025-odd 2025-07-01 2025-11-30
+    python -m utils.archive_utils list
+    python -m utils.archive_utils restore 2025-odd
+    python -m utils.archive_utils --department ENTC --division A list   # a division shard
+"""
+import re
+import sqlite3
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from utils import db_utils
+from utils.bulk_loader import _DEFERRED_TRIGGERS_SQL
+
+logger = logging.getLogger(__name__)
+
+# Archived tables: (live table, date column)
+ARCHIVED_TABLES = (
+    ('attendance', 'date'),
+    ('class_sessions', 'date'),
+    ('attendance_daily', 'date'),
+)
+
+# Indexes created on each term's archive tables, as (table, columns)
+_ARCHIVE_INDEXES = (
+    ('attendance', 'subject_id, date'),
+    ('attendance', 'student_id, date'),
+    ('attendance', 'session_id, status'),
+    ('class_sessions', 'date, subject_id'),
+    ('attendance_daily', 'date, student_id'),
+    ('attendance_weekly', 'week_start, student_id'),
+)
+
+_TERM_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]*$')
+
+
+def _suffix(term: str) -> str:
+    return term.lower().replace('-', '_')
+
+
+def _connect() -> sqlite3.Connection:
+    """Plain connection with the archive attached (created if missing)"""
+    conn = sqlite3.connect(db_utils.current_db_path(), timeout=db_utils.DB_BUSY_TIMEOUT, isolation_level=None)
+    conn.execute("ATTACH DATABASE ? AS archive", (db_utils.archive_db_path(),))
+    return conn
+
+
+def _drop_archive_tables(cursor, suffix: str):
+    for table, _ in ARCHIVED_TABLES + (('attendance_weekly', 'week_start'),):
+        cursor.execute(f"DROP TABLE IF EXISTS archive.{table}_{suffix}")
+
+
+def _replace_live_rows(cursor, date_from: str, date_to: str, copy_back: Optional[str] = None) -> Dict[str, int]:
+    """
+    Delete the live attendance and class sessions in a date range (optionally
+    copying them back from a term's archive tables first) and bring the
+    summary tables up to date, with the per-row triggers out of the way
+    """
+    triggers = cursor.execute(_DEFERRED_TRIGGERS_SQL).fetchall()
+    for name, _ in triggers:
+        cursor.execute(f'DROP TRIGGER "{name}"')
+
+    counts = {}
+    for table in ('attendance', 'class_sessions'):
+        cursor.execute(f"DELETE FROM main.{table} WHERE date BETWEEN ? AND ?", (date_from, date_to))
+        counts[table] = cursor.rowcount
+    if copy_back:
+        # Sessions first: attendance rows reference them
+        for table in ('class_sessions', 'attendance'):
+            columns = db_utils._PARTITION_COLUMNS[table]
+            cursor.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM archive.{table}_{copy_back}")
+            counts[table] = cursor.rowcount
+
+    db_utils._rebuild_attendance_summaries(cursor, date_from, date_to)
+    for _, sql in triggers:
+        cursor.execute(sql)
+    cursor.execute("UPDATE table_versions SET version = version + 1 WHERE table_name IN ('attendance', 'class_sessions')")
+    return counts
+
+
+def archive_term(term: str, date_from: str, date_to: str, allow_open: bool = False) -> Optional[Dict]:
+    """
+    Move a closed term's attendance into the archive
+
+    Args:
+        term: Term name (letters, digits, '-' and '_'), e.g. "2025-odd"
+        date_from: First day of the term (YYYY-MM-DD)
+        date_to: Last day of the term (YYYY-MM-DD)
+        allow_open: Archive even if the term has not ended yet
+
+    Returns:
+        The new attendance_terms entry, or None if nothing was archived
+    """
+    if not _TERM_NAME.match(term):
+        logger.error(f"Invalid term name '{term}'")
+        return None
+    try:
+        if date.fromisoformat(date_from) > date.fromisoformat(date_to):
+            raise ValueError("term ends before it starts")
+        if not allow_open and date.fromisoformat(date_to) >= date.today():
+            raise ValueError("term has not ended yet")
+    except ValueError as e:
+        logger.error(f"Cannot archive {term} ({date_from} to {date_to}): {str(e)}")
+        return None
+    for existing in db_utils.get_archived_terms():
+        if existing['term'] == term or (existing['date_from'] <= date_to and existing['date_to'] >= date_from):
+            logger.error(f"Cannot archive {term}: overlaps archived term {existing['term']}")
+            return None
+
+    suffix = _suffix(term)
+    conn = _connect()
+    cursor = conn.cursor()
+    try:
+        # 1. Copy the term into its own archive tables and make that durable
+        cursor.execute("BEGIN IMMEDIATE")
+        _drop_archive_tables(cursor, suffix)
+        copied = {}
+        for table, date_column in ARCHIVED_TABLES:
+            cursor.execute(f'''
+                CREATE TABLE archive.{table}_{suffix} AS
+                SELECT {db_utils._PARTITION_COLUMNS[table]} FROM main.{table} WHERE {date_column} BETWEEN ? AND ?
+            ''', (date_from, date_to))
+            copied[table] = cursor.execute(f"SELECT COUNT(*) FROM archive.{table}_{suffix}").fetchone()[0]
+        # The term's share of each week; weeks crossing the term's edges are split with the live table
+        cursor.execute(f'''
+            CREATE TABLE archive.attendance_weekly_{suffix} AS
+            SELECT student_id, {db_utils._WEEK_START_SQL.format('date')} AS week_start, subject_id,
+                   SUM(present_count) AS present_count, SUM(total_count) AS total_count
+            FROM archive.attendance_daily_{suffix}
+            GROUP BY 1, 2, 3
+        ''')
+        for table, columns in _ARCHIVE_INDEXES:
+            name = f"idx_{table}_{suffix}_{columns.split(',')[0]}"
+            cursor.execute(f"CREATE INDEX archive.{name} ON {table}_{suffix} ({columns})")
+        cursor.execute("COMMIT")
+
+        # 2. Remove the archived rows from the live tables and register the term
+        cursor.execute("BEGIN IMMEDIATE")
+        deleted = _replace_live_rows(cursor, date_from, date_to)
+        for table in ('attendance', 'class_sessions'):
+            if deleted[table] != copied[table]:
+                raise RuntimeError(f"{table}: copied {copied[table]} rows but {deleted[table]} matched for deletion")
+        archived_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute('''
+            INSERT INTO attendance_terms (term, date_from, date_to, table_suffix, attendance_rows, session_rows, archived_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (term, date_from, date_to, suffix, copied['attendance'], copied['class_sessions'], archived_at))
+        cursor.execute("COMMIT")
+    except Exception as e:
+        logger.error(f"Archiving term {term} failed: {str(e)}")
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        return None
+    finally:
+        conn.close()
+
+    # Pooled connections see the change through table_versions; drop this process's cache now
+    db_utils.invalidate_reference_cache()
+    logger.info(f"Archived term {term} ({date_from} to {date_to}): {copied['attendance']} attendance records, "
+                f"{copied['class_sessions']} class sessions")
+    return {
+        'term': term, 'date_from': date_from, 'date_to': date_to, 'table_suffix': suffix,
+        'attendance_rows': copied['attendance'], 'session_rows': copied['class_sessions'], 'archived_at': archived_at
+    }
+
+
+def restore_term(term: str) -> bool:
+    """
+    Move an archived term back into the live tables (e.g. to correct its attendance)
+
+    Returns:
+        True if the term was restored, False otherwise
+    """
+    entry = next((t for t in db_utils.get_archived_terms() if t['term'] == term), None)
+    if entry is None:
+        logger.error(f"Term {term} is not archived")
+        return False
+
+    conn = _connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        restored = _replace_live_rows(cursor, entry['date_from'], entry['date_to'], copy_back=entry['table_suffix'])
+        if restored['attendance'] != entry['attendance_rows']:
+            raise RuntimeError(f"archive holds {restored['attendance']} attendance records, "
+                               f"expected {entry['attendance_rows']}")
+        cursor.execute("DELETE FROM attendance_terms WHERE term = ?", (term,))
+        _drop_archive_tables(cursor, entry['table_suffix'])
+        cursor.execute("COMMIT")
+    except Exception as e:
+        logger.error(f"Restoring term {term} failed: {str(e)}")
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        return False
+    finally:
+        conn.close()
+
+    db_utils.invalidate_reference_cache()
+    logger.info(f"Restored term {term}: {restored['attendance']} attendance records back in the live tables")
+    return True
+
+
+def list_terms() -> List[Dict]:
+    """Archived terms, oldest first"""
+    return db_utils.get_archived_terms()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    argv = sys.argv[1:]
+    # --department/--division select a division shard (SHARDING_ENABLED); the default is DB_PATH
+    options = {}
+    while argv[:1] in (["--department"], ["--division"]) and len(argv) > 1:
+        options[argv[0][2:]] = argv[1]
+        argv = argv[2:]
+    if options.get('division') and not (options.get('department') and db_utils.SHARDING_ENABLED):
+        print("--division needs --department and SHARDING_ENABLED")
+        sys.exit(2)
+    db_utils.use_division(options.get('department'), options.get('division'))
+    db_utils.init_db()
+    command = argv[0] if argv else "list"
+    if command == "archive" and len(argv) == 4:
+        sys.exit(0 if archive_term(*argv[1:4]) else 1)
+    elif command == "restore" and len(argv) == 2:
+        sys.exit(0 if restore_term(argv[1]) else 1)
+    elif command == "list":
+        for entry in list_terms():
+            print(f"{entry['term']:16s} {entry['date_from']} to {entry['date_to']}  "
+                  f"{entry['attendance_rows']:>10} records  archived {entry['archived_at']}")
+    else:
+        print(__doc__)
+        sys.exit(2)
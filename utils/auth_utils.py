@@ -6,7 +6,7 @@ import hashlib
 import logging
 from datetime import datetime
 from typing import Optional, Dict, Tuple
-from utils.db_utils import get_connection, get_db_connection
+from utils.db_utils import get_db_connection
 
 logger = logging.getLogger(__name__)
 
@@ -70,10 +70,10 @@ def authenticate_user(username: str, password: str) -> Optional[Dict]:
         User dictionary if authentication successful, None otherwise
     """
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(directory=True) as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, username, password_hash, role, name, email, department, is_active
+                SELECT id, username, password_hash, role, name, email, department, division, is_active
                 FROM users
                 WHERE username = ? AND is_active = 1
             ''', (username,))
@@ -104,6 +104,7 @@ def authenticate_user(username: str, password: str) -> Optional[Dict]:
                 'name': user['name'],
                 'email': user['email'],
                 'department': user['department'],
+                'division': user['division'],
                 'permissions': ROLES.get(user['role'], {}).get('permissions', [])
             }
             
@@ -116,7 +117,8 @@ def authenticate_user(username: str, password: str) -> Optional[Dict]:
 
 
 def create_user(username: str, password: str, role: str, name: str, 
-                email: Optional[str] = None, department: str = 'ENTC') -> Tuple[bool, Optional[str]]:
+                email: Optional[str] = None, department: str = 'ENTC',
+                division: Optional[str] = None) -> Tuple[bool, Optional[str]]:
     """
     Create a new user.
     
@@ -127,6 +129,8 @@ def create_user(username: str, password: str, role: str, name: str,
         name: Full name
         email: Email address (optional)
         department: Department name
+        division: Division the user works in (None for the whole department);
+            picks the user's database when sharding is enabled
         
     Returns:
         Tuple of (success, error_message)
@@ -135,7 +139,7 @@ def create_user(username: str, password: str, role: str, name: str,
         return False, f"Invalid role. Must be one of: {', '.join(ROLES.keys())}"
     
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(directory=True) as conn:
             cursor = conn.cursor()
             
             # Check if username already exists
@@ -148,9 +152,9 @@ def create_user(username: str, password: str, role: str, name: str,
             
             # Insert user
             cursor.execute('''
-                INSERT INTO users (username, password_hash, role, name, email, department)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (username, password_hash, role, name, email, department))
+                INSERT INTO users (username, password_hash, role, name, email, department, division)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (username, password_hash, role, name, email, department, division or None))
             
             logger.info(f"User '{username}' created successfully with role '{role}'")
             return True, None
@@ -173,7 +177,7 @@ def update_user_password(user_id: int, old_password: str, new_password: str) ->
         Tuple of (success, error_message)
     """
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(directory=True) as conn:
             cursor = conn.cursor()
             
             # Get current password hash
@@ -206,10 +210,10 @@ def update_user_password(user_id: int, old_password: str, new_password: str) ->
 def get_user_by_id(user_id: int) -> Optional[Dict]:
     """Get user information by ID"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(directory=True) as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, username, role, name, email, department, is_active, last_login
+                SELECT id, username, role, name, email, department, division, is_active, last_login
                 FROM users
                 WHERE id = ?
             ''', (user_id,))
@@ -223,6 +227,7 @@ def get_user_by_id(user_id: int) -> Optional[Dict]:
                     'name': user['name'],
                     'email': user['email'],
                     'department': user['department'],
+                    'division': user['division'],
                     'is_active': bool(user['is_active']),
                     'last_login': user['last_login'],
                     'permissions': ROLES.get(user['role'], {}).get('permissions', [])
@@ -236,10 +241,10 @@ def get_user_by_id(user_id: int) -> Optional[Dict]:
 def get_all_users() -> list:
     """Get all users (for admin management)"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(directory=True) as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, username, role, name, email, department, is_active, last_login, created_at
+                SELECT id, username, role, name, email, department, division, is_active, last_login, created_at
                 FROM users
                 ORDER BY role, username
             ''')
@@ -253,6 +258,7 @@ def get_all_users() -> list:
                     'name': row['name'],
                     'email': row['email'],
                     'department': row['department'],
+                    'division': row['division'],
                     'is_active': bool(row['is_active']),
                     'last_login': row['last_login'],
                     'created_at': row['created_at']
@@ -0,0 +1,393 @@
+"""
+Online backups of the attendance database.
+
+Snapshots are taken with SQLite's backup API, BACKUP_PAGES_PER_STEP pages at
+a time with a BACKUP_STEP_SLEEP pause between steps. Each step only holds a
+read lock on the live database briefly, and in WAL mode it does not block
+writers at all, so teachers can keep saving attendance while a backup runs.
+Safe to schedule during class hours.
+
+Every snapshot is written to a ``.partial`` file and checked with
+``PRAGMA quick_check`` (or ``integrity_check``). Only then is it renamed to
+``attendance-YYYYmmdd-HHMMSS.db`` in BACKUP_DIR. With SHARDING_ENABLED each
+division shard gets its own snapshot with the same timestamp, named after
+the shard (``attendance-ENTC_A-YYYYmmdd-HHMMSS.db``). The newest
+BACKUP_RETENTION_COUNT snapshots of each database are kept.
+
+Restoring copies a verified snapshot back over the database it was taken of
+with the same API in a single step. That holds the write lock only for the
+copy and leaves the database file, WAL and open connections in place.
+
+    python -m utils.backup_utils backup
+    python -m utils.backup_utils list
+    python -m utils.backup_utils verify <snapshot>
+    python -m utils.backup_utils restore <snapshot>
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from utils import db_utils
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import (
+        BACKUP_DIR,
+        BACKUP_PAGES_PER_STEP,
+        BACKUP_STEP_SLEEP,
+        BACKUP_RETENTION_COUNT,
+        BACKUP_INTERVAL_HOURS,
+        BACKUP_VERIFY
+    )
+    BACKUP_DIR = str(BACKUP_DIR)
+except ImportError:
+    BACKUP_DIR = os.path.join("db", "backups")
+    BACKUP_PAGES_PER_STEP = 256
+    BACKUP_STEP_SLEEP = 0.05
+    BACKUP_RETENTION_COUNT = 14
+    BACKUP_INTERVAL_HOURS = 0
+    BACKUP_VERIFY = "quick"
+
+SNAPSHOT_PREFIX = "attendance-"
+SNAPSHOT_SUFFIX = ".db"
+# Timestamp at the end of every snapshot name
+STAMP_FORMAT = "%Y%m%d-%H%M%S"
+STAMP_LENGTH = len("YYYYmmdd-HHMMSS")
+
+
+def _shard_label(db_path: str) -> Optional[str]:
+    """Name a database's snapshots carry: None for DB_PATH, else the shard file's name (e.g. "ENTC_A")"""
+    if os.path.abspath(db_path) == os.path.abspath(db_utils.DB_PATH):
+        return None
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def _snapshot_db_path(shard: Optional[str]) -> str:
+    """Database a snapshot with this shard label was taken of"""
+    return db_utils.DB_PATH if shard is None else os.path.join(db_utils.SHARD_DIR, shard + SNAPSHOT_SUFFIX)
+
+
+def _parse_snapshot_name(name: str):
+    """(shard label, created_at) of a snapshot file name, or None if it is not one"""
+    if not (name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)):
+        return None
+    body = name[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)]
+    label, stamp = body[:-STAMP_LENGTH], body[-STAMP_LENGTH:]
+    if label and not (label.endswith("-") and len(label) > 1):
+        return None
+    try:
+        created_at = datetime.strptime(stamp, STAMP_FORMAT)
+    except ValueError:
+        return None
+    return label[:-1] or None, created_at
+
+
+def verify_snapshot(path: str, full: Optional[bool] = None) -> bool:
+    """
+    Check a snapshot's integrity
+
+    Args:
+        path: Snapshot file
+        full: Run integrity_check instead of quick_check (defaults to BACKUP_VERIFY)
+
+    Returns:
+        True if SQLite reports the file as ok
+    """
+    if full is None:
+        full = BACKUP_VERIFY == "integrity"
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            result = conn.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Could not verify snapshot {path}: {str(e)}")
+        return False
+    ok = len(result) == 1 and result[0][0] == "ok"
+    if not ok:
+        logger.error(f"Snapshot {path} failed verification: {'; '.join(row[0] for row in result[:5])}")
+    return ok
+
+
+def _copy_database(source: sqlite3.Connection, target: sqlite3.Connection, pages: int, step_sleep: float):
+    """Copy source into target with the backup API, pausing between steps"""
+    def progress(status, remaining, total):
+        if remaining and step_sleep > 0:
+            time.sleep(step_sleep)
+
+    source.backup(target, pages=pages, progress=progress)
+
+
+def _snapshot_database(db_path: str, path: str, pages_per_step: int, step_sleep: float) -> Optional[Dict]:
+    """Copy one database to a verified snapshot at path"""
+    partial = path + ".partial"
+    start = time.perf_counter()
+    try:
+        source = sqlite3.connect(db_path, timeout=db_utils.DB_BUSY_TIMEOUT)
+        target = sqlite3.connect(partial)
+        try:
+            _copy_database(source, target, pages_per_step, step_sleep)
+        finally:
+            target.close()
+            source.close()
+
+        if not verify_snapshot(partial):
+            os.remove(partial)
+            return None
+        os.replace(partial, path)
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Backup of {db_path} failed: {str(e)}")
+        if os.path.exists(partial):
+            os.remove(partial)
+        return None
+
+    snapshot = {
+        'name': os.path.basename(path),
+        'path': path,
+        'shard': _shard_label(db_path),
+        'db_path': db_path,
+        'size_bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - start, 2)
+    }
+    logger.info(f"Backed up {db_path} to {path} ({snapshot['size_bytes']} bytes in {snapshot['seconds']} sec)")
+    return snapshot
+
+
+def create_backup(backup_dir: str = None, pages_per_step: int = None, step_sleep: float = None) -> Optional[List[Dict]]:
+    """
+    Take verified snapshots of every database and prune old snapshots
+
+    The directory database (DB_PATH) and, with SHARDING_ENABLED, each division
+    shard get one snapshot each, all with the same timestamp. If any of them
+    fails, the snapshots already taken in this run are deleted again.
+
+    Args:
+        backup_dir: Directory for snapshots (defaults to BACKUP_DIR)
+        pages_per_step: Pages copied per step (defaults to BACKUP_PAGES_PER_STEP; -1 copies everything at once)
+        step_sleep: Seconds to pause between steps (defaults to BACKUP_STEP_SLEEP)
+
+    Returns:
+        List of dictionaries describing the snapshots (DB_PATH first), or None
+        if the backup failed
+    """
+    backup_dir = backup_dir or BACKUP_DIR
+    pages_per_step = pages_per_step or BACKUP_PAGES_PER_STEP
+    step_sleep = BACKUP_STEP_SLEEP if step_sleep is None else step_sleep
+    os.makedirs(backup_dir, exist_ok=True)
+
+    stamp = datetime.now().strftime(STAMP_FORMAT)
+    snapshots = []
+    for db_path in db_utils.database_paths():
+        shard = _shard_label(db_path)
+        name = f"{SNAPSHOT_PREFIX}{shard + '-' if shard else ''}{stamp}{SNAPSHOT_SUFFIX}"
+        snapshot = _snapshot_database(db_path, os.path.join(backup_dir, name), pages_per_step, step_sleep)
+        if snapshot is None:
+            for taken in snapshots:
+                os.remove(taken['path'])
+            return None
+        snapshots.append(snapshot)
+
+    prune_backups(backup_dir)
+    return snapshots
+
+
+def list_backups(backup_dir: str = None, shard: Optional[str] = None) -> List[Dict]:
+    """
+    Snapshots in the backup directory, newest first
+
+    Args:
+        backup_dir: Directory to list (defaults to BACKUP_DIR)
+        shard: Only list this shard's snapshots (e.g. "ENTC_A"); None lists all
+
+    Each entry has the snapshot's shard label (None for DB_PATH) and the
+    db_path it restores to.
+    """
+    backup_dir = backup_dir or BACKUP_DIR
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = []
+    for name in os.listdir(backup_dir):
+        parsed = _parse_snapshot_name(name)
+        if parsed is None or (shard is not None and parsed[0] != shard):
+            continue
+        path = os.path.join(backup_dir, name)
+        snapshots.append({
+            'name': name,
+            'path': path,
+            'shard': parsed[0],
+            'db_path': _snapshot_db_path(parsed[0]),
+            'created_at': parsed[1].strftime("%Y-%m-%d %H:%M:%S"),
+            'size_bytes': os.path.getsize(path)
+        })
+    # Newest first; within one backup run DB_PATH comes first, then the shards by name
+    snapshots.sort(key=lambda s: s['shard'] or '')
+    return sorted(snapshots, key=lambda s: s['created_at'], reverse=True)
+
+
+def prune_backups(backup_dir: str = None, keep: int = None) -> int:
+    """
+    Delete all but the newest snapshots of each database
+
+    Returns:
+        Number of snapshots deleted
+    """
+    keep = BACKUP_RETENTION_COUNT if keep is None else keep
+    kept = {}
+    removed = 0
+    for snapshot in list_backups(backup_dir):
+        kept[snapshot['shard']] = kept.get(snapshot['shard'], 0) + 1
+        if kept[snapshot['shard']] <= max(keep, 1):
+            continue
+        try:
+            os.remove(snapshot['path'])
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Could not delete old snapshot {snapshot['path']}: {str(e)}")
+    if removed:
+        logger.info(f"Deleted {removed} old database snapshot(s)")
+    return removed
+
+
+def restore_backup(path: str, db_path: str = None) -> bool:
+    """
+    Replace a database's contents with a verified snapshot
+
+    The copy runs in one backup step, so other connections see either the old
+    or the restored database. Pending migrations are applied afterwards and
+    every process's caches are invalidated through table_versions.
+
+    Args:
+        path: Snapshot file
+        db_path: Database to restore into (defaults to the one the snapshot
+                 was taken of, from its name: DB_PATH or a division shard)
+
+    Returns:
+        True if the snapshot was restored, False otherwise
+    """
+    if not os.path.exists(path) or not verify_snapshot(path, full=True):
+        logger.error(f"Not restoring {path}: snapshot missing or failed verification")
+        return False
+    if db_path is None:
+        parsed = _parse_snapshot_name(os.path.basename(path))
+        db_path = _snapshot_db_path(parsed[0] if parsed else None)
+
+    with db_utils.routed_to(db_path):
+        try:
+            live = db_utils.get_connection()
+            try:
+                # Remember how far the change counters had got, so they only move forward
+                try:
+                    max_version = live.execute("SELECT COALESCE(MAX(version), 0) FROM table_versions").fetchone()[0]
+                except sqlite3.OperationalError:
+                    max_version = 0
+
+                snapshot = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+                try:
+                    snapshot.backup(live, pages=-1)
+                finally:
+                    snapshot.close()
+
+                try:
+                    live.execute("UPDATE table_versions SET version = version + ?", (max_version + 1,))
+                    live.commit()
+                except sqlite3.OperationalError:
+                    pass  # snapshot predates table_versions; the migration below adds it
+            finally:
+                live.close()
+        except sqlite3.Error as e:
+            logger.error(f"Restore from {path} failed: {str(e)}")
+            return False
+
+        # Other pooled connections may hold pages of the old database in cache
+        db_utils.close_idle_connections()
+        from utils.migrations import migrate
+        migrate()
+    db_utils.invalidate_reference_cache()
+    logger.info(f"Restored {db_path} from {path}")
+    return True
+
+
+class BackupScheduler:
+    """Background thread taking a snapshot every BACKUP_INTERVAL_HOURS."""
+
+    def __init__(self, interval_hours: float = BACKUP_INTERVAL_HOURS):
+        self.interval = interval_hours * 3600
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the scheduler thread (no-op if already running or disabled)"""
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="database-backup", daemon=True)
+        self._thread.start()
+        logger.info(f"Started database backups every {self.interval / 3600:g} hour(s)")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            latest = list_backups()
+            if latest:
+                age = (datetime.now() - datetime.strptime(latest[0]['created_at'], "%Y-%m-%d %H:%M:%S")).total_seconds()
+            else:
+                age = self.interval
+            if age >= self.interval:
+                try:
+                    create_backup()
+                except Exception as e:
+                    logger.error(f"Scheduled backup failed: {str(e)}")
+                age = 0
+            self._stop.wait(max(self.interval - age, 60))
+
+
+# Global scheduler instance (one per process)
+_scheduler: Optional[BackupScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def start_backup_scheduler() -> BackupScheduler:
+    """Get or start the process-wide backup scheduler (does nothing when BACKUP_INTERVAL_HOURS is 0)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BackupScheduler()
+            _scheduler.start()
+    return _scheduler
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else "backup"
+    if command == "backup":
+        result = create_backup()
+        print("\n".join(snapshot['path'] for snapshot in result) if result else "Backup failed")
+        sys.exit(0 if result else 1)
+    elif command == "list":
+        for snapshot in list_backups():
+            print(f"{snapshot['created_at']}  {snapshot['shard'] or '-':<16}  {snapshot['size_bytes']:>12}  "
+                  f"{snapshot['path']}")
+    elif command == "verify" and len(sys.argv) > 2:
+        ok = verify_snapshot(sys.argv[2], full=True)
+        print("ok" if ok else "FAILED")
+        sys.exit(0 if ok else 1)
+    elif command == "restore" and len(sys.argv) > 2:
+        ok = restore_backup(sys.argv[2])
+        print("Restored" if ok else "Restore failed")
+        sys.exit(0 if ok else 1)
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,380 @@
+"""
+Bulk loading of students, subjects, enrollments and attendance.
+
+Accepts SQL dumps (``database_backup.sql``, ``sqlite3 attendance.db .dump``),
+CSV files with a header row named after their table (``attendance.csv``), and
+the workbooks the app writes to ``excel_exports/``:
+
+    Students_<dept>_<year><div>.xlsx   student list
+    <subject>_<dept>_<year><div>.xlsx  per-subject attendance sheet (✅/❌ per date)
+
+Everything is loaded into the live database in a single transaction with
+``executemany``. While loading, foreign keys and fsyncs are off, non-unique
+indexes on the loaded tables are dropped and recreated at the end, and the
+summary and change-counter triggers are dropped; the summary tables are then
+rebuilt in one pass and every table_versions counter bumped so running app
+workers drop their cached reads. Attendance rows are staged in a temp table
+and inserted sorted by their unique key with their class session attached.
+A failure rolls everything back.
+
+SQL dumps are first replayed into a scratch database next to the live one
+(only CREATE TABLE and INSERTs into loadable tables, in large batches), so
+dumps from older schemas load by column name.
+
+    python -m utils.bulk_loader database_backup.sql --truncate --backup
+    python -m utils.bulk_loader attendance.csv
+    python -m utils.bulk_loader excel_exports/DSAJ_ENTC_B.TechB.xlsx --period "10:15 - 11:15"
+    python -m utils.bulk_loader attendance.csv --department ENTC --division A   # a division shard
+"""
+import os
+import re
+import csv
+import time
+import sqlite3
+import logging
+import tempfile
+from datetime import datetime
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils import db_utils
+from utils.migrations import _columns
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import BULK_LOAD_CACHE_SIZE_KB
+except ImportError:
+    BULK_LOAD_CACHE_SIZE_KB = 262144
+
+# Tables a bulk load may write, in the order rows are inserted
+LOADABLE_TABLES = ('users', 'subjects', 'students', 'student_subjects', 'class_sessions', 'attendance')
+
+# Triggers maintaining derived data; dropped while loading and caught up afterwards
+_DEFERRED_TRIGGERS_SQL = '''
+SELECT name, sql FROM sqlite_master
+WHERE type = 'trigger' AND (name LIKE 'trg_attendance_summary_%' OR name LIKE 'trg_%_version_%')
+'''
+
+_DUMP_BATCH_STATEMENTS = 5000
+_INSERT_TABLE = re.compile(r'INSERT\s+(?:OR\s+\w+\s+)?INTO\s+["`\[]?(\w+)', re.IGNORECASE)
+_DATE_COLUMN = re.compile(r'^(\d{4}-\d{2}-\d{2})(?: \((.+)\))?$')
+_EXCEL_STATUS = {'✅': 'present', 'present': 'present', 'p': 'present',
+                 '❌': 'absent', 'absent': 'absent', 'a': 'absent'}
+_EXCEL_SUMMARY_COLUMNS = ('Roll No', 'Name', 'Email', 'Present', 'Total', 'Attendance %')
+
+# A source yields (table, columns, rows) batches; it gets the load cursor so it
+# can look up ids of rows it loaded earlier in the same transaction
+Batch = Tuple[str, List[str], Iterable[tuple]]
+Source = Callable[[sqlite3.Cursor], Iterable[Batch]]
+
+
+def _sql_dump_source(path: str, staging_dir: str) -> Source:
+    """Replay a dump into a scratch database and read the loadable tables back from it"""
+    def batches(cursor):
+        staging_path = os.path.join(staging_dir, "bulk-load-staging.db")
+        staging = sqlite3.connect(staging_path, isolation_level=None)
+        try:
+            staging.execute("PRAGMA journal_mode = OFF")
+            staging.execute("PRAGMA synchronous = OFF")
+            statements = []
+            buffer = ""
+            with open(path, encoding="utf-8") as dump:
+                for line in dump:
+                    buffer += line
+                    if not sqlite3.complete_statement(buffer):
+                        continue
+                    statement, buffer = buffer.strip(), ""
+                    head = statement[:12].upper()
+                    if head.startswith("CREATE TABLE"):
+                        statements.append(statement)
+                    elif head.startswith("INSERT"):
+                        match = _INSERT_TABLE.match(statement)
+                        if match and match.group(1) in LOADABLE_TABLES:
+                            statements.append(statement)
+                    if len(statements) >= _DUMP_BATCH_STATEMENTS:
+                        staging.executescript("BEGIN;\n" + "\n".join(statements) + "\nCOMMIT;")
+                        statements = []
+            if statements:
+                staging.executescript("BEGIN;\n" + "\n".join(statements) + "\nCOMMIT;")
+
+            present = {row[0] for row in staging.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table in LOADABLE_TABLES:
+                if table in present:
+                    columns = _columns(staging.cursor(), table)
+                    yield table, columns, staging.execute(f"SELECT * FROM {table}")
+        finally:
+            staging.close()
+    return batches
+
+
+def _csv_source(path: str, table: str) -> Source:
+    """Rows of a CSV file with a header; empty fields load as NULL unless the column is NOT NULL"""
+    def batches(cursor):
+        not_null = {column[1] for column in cursor.execute(f"PRAGMA table_info({table})").fetchall() if column[3]}
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            columns = next(reader)
+            nullable = [column not in not_null for column in columns]
+            yield table, columns, (
+                tuple(None if value == "" and can_be_null else value for value, can_be_null in zip(row, nullable))
+                for row in reader
+            )
+    return batches
+
+
+def _excel_cell(value) -> Optional[str]:
+    if value is None or value != value:  # NaN
+        return None
+    return str(value).strip() or None
+
+
+def _excel_source(path: str, default_period: str) -> Source:
+    """Students or per-subject attendance from one of the app's Excel exports"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    parts = stem.rsplit("_", 2)
+    if len(parts) != 3 or stem.startswith(("Class_Report_", "Student_Report_")):
+        raise ValueError(f"{path} is not a student list or subject attendance export")
+    sheet, department, year_division = parts
+    year, division = year_division[:-1], year_division[-1:]
+
+    def batches(cursor):
+        import pandas as pd
+        df = pd.read_excel(path)
+        students = [
+            (
+                _excel_cell(row.get("Roll No")), _excel_cell(row.get("Name")), _excel_cell(row.get("Email")),
+                _excel_cell(row.get("Department")) or department, _excel_cell(row.get("Year")) or year,
+                _excel_cell(row.get("Division")) or division, ''
+            )
+            for row in df.to_dict("records")
+            if _excel_cell(row.get("Roll No")) and _excel_cell(row.get("Name"))
+        ]
+
+        if sheet != "Students":
+            # Subject sheets: make sure the subject exists before its students,
+            # so the enrollment trigger can pick it up
+            yield 'subjects', ['code', 'name'], [(sheet, sheet)]
+        yield 'students', ['roll_no', 'name', 'email', 'department', 'year', 'division', 'image_path'], students
+        if sheet == "Students":
+            return
+
+        subject_id = cursor.execute("SELECT id FROM subjects WHERE code = ?", (sheet,)).fetchone()[0]
+        student_ids = dict(cursor.execute("SELECT roll_no, id FROM students").fetchall())
+        classes = []
+        for column in df.columns:
+            if column in _EXCEL_SUMMARY_COLUMNS:
+                continue
+            if hasattr(column, "strftime"):
+                classes.append((column, column.strftime("%Y-%m-%d"), default_period))
+            else:
+                match = _DATE_COLUMN.match(str(column).strip())
+                if match:
+                    classes.append((column, match.group(1), match.group(2) or default_period))
+
+        attendance = []
+        for row in df.to_dict("records"):
+            student_id = student_ids.get(_excel_cell(row.get("Roll No")))
+            if student_id is None:
+                continue
+            for column, date, period in classes:
+                status = _EXCEL_STATUS.get((_excel_cell(row.get(column)) or "").lower())
+                if status:
+                    attendance.append((student_id, subject_id, date, period, status))
+
+        yield 'student_subjects', ['student_id', 'subject_id'], sorted({(a[0], subject_id) for a in attendance})
+        yield 'attendance', ['student_id', 'subject_id', 'date', 'period', 'status'], attendance
+    return batches
+
+
+def _open_source(path: str, staging_dir: str, table: Optional[str] = None,
+                 default_period: str = "Imported") -> Source:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".sql":
+        return _sql_dump_source(path, staging_dir)
+    if extension == ".csv":
+        table = table or os.path.splitext(os.path.basename(path))[0]
+        if table not in LOADABLE_TABLES:
+            raise ValueError(f"Cannot load {path} into '{table}'; use one of {', '.join(LOADABLE_TABLES)}")
+        return _csv_source(path, table)
+    if extension in (".xlsx", ".xls"):
+        return _excel_source(path, default_period)
+    raise ValueError(f"Unsupported file type: {path}")
+
+
+def _insert_rows(cursor, table: str, columns: List[str], rows: Iterable[tuple]) -> int:
+    """INSERT OR IGNORE the columns the live table also has; returns rows inserted"""
+    if table not in LOADABLE_TABLES:
+        raise ValueError(f"Cannot load into '{table}'")
+    target_columns = set(_columns(cursor, table))
+    keep = [i for i, column in enumerate(columns) if column in target_columns]
+    if not keep:
+        logger.warning(f"No columns of {table} match the live schema; skipped")
+        return 0
+    if len(keep) < len(columns):
+        dropped = [column for column in columns if column not in target_columns]
+        logger.warning(f"Ignoring columns not in {table}: {', '.join(dropped)}")
+        pick = itemgetter(*keep)
+        rows = ((pick(row),) if len(keep) == 1 else pick(row) for row in rows)
+    names = [columns[i] for i in keep]
+    placeholders = ", ".join("?" for _ in keep)
+    if table == 'attendance':
+        return _insert_attendance(cursor, names, placeholders, rows)
+    cursor.executemany(f"INSERT OR IGNORE INTO {table} ({', '.join(names)}) VALUES ({placeholders})", rows)
+    return max(cursor.rowcount, 0)
+
+
+def _insert_attendance(cursor, names: List[str], placeholders: str, rows: Iterable[tuple]) -> int:
+    """
+    Stage attendance rows in an unindexed temp table, create their class
+    sessions, then insert them sorted by the unique key with session_id filled
+    in, so the unique index is appended to rather than updated at random
+    """
+    cursor.execute("CREATE TEMP TABLE bulk_attendance AS SELECT * FROM attendance WHERE 0")
+    try:
+        cursor.executemany(f"INSERT INTO temp.bulk_attendance ({', '.join(names)}) VALUES ({placeholders})", rows)
+        cursor.execute('''
+        INSERT OR IGNORE INTO class_sessions (subject_id, date, period, capture_source, created_at)
+        SELECT DISTINCT subject_id, date, period, 'bulk_load', ? FROM temp.bulk_attendance
+        ''', (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+        columns = [name for name in names if name != 'session_id']
+        cursor.execute(f'''
+        INSERT OR IGNORE INTO attendance ({', '.join(columns)}, session_id)
+        SELECT {', '.join('b.' + name for name in columns)}, COALESCE(b.session_id, cs.id)
+        FROM temp.bulk_attendance b
+        JOIN class_sessions cs ON cs.subject_id = b.subject_id AND cs.date = b.date AND cs.period = b.period
+        ORDER BY b.student_id, b.subject_id, b.date, b.period
+        ''')
+        return max(cursor.rowcount, 0)
+    finally:
+        cursor.execute("DROP TABLE temp.bulk_attendance")
+
+
+def bulk_load(paths: List[str], truncate: bool = False, strict: bool = False, table: Optional[str] = None,
+              default_period: str = "Imported") -> Optional[Dict]:
+    """
+    Load files into the live database in one transaction
+
+    Args:
+        paths: SQL dumps, CSV files or Excel exports, loaded in order
+        truncate: Empty each table before its first rows are loaded (restore instead of merge)
+        strict: Roll back if the loaded rows break foreign keys instead of only logging them
+        table: Target table for CSV files not named after one
+        default_period: Period for Excel attendance columns that only carry a date
+
+    Returns:
+        Dictionary with rows inserted per table and timings, or None if the load failed
+    """
+    db_utils.init_db()
+    start = time.perf_counter()
+    staging_dir = tempfile.mkdtemp(prefix="bulk-load-", dir=os.path.dirname(os.path.abspath(db_utils.current_db_path())))
+    inserted: Dict[str, int] = {}
+
+    conn = sqlite3.connect(db_utils.current_db_path(), timeout=db_utils.DB_BUSY_TIMEOUT, isolation_level=None)
+    cursor = conn.cursor()
+    try:
+        sources = [_open_source(path, staging_dir, table, default_period) for path in paths]
+
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute(f"PRAGMA cache_size = -{BULK_LOAD_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.execute("BEGIN IMMEDIATE")
+
+        # Indexes are cheaper to build once over sorted data than to maintain row by row;
+        # unique ones stay because INSERT OR IGNORE relies on them
+        placeholders = ", ".join("?" for _ in LOADABLE_TABLES)
+        indexes = cursor.execute(f'''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%'
+            AND tbl_name IN ({placeholders})
+        ''', LOADABLE_TABLES).fetchall()
+        triggers = cursor.execute(_DEFERRED_TRIGGERS_SQL).fetchall()
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX "{name}"')
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER "{name}"')
+        loaded_at = time.perf_counter()
+
+        for source in sources:
+            for target, columns, rows in source(cursor):
+                if truncate and target not in inserted:
+                    cursor.execute(f"DELETE FROM {target}")
+                    logger.info(f"Emptied {target} ({cursor.rowcount} rows)")
+                inserted[target] = inserted.get(target, 0) + _insert_rows(cursor, target, columns, rows)
+        load_seconds = time.perf_counter() - loaded_at
+
+        if 'attendance' in inserted:
+            db_utils._rebuild_attendance_summaries(cursor)
+        for _, sql in indexes + triggers:
+            cursor.execute(sql)
+        cursor.execute("UPDATE table_versions SET version = version + 1")
+
+        violations = cursor.execute("PRAGMA foreign_key_check").fetchall()
+        if violations:
+            by_table: Dict[str, int] = {}
+            for violation in violations:
+                by_table[violation[0]] = by_table.get(violation[0], 0) + 1
+            summary = ", ".join(f"{t}: {n}" for t, n in by_table.items())
+            if strict:
+                raise ValueError(f"Loaded rows reference missing parents ({summary})")
+            logger.warning(f"Loaded rows reference missing parents ({summary})")
+        cursor.execute("COMMIT")
+    except Exception as e:
+        logger.error(f"Bulk load failed, nothing was changed: {str(e)}")
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        return None
+    finally:
+        if not conn.in_transaction:
+            cursor.execute("PRAGMA synchronous = NORMAL")
+            cursor.execute("PRAGMA optimize")
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        for name in os.listdir(staging_dir):
+            os.remove(os.path.join(staging_dir, name))
+        os.rmdir(staging_dir)
+
+    db_utils.invalidate_reference_cache()
+    result = {
+        'inserted': inserted,
+        'foreign_key_violations': len(violations),
+        'load_seconds': round(load_seconds, 2),
+        'total_seconds': round(time.perf_counter() - start, 2),
+        'finished_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    logger.info(f"Bulk load finished in {result['total_seconds']} sec: "
+                + ", ".join(f"{t} +{n}" for t, n in inserted.items()))
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Bulk load SQL dumps, CSV files or Excel exports")
+    parser.add_argument("paths", nargs="+", help=".sql, .csv or .xlsx files, loaded in order")
+    parser.add_argument("--truncate", action="store_true", help="empty each loaded table first (restore)")
+    parser.add_argument("--strict", action="store_true", help="roll back on foreign key violations")
+    parser.add_argument("--table", help="target table for CSV files not named after one")
+    parser.add_argument("--period", default="Imported", help="period for Excel columns without one")
+    parser.add_argument("--backup", action="store_true", help="take an online backup before loading")
+    parser.add_argument("--department", help="department of the division shard to load into")
+    parser.add_argument("--division", help="load into this division's shard (needs SHARDING_ENABLED)")
+    args = parser.parse_args()
+    if args.division and not (args.department and db_utils.SHARDING_ENABLED):
+        parser.error("--division needs --department and SHARDING_ENABLED")
+    db_utils.use_division(args.department, args.division)
+
+    if args.backup:
+        from utils.backup_utils import create_backup
+        if not create_backup():
+            raise SystemExit("Backup failed; nothing loaded")
+    result = bulk_load(args.paths, truncate=args.truncate, strict=args.strict,
+                       table=args.table, default_period=args.period)
+    if result is None:
+        raise SystemExit(1)
+    for table_name, count in result['inserted'].items():
+        print(f"{table_name:18s} {count:>10}")
+    print(f"Loaded in {result['load_seconds']} sec ({result['total_seconds']} sec including indexes and summaries)")
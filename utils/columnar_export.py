@@ -0,0 +1,309 @@
+"""
+Columnar snapshots of attendance for analytics.
+
+Report pages that cover a whole semester spend most of their time turning
+``sqlite3.Row`` objects into dicts and then into pandas. This module keeps a
+typed, column-oriented copy of the attendance table in ANALYTICS_EXPORT_DIR
+that analytics code loads as NumPy arrays without building a Python object
+per row:
+
+- ``attendance-YYYY-MM.parquet`` (or ``.npz``): one partition per month with
+  the columns id, student_id, subject_id, date (datetime64[D]), period,
+  present (bool) and session_id (-1 when not linked to a class session)
+- ``students`` and ``subjects``: small dimension files rewritten on every
+  refresh, joined onto attendance by ``load_frame``
+- ``manifest.json``: format, row counts and a fingerprint per partition
+
+Parquet is written when pyarrow is installed and ANALYTICS_EXPORT_FORMAT is
+"auto" or "parquet"; otherwise NumPy ``.npz`` files (no extra dependency).
+
+Refreshes are incremental: a month is rewritten only when its fingerprint
+(row count, id sum and the ids of present rows) changed since the last
+export, which catches new, deleted and re-marked attendance. Archived terms
+are exported like live ones.
+
+    python -m utils.columnar_export refresh
+    python -m utils.columnar_export refresh --full --format npz
+"""
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils import db_utils
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    from config import ANALYTICS_EXPORT_DIR, ANALYTICS_EXPORT_FORMAT
+    ANALYTICS_EXPORT_DIR = str(ANALYTICS_EXPORT_DIR)
+except ImportError:
+    ANALYTICS_EXPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db", "analytics")
+    ANALYTICS_EXPORT_FORMAT = "auto"
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Exported columns and their NumPy dtypes; strings are stored as fixed-width unicode
+ATTENDANCE_COLUMNS = {
+    'id': 'int64', 'student_id': 'int64', 'subject_id': 'int64', 'date': 'datetime64[D]',
+    'period': 'str', 'present': 'bool', 'session_id': 'int64',
+}
+STUDENT_COLUMNS = {
+    'id': 'int64', 'roll_no': 'str', 'name': 'str', 'department': 'str', 'year': 'str', 'division': 'str',
+}
+SUBJECT_COLUMNS = {'id': 'int64', 'code': 'str', 'name': 'str'}
+
+_ATTENDANCE_SELECT = '''
+    SELECT id, student_id, subject_id, date, period, status = 'present', COALESCE(session_id, -1)
+    FROM {attendance} WHERE date BETWEEN ? AND ?
+    ORDER BY date, id
+'''
+
+
+def _resolve_format(fmt: Optional[str]) -> str:
+    fmt = (fmt or ANALYTICS_EXPORT_FORMAT or "auto").lower()
+    if fmt == "auto":
+        return "parquet" if PYARROW_AVAILABLE else "npz"
+    if fmt == "parquet" and not PYARROW_AVAILABLE:
+        raise ValueError("Parquet export needs pyarrow; install it or use the npz format")
+    if fmt not in ("parquet", "npz"):
+        raise ValueError(f"Unknown export format '{fmt}'; use auto, parquet or npz")
+    return fmt
+
+
+def _to_arrays(rows: List[tuple], columns: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """Turn fetched rows into one typed array per column"""
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    arrays = {}
+    for (name, dtype), column in zip(columns.items(), values):
+        if dtype == 'str':
+            arrays[name] = np.array([value or '' for value in column], dtype=str)
+        else:
+            arrays[name] = np.array(column, dtype=dtype)
+    return arrays
+
+
+def _write(path: str, arrays: Dict[str, np.ndarray], fmt: str):
+    """Write a set of columns atomically (temporary file, then rename)"""
+    tmp_path = path + ".tmp"
+    if fmt == "parquet":
+        pq.write_table(pa.table({name: pa.array(array) for name, array in arrays.items()}), tmp_path)
+    else:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _read(path: str, columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    if path.endswith(".parquet"):
+        table = pq.read_table(path, columns=columns)
+        arrays = {}
+        for name in table.column_names:
+            array = table.column(name).to_numpy()
+            # Parquet hands strings back as objects; keep the npz dtypes
+            arrays[name] = array.astype(str) if array.dtype == object else array
+        return arrays
+    with np.load(path) as data:
+        return {name: data[name] for name in (columns or data.files)}
+
+
+def _default_export_dir() -> str:
+    """ANALYTICS_EXPORT_DIR, or a subdirectory of it per division shard the thread is routed to"""
+    db_path = db_utils.current_db_path()
+    if db_path == db_utils.DB_PATH:
+        return ANALYTICS_EXPORT_DIR
+    return os.path.join(ANALYTICS_EXPORT_DIR, os.path.splitext(os.path.basename(db_path))[0])
+
+
+def _partition_path(export_dir: str, month: str, fmt: str) -> str:
+    return os.path.join(export_dir, f"attendance-{month}.{fmt}")
+
+
+def _load_manifest(export_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(export_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def _month_fingerprints(cursor, attendance: str) -> Dict[str, str]:
+    cursor.execute(f'''
+        SELECT substr(date, 1, 7) AS month, COUNT(*), TOTAL(id), TOTAL(CASE WHEN status = 'present' THEN id END)
+        FROM {attendance}
+        GROUP BY month
+    ''')
+    return {month: f"{count}:{int(id_sum)}:{int(present_sum)}" for month, count, id_sum, present_sum in cursor.fetchall()}
+
+
+def refresh_export(export_dir: Optional[str] = None, fmt: Optional[str] = None, full: bool = False) -> Dict:
+    """
+    Bring the columnar snapshot up to date with the database
+
+    Args:
+        export_dir: Target directory (defaults to ANALYTICS_EXPORT_DIR)
+        fmt: "auto", "parquet" or "npz" (defaults to ANALYTICS_EXPORT_FORMAT)
+        full: Rewrite every partition even if it is unchanged
+
+    Returns:
+        Dictionary with the months written, unchanged and removed, the rows
+        written and the time taken
+    """
+    started = time.perf_counter()
+    export_dir = export_dir or _default_export_dir()
+    fmt = _resolve_format(fmt)
+    os.makedirs(export_dir, exist_ok=True)
+
+    manifest = _load_manifest(export_dir)
+    if full or manifest is None or manifest.get('format') != fmt:
+        manifest = {'version': MANIFEST_VERSION, 'format': fmt, 'partitions': {}}
+    partitions = manifest['partitions']
+
+    written, unchanged, rows_written = [], [], 0
+    conn = db_utils.get_connection()
+    conn.row_factory = None
+    try:
+        attendance = db_utils._partition(conn, 'attendance')
+        # One read transaction, so every file comes from the same snapshot
+        conn.execute("BEGIN")
+        cursor = conn.cursor()
+        fingerprints = _month_fingerprints(cursor, attendance)
+
+        for month, fingerprint in sorted(fingerprints.items()):
+            path = _partition_path(export_dir, month, fmt)
+            if partitions.get(month, {}).get('fingerprint') == fingerprint and os.path.exists(path):
+                unchanged.append(month)
+                continue
+            cursor.execute(_ATTENDANCE_SELECT.format(attendance=attendance), (f"{month}-01", f"{month}-31"))
+            arrays = _to_arrays(cursor.fetchall(), ATTENDANCE_COLUMNS)
+            _write(path, arrays, fmt)
+            partitions[month] = {'fingerprint': fingerprint, 'rows': len(arrays['id'])}
+            written.append(month)
+            rows_written += len(arrays['id'])
+
+        cursor.execute("SELECT id, roll_no, name, department, year, division FROM students ORDER BY id")
+        _write(os.path.join(export_dir, f"students.{fmt}"), _to_arrays(cursor.fetchall(), STUDENT_COLUMNS), fmt)
+        cursor.execute("SELECT id, code, name FROM subjects ORDER BY id")
+        _write(os.path.join(export_dir, f"subjects.{fmt}"), _to_arrays(cursor.fetchall(), SUBJECT_COLUMNS), fmt)
+    finally:
+        conn.close()
+
+    removed = sorted(set(partitions) - set(fingerprints))
+    for month in removed:
+        del partitions[month]
+    # Drop partitions of removed months and files left by a different format
+    keep = {os.path.basename(_partition_path(export_dir, month, fmt)) for month in partitions}
+    keep |= {f"students.{fmt}", f"subjects.{fmt}", MANIFEST_NAME}
+    for name in os.listdir(export_dir):
+        exported = name.startswith('attendance-') or name.split('.')[0] in ('students', 'subjects')
+        if exported and name not in keep:
+            os.remove(os.path.join(export_dir, name))
+
+    manifest['refreshed_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tmp_path = os.path.join(export_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(export_dir, MANIFEST_NAME))
+
+    result = {
+        'format': fmt,
+        'written': written,
+        'unchanged': unchanged,
+        'removed': removed,
+        'rows_written': rows_written,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+    logger.info(f"Columnar export refreshed in {result['seconds']} sec: {len(written)} months written "
+                f"({rows_written} rows), {len(unchanged)} unchanged, {len(removed)} removed")
+    return result
+
+
+def load_columns(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 columns: Optional[List[str]] = None, export_dir: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Load exported attendance as typed columns
+
+    Args:
+        date_from: Optional start date (YYYY-MM-DD), inclusive
+        date_to: Optional end date (YYYY-MM-DD), inclusive
+        columns: Columns to load (defaults to all of ATTENDANCE_COLUMNS)
+        export_dir: Snapshot directory (defaults to ANALYTICS_EXPORT_DIR)
+
+    Returns:
+        Dictionary mapping column name to a NumPy array, rows in date order
+    """
+    export_dir = export_dir or _default_export_dir()
+    manifest = _load_manifest(export_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No columnar export in {export_dir}; run refresh_export() first")
+    columns = list(columns or ATTENDANCE_COLUMNS)
+    read_columns = columns if 'date' in columns or not (date_from and date_to) else columns + ['date']
+
+    months = sorted(
+        month for month in manifest['partitions']
+        if not (date_from and date_to) or date_from[:7] <= month <= date_to[:7]
+    )
+    parts = [_read(_partition_path(export_dir, month, manifest['format']), read_columns) for month in months]
+    if not parts:
+        return {name: np.array([], dtype=ATTENDANCE_COLUMNS[name] if ATTENDANCE_COLUMNS[name] != 'str' else str)
+                for name in columns}
+    arrays = {name: np.concatenate([part[name] for part in parts]) for name in read_columns}
+    if date_from and date_to:
+        mask = (arrays['date'] >= np.datetime64(date_from)) & (arrays['date'] <= np.datetime64(date_to))
+        arrays = {name: array[mask] for name, array in arrays.items()}
+    return {name: arrays[name] for name in columns}
+
+
+def load_frame(date_from: Optional[str] = None, date_to: Optional[str] = None, export_dir: Optional[str] = None):
+    """
+    Load exported attendance joined with students and subjects as a pandas DataFrame
+
+    Returns:
+        DataFrame with the attendance columns plus roll_no, name, division,
+        subject_code and subject_name
+    """
+    import pandas as pd
+
+    export_dir = export_dir or _default_export_dir()
+    frame = pd.DataFrame(load_columns(date_from, date_to, export_dir=export_dir))
+    fmt = _load_manifest(export_dir)['format']
+    students = pd.DataFrame(_read(os.path.join(export_dir, f"students.{fmt}"), ['id', 'roll_no', 'name', 'division']))
+    subjects = pd.DataFrame(_read(os.path.join(export_dir, f"subjects.{fmt}")))
+    frame = frame.merge(students.rename(columns={'id': 'student_id'}), on='student_id', how='left')
+    frame = frame.merge(subjects.rename(columns={'id': 'subject_id', 'code': 'subject_code', 'name': 'subject_name'}),
+                        on='subject_id', how='left')
+    return frame
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Columnar attendance snapshot for analytics")
+    parser.add_argument("command", choices=["refresh"])
+    parser.add_argument("--dir", help=f"export directory (default {ANALYTICS_EXPORT_DIR})")
+    parser.add_argument("--format", choices=["auto", "parquet", "npz"])
+    parser.add_argument("--full", action="store_true", help="rewrite every month")
+    parser.add_argument("--db", help="database to export (defaults to the app database)")
+    args = parser.parse_args()
+
+    if args.db:
+        db_utils.DB_PATH = args.db
+    db_utils.init_db()
+    result = refresh_export(args.dir, args.format, full=args.full)
+    print(f"{len(result['written'])} months written, {len(result['unchanged'])} unchanged, "
+          f"{len(result['removed'])} removed ({result['format']}, {result['seconds']} sec)")
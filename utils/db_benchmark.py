@@ -0,0 +1,417 @@
+"""
+Benchmarks for the db_utils read and write functions.
+
+For every scale (number of students) a scratch database is filled with a
+synthetic semester (utils.synthetic_data), then every public db_utils
+function is timed over several runs. Reads are timed with the reference
+cache cleared before each run, so they measure the SQL, not the cache.
+Writes go to dates after the semester, so every run inserts fresh rows.
+
+Results are written as JSON (one file per run, in BENCHMARK_DIR) and can be
+compared with an earlier file; a function whose median slowed down by more
+than --threshold (and by at least --min-ms) counts as a regression.
+
+    python -m utils.db_benchmark --scales 60,300,1200
+    python -m utils.db_benchmark --scales 300 --compare benchmarks/baseline.json
+"""
+import os
+import json
+import time
+import inspect
+import logging
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils import db_utils
+from utils.synthetic_data import load_synthetic_semester
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import BENCHMARK_DIR
+    BENCHMARK_DIR = str(BENCHMARK_DIR)
+except ImportError:
+    BENCHMARK_DIR = "benchmarks"
+
+# (name, kind, function) in the order they are run; writes run after all reads
+BENCHMARKS: List[Tuple[str, str, Callable]] = []
+
+# Connection and cache plumbing rather than queries
+_NOT_BENCHMARKED = {'get_connection', 'get_db_connection', 'close_idle_connections', 'init_db',
+                    'invalidate_reference_cache', 'archive_db_path', 'add_attendance_listener',
+                    'current_db_path', 'shard_db_path', 'use_division', 'routed_to', 'list_shards',
+                    'database_paths', 'get_directory_connection', 'for_each_shard'}
+
+
+def benchmark(name: str, kind: str = "read"):
+    """Register a benchmark case; it is called with the context and the run number"""
+    def register(func):
+        BENCHMARKS.append((name, kind, func))
+        return func
+    return register
+
+
+@benchmark("get_all_students")
+def _all_students(ctx, run):
+    db_utils.get_all_students()
+
+
+@benchmark("get_students_by_subject")
+def _students_by_subject(ctx, run):
+    db_utils.get_students_by_subject(ctx['subject_id'])
+
+
+@benchmark("get_subjects")
+def _subjects(ctx, run):
+    db_utils.get_subjects()
+
+
+@benchmark("get_subject_by_id")
+def _subject_by_id(ctx, run):
+    db_utils.get_subject_by_id(ctx['subject_id'])
+
+
+@benchmark("get_student_details")
+def _student_details(ctx, run):
+    db_utils.get_student_details(ctx['student_id'])
+
+
+@benchmark("get_student_enrolled_subjects")
+def _student_enrolled_subjects(ctx, run):
+    db_utils.get_student_enrolled_subjects(ctx['student_id'])
+
+
+@benchmark("get_auto_enroll_policy")
+def _auto_enroll_policy(ctx, run):
+    db_utils.get_auto_enroll_policy()
+
+
+@benchmark("get_class_sessions")
+def _class_sessions(ctx, run):
+    db_utils.get_class_sessions(ctx['subject_id'], ctx['date_from'], ctx['date_to'])
+
+
+@benchmark("count_held_classes")
+def _count_held_classes(ctx, run):
+    db_utils.count_held_classes(ctx['date_from'], ctx['date_to'])
+
+
+@benchmark("get_attendance_report")
+def _attendance_report(ctx, run):
+    db_utils.get_attendance_report(ctx['subject_id'], ctx['class_date'])
+
+
+@benchmark("get_class_attendance_report")
+def _class_attendance_report(ctx, run):
+    db_utils.get_class_attendance_report(ctx['class_date'])
+
+
+@benchmark("get_subject_attendance_matrix")
+def _subject_attendance_matrix(ctx, run):
+    db_utils.get_subject_attendance_matrix(ctx['subject_id'], ctx['date_from'], ctx['date_to'])
+
+
+@benchmark("get_student_attendance_report")
+def _student_attendance_report(ctx, run):
+    db_utils.get_student_attendance_report(ctx['student_id'])
+
+
+@benchmark("get_student_attendance_summary")
+def _student_attendance_summary(ctx, run):
+    db_utils.get_student_attendance_summary(ctx['student_id'], ctx['date_from'], ctx['date_to'])
+
+
+@benchmark("get_class_attendance_summary")
+def _class_attendance_summary(ctx, run):
+    db_utils.get_class_attendance_summary(ctx['date_from'], ctx['date_to'])
+
+
+@benchmark("get_college_attendance_summary")
+def _college_attendance_summary(ctx, run):
+    db_utils.get_college_attendance_summary(ctx['date_from'], ctx['date_to'])
+
+
+@benchmark("calculate_expected_classes")
+def _expected_classes(ctx, run):
+    db_utils.calculate_expected_classes(ctx['subject_code'], ctx['date_from'], ctx['date_to'])
+
+
+@benchmark("check_database_status")
+def _database_status(ctx, run):
+    db_utils.check_database_status()
+
+
+@benchmark("get_archived_terms")
+def _archived_terms(ctx, run):
+    db_utils.get_archived_terms()
+
+
+@benchmark("get_recognition_runs")
+def _recognition_runs(ctx, run):
+    db_utils.get_recognition_runs()
+
+
+@benchmark("mark_attendance", kind="write")
+def _mark_attendance(ctx, run):
+    db_utils.mark_attendance(ctx['student_id'], ctx['subject_id'], _after_semester(ctx, run), ctx['period'], "absent")
+
+
+@benchmark("mark_attendance_bulk", kind="write")
+def _mark_attendance_bulk(ctx, run):
+    statuses = {student_id: "present" if i % 5 else "absent" for i, student_id in enumerate(ctx['student_ids'])}
+    db_utils.mark_attendance_bulk(ctx['subject_id'], _after_semester(ctx, run), ctx['period'], statuses,
+                                  notify=False, taken_by="benchmark", capture_source="manual")
+
+
+@benchmark("register_student", kind="write")
+def _register_student(ctx, run):
+    student_id = db_utils.register_student(f"BENCH{run:04d}", f"Benchmark Student {run}", "ENTC", "B.Tech", "B",
+                                           "", ctx['subject_ids'], email=f"bench{run}@example.edu")
+    ctx['registered'].append(student_id)
+
+
+@benchmark("update_student", kind="write")
+def _update_student(ctx, run):
+    db_utils.update_student(ctx['registered'][run % len(ctx['registered'])], name=f"Renamed {run}",
+                            subject_ids=ctx['subject_ids'][:2 + run % 3])
+
+
+@benchmark("enroll_student_in_all_subjects", kind="write")
+def _enroll_student(ctx, run):
+    db_utils.enroll_student_in_all_subjects(ctx['registered'][run % len(ctx['registered'])])
+
+
+@benchmark("enroll_all_students_in_all_subjects", kind="write")
+def _enroll_all(ctx, run):
+    db_utils.enroll_all_students_in_all_subjects()
+
+
+@benchmark("set_auto_enroll_policy", kind="write")
+def _set_auto_enroll_policy(ctx, run):
+    db_utils.set_auto_enroll_policy(True)
+
+
+@benchmark("save_recognition_run", kind="write")
+def _save_recognition_run(ctx, run):
+    db_utils.save_recognition_run({'stages': {}, 'tags': {'face_count': 40, 'roster_size': len(ctx['student_ids'])}},
+                                  2.5, 38)
+
+
+@benchmark("record_visualization_time", kind="write")
+def _record_visualization_time(ctx, run):
+    db_utils.record_visualization_time("benchmark", 0.1)
+
+
+@benchmark("rebuild_attendance_summaries", kind="write")
+def _rebuild_summaries(ctx, run):
+    db_utils.rebuild_attendance_summaries()
+
+
+@benchmark("delete_student", kind="write")
+def _delete_student(ctx, run):
+    if ctx['registered']:
+        db_utils.delete_student(ctx['registered'].pop())
+
+
+def _after_semester(ctx, run) -> str:
+    return (date.fromisoformat(ctx['date_to']) + timedelta(days=run + 1)).isoformat()
+
+
+def uncovered_functions() -> List[str]:
+    """Public db_utils functions without a benchmark case"""
+    covered = {name for name, _, _ in BENCHMARKS}
+    return sorted(
+        name for name, obj in vars(db_utils).items()
+        if inspect.isfunction(obj) and obj.__module__ == db_utils.__name__ and not name.startswith('_')
+        and name not in covered and name not in _NOT_BENCHMARKED
+    )
+
+
+def _context(dataset: Dict) -> Dict:
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    try:
+        student_ids = [row[0] for row in conn.execute("SELECT id FROM students ORDER BY id")]
+        subjects = conn.execute("SELECT id, code FROM subjects ORDER BY id").fetchall()
+        # The busiest class of the semester, for the per-date reports
+        subject_id, class_date, period = conn.execute('''
+            SELECT subject_id, date, period FROM class_sessions
+            WHERE date = (SELECT MAX(date) FROM class_sessions) ORDER BY subject_id LIMIT 1
+        ''').fetchone()
+    finally:
+        conn.close()
+    return {
+        'student_ids': student_ids,
+        'student_id': student_ids[len(student_ids) // 2],
+        'subject_ids': [row[0] for row in subjects],
+        'subject_id': subject_id,
+        'subject_code': dict(subjects)[subject_id],
+        'class_date': class_date,
+        'period': period,
+        'date_from': dataset['date_from'],
+        'date_to': dataset['date_to'],
+        'registered': []
+    }
+
+
+def run_scale(students: int, weeks: int = 16, repeat: int = 5, pattern: str = "realistic",
+              seed: int = 42, only: Optional[List[str]] = None) -> Dict:
+    """
+    Time every benchmark case against a fresh synthetic database
+
+    Returns:
+        Dictionary with the dataset description and per-function timings in milliseconds
+    """
+    original_path = db_utils.DB_PATH
+    with tempfile.TemporaryDirectory(prefix="db-benchmark-") as workdir:
+        db_utils.close_idle_connections()
+        db_utils.DB_PATH = os.path.join(workdir, "attendance.db")
+        try:
+            dataset = load_synthetic_semester(students=students, weeks=weeks, pattern=pattern, seed=seed)
+            ctx = _context(dataset)
+            results = {}
+            for name, kind, func in BENCHMARKS:
+                if only and name not in only:
+                    continue
+                timings = []
+                try:
+                    for run in range(repeat):
+                        db_utils.invalidate_reference_cache()
+                        start = time.perf_counter()
+                        func(ctx, run)
+                        timings.append((time.perf_counter() - start) * 1000)
+                except ImportError as e:
+                    # e.g. get_subject_attendance_matrix without pandas
+                    logger.warning(f"Skipping {name}: {str(e)}")
+                    results[name] = {'kind': kind, 'skipped': str(e)}
+                    continue
+                results[name] = {
+                    'kind': kind,
+                    'runs': repeat,
+                    'median_ms': round(statistics.median(timings), 3),
+                    'min_ms': round(min(timings), 3),
+                    'max_ms': round(max(timings), 3)
+                }
+                logger.info(f"{students:>6} students  {name:38s} {results[name]['median_ms']:>10.3f} ms")
+        finally:
+            db_utils.close_idle_connections()
+            db_utils.invalidate_reference_cache()
+            db_utils.DB_PATH = original_path
+
+    dataset.pop('load', None)
+    return {'dataset': dataset, 'results': results}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(scales: List[int], weeks: int = 16, repeat: int = 5, pattern: str = "realistic",
+                   seed: int = 42, only: Optional[List[str]] = None) -> Dict:
+    """Run every scale and return the full report (see save_report)"""
+    missing = uncovered_functions()
+    if missing:
+        logger.warning(f"db_utils functions without a benchmark: {', '.join(missing)}")
+    return {
+        'meta': {
+            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': f"{platform.system()} {platform.machine()}",
+            'weeks': weeks,
+            'repeat': repeat,
+            'pattern': pattern,
+            'seed': seed,
+            'uncovered': missing
+        },
+        'scales': {str(students): run_scale(students, weeks, repeat, pattern, seed, only) for students in scales}
+    }
+
+
+def save_report(report: Dict, path: Optional[str] = None) -> str:
+    """Write a report as JSON; defaults to BENCHMARK_DIR/db-<timestamp>.json"""
+    if path is None:
+        os.makedirs(BENCHMARK_DIR, exist_ok=True)
+        path = os.path.join(BENCHMARK_DIR, f"db-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare_reports(baseline: Dict, current: Dict, threshold: float = 1.5, min_ms: float = 1.0) -> List[Dict]:
+    """
+    Compare median timings of two reports
+
+    Args:
+        baseline: Earlier report
+        current: New report
+        threshold: Ratio of medians above which a function counts as regressed
+        min_ms: Ignore slowdowns smaller than this many milliseconds (timer noise)
+
+    Returns:
+        One entry per function and scale present in both reports, with the
+        ratio and whether it regressed, worst first
+    """
+    rows = []
+    for scale, scale_report in current['scales'].items():
+        previous = baseline.get('scales', {}).get(scale)
+        if previous is None:
+            continue
+        for name, result in scale_report['results'].items():
+            before = previous['results'].get(name, {})
+            if 'median_ms' not in result or 'median_ms' not in before:
+                continue
+            ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+            rows.append({
+                'scale': scale,
+                'function': name,
+                'baseline_ms': before['median_ms'],
+                'current_ms': result['median_ms'],
+                'ratio': round(ratio, 2),
+                'regressed': ratio > threshold and result['median_ms'] - before['median_ms'] >= min_ms
+            })
+    return sorted(rows, key=lambda row: row['ratio'], reverse=True)
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark db_utils functions on synthetic data")
+    parser.add_argument("--scales", default="60,300,1200", help="comma-separated student counts")
+    parser.add_argument("--weeks", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pattern", default="realistic")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", help="comma-separated function names to run")
+    parser.add_argument("--output", help="result file (defaults to BENCHMARK_DIR/db-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.5, help="slowdown ratio counted as a regression")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    report = run_benchmarks([int(s) for s in args.scales.split(",")], args.weeks, args.repeat,
+                            args.pattern, args.seed, args.only.split(",") if args.only else None)
+    print(f"Results written to {save_report(report, args.output)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            comparison = compare_reports(json.load(f), report, args.threshold, args.min_ms)
+        regressions = [row for row in comparison if row['regressed']]
+        for row in comparison:
+            flag = "REGRESSED" if row['regressed'] else ""
+            print(f"{row['scale']:>6} {row['function']:38s} {row['baseline_ms']:>10.3f} -> "
+                  f"{row['current_ms']:>10.3f} ms  x{row['ratio']:<6} {flag}")
+        sys.exit(1 if regressions else 0)
@@ -1,9 +1,15 @@
 import os
+import json
 import sqlite3
 import datetime
 import logging
+import functools
+import inspect
+import threading
 from contextlib import contextmanager
-from typing import Generator, Optional
+from typing import Generator
+
+from utils.query_stats import TimedCursor
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -22,35 +28,153 @@ except ImportError:
 if not isinstance(DB_PATH, str):
     DB_PATH = str(DB_PATH)
 
-def get_connection():
-    """Get a connection to the SQLite database"""
-    try:
-        # Ensure directory exists
-        db_dir = os.path.dirname(DB_PATH)
+# Connection tuning (WAL lets report reads run while attendance is being written)
+try:
+    from config import (
+        DB_BUSY_TIMEOUT,
+        DB_JOURNAL_MODE,
+        DB_SYNCHRONOUS,
+        DB_CACHE_SIZE_KB,
+        DB_MMAP_SIZE,
+        DB_POOL_SIZE,
+        DB_STATEMENT_CACHE_SIZE,
+        DB_READ_CACHE_MAX_ENTRIES
+    )
+except ImportError:
+    DB_BUSY_TIMEOUT = 10.0
+    DB_JOURNAL_MODE = "WAL"
+    DB_SYNCHRONOUS = "NORMAL"
+    DB_CACHE_SIZE_KB = 16384
+    DB_MMAP_SIZE = 268435456
+    DB_POOL_SIZE = 4
+    DB_STATEMENT_CACHE_SIZE = 256
+    DB_READ_CACHE_MAX_ENTRIES = 2048
+
+# Per-division database shards (see use_division)
+try:
+    from config import SHARDING_ENABLED, SHARD_DIR
+    SHARD_DIR = str(SHARD_DIR)
+except ImportError:
+    SHARDING_ENABLED = False
+    SHARD_DIR = os.path.join("db", "shards")
+
+# Idle connections per thread, keyed by database path (sqlite3 connections are bound to their thread)
+_pool_local = threading.local()
+_prepared_paths = set()
+
+# Database paths whose schema has been migrated by this process
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+class PooledConnection(sqlite3.Connection):
+    """
+    SQLite connection handed out by get_connection().
+    
+    close() rolls back anything left uncommitted and returns the connection to
+    its thread's idle pool instead of closing it, so the next get_connection()
+    on that thread skips the connect and PRAGMA setup and keeps its prepared
+    statement cache. discard() closes it for real.
+    
+    Cursors are TimedCursor instances, which record every statement's timing
+    in utils.query_stats.
+    """
+    _idle = None
+    # PRAGMA data_version when this connection last synced the table versions
+    _data_version = None
+    # Attendance archive file attached to this connection as "archive"
+    _archive_attached = None
+    
+    def close(self):
+        idle = self._idle
+        if idle is None:
+            super().close()
+            return
+        if any(conn is self for conn in idle):
+            return  # already returned to the pool
+        try:
+            if self.in_transaction:
+                self.rollback()
+        except sqlite3.Error:
+            self.discard()
+            return
+        if len(idle) < DB_POOL_SIZE:
+            idle.append(self)
+        else:
+            self.discard()
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def discard(self):
+        self._idle = None
+        super().close()
+
+def _open_connection(db_path, idle):
+    """Open and tune a new connection that returns to the given idle pool"""
+    if db_path not in _prepared_paths:
+        # Ensure directory exists (once per database path and process)
+        db_dir = os.path.dirname(db_path)
         if db_dir:
             os.makedirs(db_dir, exist_ok=True)
         
         # Log database path for debugging (especially in deployment)
-        logger.debug(f"Connecting to database at: {DB_PATH}")
-        logger.debug(f"Database file exists: {os.path.exists(DB_PATH)}")
+        logger.debug(f"Connecting to database at: {db_path}")
+        logger.debug(f"Database file exists: {os.path.exists(db_path)}")
+        _prepared_paths.add(db_path)
+    
+    conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT, factory=PooledConnection,
+                           cached_statements=DB_STATEMENT_CACHE_SIZE)
+    conn._idle = idle
+    # Enable foreign keys
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = -{int(DB_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+def get_connection():
+    """
+    Get a connection to the SQLite database
+    
+    Connections are pooled per thread: calling close() hands the connection back
+    for reuse (rolling back any uncommitted transaction), so callers keep the
+    usual get_connection() ... conn.close() pattern.
+    """
+    try:
+        pools = getattr(_pool_local, 'pools', None)
+        if pools is None:
+            pools = _pool_local.pools = {}
+        db_path = current_db_path()
+        idle = pools.setdefault(db_path, [])
         
-        conn = sqlite3.connect(DB_PATH, timeout=10.0)
+        conn = idle.pop() if idle else _open_connection(db_path, idle)
         conn.row_factory = sqlite3.Row  # Enable row factory for column name access
-        # Enable foreign keys
-        conn.execute("PRAGMA foreign_keys = ON")
         return conn
     except Exception as e:
         logger.error(f"Database connection error: {str(e)}")
-        logger.error(f"Database path: {DB_PATH}")
+        logger.error(f"Database path: {current_db_path()}")
         logger.error(f"Current working directory: {os.getcwd()}")
         raise
 
+def close_idle_connections():
+    """Close this thread's pooled connections (e.g. before replacing the database file)"""
+    pools = getattr(_pool_local, 'pools', None) or {}
+    for idle in pools.values():
+        while idle:
+            idle.pop().discard()
+
 @contextmanager
-def get_db_connection() -> Generator[sqlite3.Connection, None, None]:
+def get_db_connection(directory=False) -> Generator[sqlite3.Connection, None, None]:
     """
     Context manager for database connections.
     Ensures proper connection cleanup.
     
+    Args:
+        directory: Connect to the directory database (users, recognition jobs)
+            instead of this thread's division shard
+    
     Usage:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -58,7 +182,7 @@ def get_db_connection() -> Generator[sqlite3.Connection, None, None]:
     """
     conn = None
     try:
-        conn = get_connection()
+        conn = get_directory_connection() if directory else get_connection()
         yield conn
         conn.commit()
     except Exception as e:
@@ -70,187 +194,518 @@ def get_db_connection() -> Generator[sqlite3.Connection, None, None]:
         if conn:
             conn.close()
 
-def init_db():
-    """Initialize the database with required tables if they don't exist"""
-    # Ensure DB_PATH is a string
-    db_path_str = str(DB_PATH) if not isinstance(DB_PATH, str) else DB_PATH
+# With SHARDING_ENABLED each department/division keeps its students, sessions,
+# attendance and email outbox in its own database under SHARD_DIR, so
+# attendance writers of different divisions never wait on the same lock.
+# DB_PATH stays the directory database holding the users and recognition jobs.
+# Every function in this module works on the database the calling thread is
+# routed to (use_division / routed_to), DB_PATH when it is not routed.
+_route_local = threading.local()
+
+def current_db_path():
+    """Database the calling thread reads and writes: its division shard, or DB_PATH"""
+    return getattr(_route_local, 'db_path', None) or DB_PATH
+
+def _shard_name(part):
+    """File-name-safe form of a department or division name (never contains '_')"""
+    return "".join(ch if ch.isalnum() else "-" for ch in str(part).strip()) or "-"
+
+def shard_db_path(department, division):
+    """Path of the database shard of a department's division"""
+    return os.path.join(SHARD_DIR, f"{_shard_name(department)}_{_shard_name(division)}.db")
+
+def use_division(department, division):
+    """
+    Route the calling thread to a division's shard (creating it on first use)
+    
+    A no-op unless SHARDING_ENABLED. Call it at the start of every unit of
+    work (e.g. each Streamlit script run), since threads are reused. Passing
+    no division routes the thread back to DB_PATH.
+    
+    Returns:
+        The database path the thread now uses
+    """
+    if not SHARDING_ENABLED or not division:
+        _route_local.db_path = None
+        return DB_PATH
+    _route_local.db_path = shard_db_path(department, division)
+    init_db()
+    return _route_local.db_path
+
+@contextmanager
+def routed_to(db_path):
+    """Temporarily route the calling thread to a database (e.g. one shard of list_shards())"""
+    previous = getattr(_route_local, 'db_path', None)
+    _route_local.db_path = None if db_path == DB_PATH else db_path
+    try:
+        yield db_path
+    finally:
+        _route_local.db_path = previous
+
+def list_shards(department=None):
+    """
+    Existing division shards as (department, division, db_path), sorted
     
-    # Create directory if it doesn't exist
-    db_dir = os.path.dirname(db_path_str)
-    if db_dir:
-        os.makedirs(db_dir, exist_ok=True)
-        logger.info(f"Database directory created/verified: {db_dir}")
+    Args:
+        department: Only list this department's shards
+    """
+    if not os.path.isdir(SHARD_DIR):
+        return []
+    shards = []
+    for filename in sorted(os.listdir(SHARD_DIR)):
+        stem, ext = os.path.splitext(filename)
+        if ext != ".db" or stem.endswith("_archive") or "_" not in stem:
+            continue
+        shard_department, shard_division = stem.split("_", 1)
+        if department is None or shard_department == _shard_name(department):
+            shards.append((shard_department, shard_division, os.path.join(SHARD_DIR, filename)))
+    return shards
+
+def database_paths():
+    """Every database holding attendance: DB_PATH, then the division shards"""
+    if not SHARDING_ENABLED:
+        return [DB_PATH]
+    return [DB_PATH] + [path for _, _, path in list_shards()]
+
+def get_directory_connection():
+    """Get a pooled connection to the directory database (DB_PATH), whatever the thread's route"""
+    with routed_to(DB_PATH):
+        return get_connection()
+
+# Monday of the week a YYYY-MM-DD date falls in
+_WEEK_START_SQL = "date({0}, '-6 days', 'weekday 1')"
+
+def _summary_upsert(sign, alias):
+    """SQL adding (sign=1) or removing (sign=-1) one attendance row in the summary tables"""
+    present = f"CASE WHEN {alias}.status = 'present' THEN {sign} ELSE 0 END"
+    return f'''
+        INSERT INTO attendance_daily (student_id, date, subject_id, present_count, total_count)
+        VALUES ({alias}.student_id, {alias}.date, {alias}.subject_id, {present}, {sign})
+        ON CONFLICT (student_id, date, subject_id) DO UPDATE SET
+            present_count = present_count + excluded.present_count,
+            total_count = total_count + excluded.total_count;
+        INSERT INTO attendance_weekly (student_id, week_start, subject_id, present_count, total_count)
+        VALUES ({alias}.student_id, {_WEEK_START_SQL.format(alias + '.date')}, {alias}.subject_id, {present}, {sign})
+        ON CONFLICT (student_id, week_start, subject_id) DO UPDATE SET
+            present_count = present_count + excluded.present_count,
+            total_count = total_count + excluded.total_count;
+    '''
+
+# Keep attendance_daily/attendance_weekly in step with every attendance write.
+# Writers must upsert rather than INSERT OR REPLACE: REPLACE deletes the old
+# row without firing the DELETE trigger, which would count it twice.
+_SUMMARY_TRIGGERS = (
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_insert
+    AFTER INSERT ON attendance
+    BEGIN
+        {_summary_upsert(1, 'NEW')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_delete
+    AFTER DELETE ON attendance
+    BEGIN
+        {_summary_upsert(-1, 'OLD')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_update
+    AFTER UPDATE OF student_id, subject_id, date, status ON attendance
+    BEGIN
+        {_summary_upsert(-1, 'OLD')}
+        {_summary_upsert(1, 'NEW')}
+    END
+    ''',
+)
+
+def _rebuild_attendance_summaries(cursor, date_from=None, date_to=None):
+    """Recompute the summary tables from the attendance table, optionally only for a date range"""
+    if date_from and date_to:
+        week_start = _WEEK_START_SQL.format('?')
+        cursor.execute('DELETE FROM attendance_daily WHERE date BETWEEN ? AND ?', (date_from, date_to))
+        cursor.execute('''
+        INSERT INTO attendance_daily (student_id, date, subject_id, present_count, total_count)
+        SELECT student_id, date, subject_id, COUNT(CASE WHEN status = 'present' THEN 1 END), COUNT(*)
+        FROM attendance WHERE date BETWEEN ? AND ?
+        GROUP BY student_id, date, subject_id
+        ''', (date_from, date_to))
+        # Weeks overlapping the range, recomputed from all of their days
+        cursor.execute(f'''
+        DELETE FROM attendance_weekly WHERE week_start BETWEEN {week_start} AND {week_start}
+        ''', (date_from, date_to))
+        cursor.execute(f'''
+        INSERT INTO attendance_weekly (student_id, week_start, subject_id, present_count, total_count)
+        SELECT student_id, {_WEEK_START_SQL.format('date')}, subject_id, SUM(present_count), SUM(total_count)
+        FROM attendance_daily WHERE date BETWEEN {week_start} AND date({week_start}, '+6 days')
+        GROUP BY 1, 2, 3
+        ''', (date_from, date_to))
+        return
+    cursor.execute('DELETE FROM attendance_daily')
+    cursor.execute('DELETE FROM attendance_weekly')
+    cursor.execute('''
+    INSERT INTO attendance_daily (student_id, date, subject_id, present_count, total_count)
+    SELECT student_id, date, subject_id, COUNT(CASE WHEN status = 'present' THEN 1 END), COUNT(*)
+    FROM attendance
+    GROUP BY student_id, date, subject_id
+    ''')
+    cursor.execute(f'''
+    INSERT INTO attendance_weekly (student_id, week_start, subject_id, present_count, total_count)
+    SELECT student_id, {_WEEK_START_SQL.format('date')}, subject_id, SUM(present_count), SUM(total_count)
+    FROM attendance_daily
+    GROUP BY 1, 2, 3
+    ''')
+
+def rebuild_attendance_summaries():
+    """
+    Recompute the attendance summary tables from scratch
     
-    logger.info(f"Initializing database at: {db_path_str}")
-    logger.info(f"Database file exists: {os.path.exists(db_path_str)}")
+    Only needed after attendance rows were changed outside the application,
+    e.g. restored from a dump with triggers disabled.
     
+    Returns:
+        True if the summaries were rebuilt, False otherwise
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
-    # Create users table for authentication
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        role TEXT NOT NULL CHECK(role IN ('HOD', 'Class Teacher', 'Teacher')),
-        name TEXT NOT NULL,
-        email TEXT,
-        department TEXT DEFAULT 'ENTC',
-        is_active INTEGER DEFAULT 1,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_login TIMESTAMP
-    )
-    ''')
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        _rebuild_attendance_summaries(cursor)
+        conn.commit()
+        invalidate_reference_cache('attendance')
+        logger.info("Rebuilt attendance summary tables")
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error rebuilding attendance summaries: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+def _summary_counts_sql(date_from=None, date_to=None, student_id=None, conn=None):
+    """
+    Build a query returning (student_id, subject_id, present_count, total_count)
+    for a date range from the summary tables
     
-    # Create students table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS students (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        roll_no TEXT UNIQUE NOT NULL,
-        name TEXT NOT NULL,
-        email TEXT,
-        department TEXT DEFAULT 'ENTC',
-        year TEXT DEFAULT 'B.Tech',
-        division TEXT DEFAULT 'B',
-        image_path TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
+    Weeks lying entirely inside the range are read from attendance_weekly and
+    only the partial weeks at either end from attendance_daily, so a year-long
+    range reads about one row per week for each student and subject.
     
-    # Create subjects table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS subjects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        code TEXT UNIQUE NOT NULL,
-        name TEXT NOT NULL
-    )
-    ''')
+    Args:
+        conn: Connection the query will run on; when given, archived terms the
+              range touches are included (see _partition)
     
-    # Create student_subjects table (many-to-many relationship)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS student_subjects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER NOT NULL,
-        subject_id INTEGER NOT NULL,
-        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
-        FOREIGN KEY (subject_id) REFERENCES subjects (id) ON DELETE CASCADE,
-        UNIQUE (student_id, subject_id)
-    )
-    ''')
+    Returns:
+        Tuple of (sql, params)
+    """
+    student_filter = "AND student_id = ?" if student_id is not None else ""
+    student_params = [student_id] if student_id is not None else []
     
-    # Create attendance table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS attendance (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER NOT NULL,
-        subject_id INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        period TEXT NOT NULL,
-        status TEXT DEFAULT 'present',
-        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
-        FOREIGN KEY (subject_id) REFERENCES subjects (id) ON DELETE CASCADE,
-        UNIQUE (student_id, subject_id, date, period)
-    )
-    ''')
+    def table(name, part_from=None, part_to=None):
+        return _partition(conn, name, part_from, part_to) if conn is not None else name
+    
+    if not (date_from and date_to):
+        return f'''
+        SELECT student_id, subject_id, SUM(present_count) as present_count, SUM(total_count) as total_count
+        FROM {table('attendance_weekly')} WHERE 1 = 1 {student_filter}
+        GROUP BY student_id, subject_id
+        ''', student_params
     
-    # Insert default subjects if they don't exist
-    # Try to import from config, fallback to hardcoded list
     try:
-        from config import DEFAULT_SUBJECTS
-        subjects = DEFAULT_SUBJECTS
-    except ImportError:
-        # Fallback to hardcoded subjects
-        subjects = [
-            ("FOC", "Fiber Optic Communication"),
-            ("ME", "Microwave Engineering"),
-            ("MC", "Mobile Computing"),
-            ("Ewaste", "E-Waste Management"),
-            ("DSAJ", "Data Structures and Algorithms in Java"),
-            ("EEFM", "Engineering Economics and Financial Management"),
-            ("ME Lab", "Microwave Engineering Lab"),
-            ("Mini project", "Mini Project"),
-        ]
-    
-    for code, name in subjects:
-        cursor.execute('''
-        INSERT OR IGNORE INTO subjects (code, name) VALUES (?, ?)
-        ''', (code, name))
-    
-    # Create default users if no users exist
-    cursor.execute('SELECT COUNT(*) as count FROM users')
-    user_count = cursor.fetchone()['count']
-    
-    if user_count == 0:
-        import hashlib
-        
-        def hash_password(password):
-            return hashlib.sha256(password.encode()).hexdigest()
-        
-        # Sample users for all roles
-        sample_users = [
-            {
-                'username': 'admin',
-                'password': 'admin123',
-                'role': 'HOD',
-                'name': 'Head of Department',
-                'email': 'hod@example.com',
-                'department': 'ENTC'
-            },
-            {
-                'username': 'classteacher',
-                'password': 'teacher123',
-                'role': 'Class Teacher',
-                'name': 'Class Teacher',
-                'email': 'classteacher@example.com',
-                'department': 'ENTC'
-            },
-            {
-                'username': 'teacher',
-                'password': 'teacher123',
-                'role': 'Teacher',
-                'name': 'Subject Teacher',
-                'email': 'teacher@example.com',
-                'department': 'ENTC'
-            }
-        ]
-        
-        # Insert all sample users
-        for user in sample_users:
-            password_hash = hash_password(user['password'])
-            cursor.execute('''
-            INSERT INTO users (username, password_hash, role, name, email, department)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user['username'], password_hash, user['role'], user['name'], 
-                  user['email'], user['department']))
-            logger.info(f"Sample user created: {user['username']} ({user['role']}) - password: {user['password']}")
-        
-        logger.info("Sample authentication users created successfully!")
+        start = datetime.date.fromisoformat(str(date_from))
+        end = datetime.date.fromisoformat(str(date_to))
+        # First Monday on or after the start, last Monday whose week ends by the end
+        first_week = start + datetime.timedelta(days=-start.weekday() % 7)
+        last_week = end - datetime.timedelta(days=end.weekday() + (0 if end.weekday() == 6 else 7))
+    except ValueError:
+        first_week = last_week = None
+    
+    if first_week is None or first_week > last_week:
+        # No whole week inside the range
+        parts = [(f"{table('attendance_daily', date_from, date_to)} WHERE date BETWEEN ? AND ?",
+                  [date_from, date_to])]
+    else:
+        weeks_to = (last_week + datetime.timedelta(days=6)).isoformat()
+        parts = [(f"{table('attendance_weekly', first_week.isoformat(), weeks_to)} WHERE week_start BETWEEN ? AND ?",
+                  [first_week.isoformat(), last_week.isoformat()])]
+        if start < first_week:
+            head_to = (first_week - datetime.timedelta(days=1)).isoformat()
+            parts.append((f"{table('attendance_daily', date_from, head_to)} WHERE date BETWEEN ? AND ?",
+                          [date_from, head_to]))
+        if last_week + datetime.timedelta(days=6) < end:
+            tail_from = (last_week + datetime.timedelta(days=7)).isoformat()
+            parts.append((f"{table('attendance_daily', tail_from, date_to)} WHERE date BETWEEN ? AND ?",
+                          [tail_from, date_to]))
+    
+    union = "\n        UNION ALL\n        ".join(
+        f"SELECT student_id, subject_id, present_count, total_count FROM {source} {student_filter}"
+        for source, _ in parts
+    )
+    params = []
+    for _, part_params in parts:
+        params += part_params + student_params
+    return f'''
+    SELECT student_id, subject_id, SUM(present_count) as present_count, SUM(total_count) as total_count
+    FROM (
+        {union}
+    )
+    GROUP BY student_id, subject_id
+    ''', params
+
+def init_db():
+    """
+    Bring the database schema up to date
     
-    conn.commit()
+    Runs the pending migrations from utils.migrations once per process and
+    database path; later calls (e.g. every Streamlit rerun) return immediately.
+    """
+    db_path_str = str(current_db_path())
+    if db_path_str in _initialized_paths:
+        return
     
-    # Verify database was created and has tables
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-    tables = cursor.fetchall()
-    table_names = [table[0] for table in tables]
-    logger.info(f"Database initialized. Tables created: {', '.join(table_names)}")
+    with _init_lock:
+        if db_path_str in _initialized_paths:
+            return
+        
+        # Create directory if it doesn't exist
+        db_dir = os.path.dirname(db_path_str)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        
+        from utils.migrations import migrate, latest_version
+        
+        logger.info(f"Initializing database at: {db_path_str}")
+        applied = migrate()
+        invalidate_reference_cache()
+        if applied:
+            logger.info(f"Applied schema migrations {applied}; database is at version {latest_version()}")
+        
+        _initialized_paths.add(db_path_str)
+        logger.info(f"Database initialized successfully at: {db_path_str}")
+
+# Reads of rosters, subjects, enrollments and attendance reports are cached per
+# process and database path, and dropped by the functions that write those
+# tables. Writes made by other processes are noticed through table_versions,
+# a per-table counter bumped by triggers on every committed change (see
+# _sync_table_versions).
+_read_cache = {}
+_read_cache_lock = threading.Lock()
+_read_generation = 0
+_table_versions = {}
+_MISSING = object()
+
+# Tables whose changes are counted in table_versions
+VERSIONED_TABLES = ('students', 'subjects', 'student_subjects', 'attendance', 'class_sessions')
+
+# Tables the attendance report functions read
+_REPORT_TABLES = ('attendance', 'class_sessions', 'students', 'subjects', 'student_subjects')
+
+def _copy_reference(value):
+    """Shallow-copy cached lists/dicts so callers can modify what they get back"""
+    if isinstance(value, list):
+        return [dict(item) if isinstance(item, dict) else item for item in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+def _sync_table_versions():
+    """
+    Drop cached reads made stale by other processes' commits
     
-    # Check if database has data
+    PRAGMA data_version only changes for a connection when some other
+    connection has committed, so the common case costs one PRAGMA on a pooled
+    connection. Only then are the table_versions counters read and compared
+    with the versions this process last saw.
+    """
+    db_path = current_db_path()
+    conn = get_connection()
     try:
-        cursor.execute("SELECT COUNT(*) FROM students")
-        student_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM subjects")
-        subject_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM attendance")
-        attendance_count = cursor.fetchone()[0]
-        logger.info(f"Database status - Students: {student_count}, Subjects: {subject_count}, Attendance records: {attendance_count}")
-    except Exception as e:
-        logger.warning(f"Could not check database data counts: {str(e)}")
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if conn._data_version == data_version:
+            return
+        try:
+            rows = conn.execute("SELECT table_name, version FROM table_versions").fetchall()
+        except sqlite3.OperationalError:
+            return  # schema not migrated yet
+        conn._data_version = data_version
+        current = {row['table_name']: row['version'] for row in rows}
+    finally:
+        conn.close()
     
-    conn.close()
+    with _read_cache_lock:
+        known = _table_versions.get(db_path)
+        _table_versions[db_path] = current
+    if known is None:
+        return
+    changed = [table for table in current if known.get(table) != current[table]]
+    if changed:
+        logger.debug(f"Tables changed by another connection: {', '.join(changed)}")
+        invalidate_reference_cache(*changed)
+
+def _cached_read(*tables):
+    """
+    Cache a reader until one of its tables is written
+    
+    Args:
+        tables: Names of the tables the reader depends on
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _sync_table_versions()
+            # Key on the bound arguments so positional and keyword calls share an entry
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (current_db_path(), func.__name__, tuple(bound.arguments.items()))
+            with _read_cache_lock:
+                entry = _read_cache.get(key, _MISSING)
+                generation = _read_generation
+            if entry is not _MISSING:
+                return _copy_reference(entry[1])
+            
+            value = func(*args, **kwargs)
+            with _read_cache_lock:
+                # Skip storing if a write invalidated the cache while we were reading
+                if generation == _read_generation:
+                    if len(_read_cache) >= DB_READ_CACHE_MAX_ENTRIES:
+                        del _read_cache[next(iter(_read_cache))]  # oldest entry
+                    _read_cache[key] = (tables, value)
+            return _copy_reference(value)
+        wrapper.tables = tables
+        return wrapper
+    return decorator
+
+def invalidate_reference_cache(*tables):
+    """
+    Drop cached reads that depend on any of the given tables
+    
+    Args:
+        tables: Table names; drops everything when none are given
+    """
+    global _read_generation
+    with _read_cache_lock:
+        _read_generation += 1
+        if not tables:
+            _read_cache.clear()
+            return
+        for key in [key for key, (depends_on, _) in _read_cache.items()
+                    if set(depends_on) & set(tables)]:
+            del _read_cache[key]
+
+# Callbacks told about the attendance this process writes (see add_attendance_listener)
+_attendance_listeners = []
+
+def add_attendance_listener(callback):
+    """
+    Call callback(change) after every attendance write this process commits
+
+    change is a dictionary with the db_path, subject_id, date and period written, the
+    statuses written (student_id to status) and versions_before and
+    versions_after: the table_versions counters read inside the write
+    transaction. A listener whose state matches versions_before can apply the
+    change and move on to versions_after; otherwise it should reload.
+    """
+    if callback not in _attendance_listeners:
+        _attendance_listeners.append(callback)
+
+def _listener_versions(cursor):
+    """table_versions counters for the attendance listeners (None when there are none)"""
+    if not _attendance_listeners:
+        return None
+    cursor.execute("SELECT table_name, version FROM table_versions")
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+def _notify_attendance_listeners(subject_id, date, period, statuses, versions_before, versions_after):
+    """Pass a committed attendance write to the listeners without letting their failures break the write"""
+    if versions_before is None or not statuses:
+        return
+    change = {'db_path': current_db_path(), 'subject_id': subject_id, 'date': date, 'period': period, 'statuses': statuses,
+              'versions_before': versions_before, 'versions_after': versions_after}
+    for callback in list(_attendance_listeners):
+        try:
+            callback(change)
+        except Exception as e:
+            logger.error(f"Attendance listener {getattr(callback, '__name__', callback)} failed: {str(e)}")
+
+# Closed terms are moved out of the live attendance tables into per-term tables
+# of an archive database next to the main one (utils.archive_utils). Readers
+# taking a date range name their tables through _partition(), which leaves the
+# SQL unchanged unless the range reaches into an archived term.
+_PARTITION_COLUMNS = {
+    'attendance': 'id, student_id, subject_id, date, period, status, session_id',
+    'class_sessions': 'id, subject_id, date, period, taken_by, capture_source, capture_metadata, created_at, updated_at',
+    'attendance_daily': 'student_id, date, subject_id, present_count, total_count',
+    'attendance_weekly': 'student_id, week_start, subject_id, present_count, total_count',
+}
+
+def archive_db_path(db_path=None):
+    """Path of the attendance archive belonging to a database (defaults to the thread's database)"""
+    return os.path.splitext(db_path or current_db_path())[0] + "_archive.db"
+
+@_cached_read('attendance')
+def get_archived_terms():
+    """Terms whose attendance has been archived, oldest first"""
+    conn = get_connection()
+    try:
+        rows = conn.execute('''
+            SELECT term, date_from, date_to, table_suffix, attendance_rows, session_rows, archived_at
+            FROM attendance_terms ORDER BY date_from
+        ''').fetchall()
+        return [dict(row) for row in rows]
+    except sqlite3.OperationalError:
+        return []  # schema not migrated yet
+    finally:
+        conn.close()
+
+def _archived_term_for(date):
+    """The archived term containing a date, or None"""
+    for term in get_archived_terms():
+        if term['date_from'] <= str(date) <= term['date_to']:
+            return term
+    return None
+
+def _attach_archive(conn):
+    """Attach the attendance archive to a connection as "archive" (once per connection)"""
+    path = archive_db_path()
+    if getattr(conn, '_archive_attached', None) != path:
+        if not os.path.exists(path):
+            raise sqlite3.OperationalError(f"Attendance archive {path} is missing")
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        conn._archive_attached = path
+
+def _partition(conn, table, date_from=None, date_to=None):
+    """
+    SQL standing for a table's rows in a date range, archived terms included
     
-    db_path_str = str(DB_PATH) if not isinstance(DB_PATH, str) else DB_PATH
-    logger.info(f"Database initialized successfully at: {db_path_str}")
+    Returns the table name itself when the range does not reach into an
+    archived term (the hot path), the term's archive table when it lies
+    entirely inside one (archived dates cannot be written), and otherwise a
+    UNION ALL of the live table and the archive tables involved. Without a
+    range every archived term is included.
+    """
+    terms = [
+        term for term in get_archived_terms()
+        if not (date_from and date_to) or (term['date_from'] <= str(date_to) and term['date_to'] >= str(date_from))
+    ]
+    if not terms:
+        return table
+    _attach_archive(conn)
+    if date_from and date_to and len(terms) == 1 \
+            and terms[0]['date_from'] <= str(date_from) and str(date_to) <= terms[0]['date_to']:
+        return f"archive.{table}_{terms[0]['table_suffix']}"
+    columns = _PARTITION_COLUMNS[table]
+    parts = [f"SELECT {columns} FROM main.{table}"]
+    parts += [f"SELECT {columns} FROM archive.{table}_{term['table_suffix']}" for term in terms]
+    return "(" + " UNION ALL ".join(parts) + ")"
+
+def _check_not_archived(date):
+    """Refuse writes to a date whose term has been archived"""
+    term = _archived_term_for(date)
+    if term is not None:
+        raise ValueError(f"Attendance for {date} is archived in term {term['term']}; restore the term to change it")
 
 def register_student(roll_no, name, department, year, division, image_path, subject_ids, email=None):
     """Register a new student in the database"""
@@ -270,18 +725,19 @@ def register_student(roll_no, name, department, year, division, image_path, subj
         # If no subjects provided, enroll in all subjects by default
         if not subject_ids or len(subject_ids) == 0:
             logger.info(f"No subjects provided for student {roll_no}, enrolling in all subjects by default")
-            cursor.execute('SELECT id FROM subjects')
-            all_subjects = cursor.fetchall()
-            subject_ids = [s['id'] for s in all_subjects]
-        
-        # Associate student with subjects
-        for subject_id in subject_ids:
             cursor.execute('''
             INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
+            SELECT ?, id FROM subjects
+            ''', (student_id,))
+        else:
+            # Associate student with subjects
+            cursor.executemany('''
+            INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
             VALUES (?, ?)
-            ''', (student_id, subject_id))
+            ''', [(student_id, subject_id) for subject_id in subject_ids])
         
         conn.commit()
+        invalidate_reference_cache('students', 'student_subjects')
         return student_id
     except sqlite3.IntegrityError:
         # Roll number already exists
@@ -290,6 +746,7 @@ def register_student(roll_no, name, department, year, division, image_path, subj
     finally:
         conn.close()
 
+@_cached_read('students')
 def get_all_students():
     """Get all students from the database"""
     try:
@@ -335,12 +792,13 @@ def get_all_students():
         return students
     except Exception as e:
         logger.error(f"Error retrieving students from database: {str(e)}")
-        logger.error(f"Database path: {DB_PATH}")
-        logger.error(f"Database exists: {os.path.exists(str(DB_PATH))}")
+        logger.error(f"Database path: {current_db_path()}")
+        logger.error(f"Database exists: {os.path.exists(current_db_path())}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         return []
 
+@_cached_read('students', 'student_subjects')
 def get_students_by_subject(subject_id):
     """Get all students enrolled in a specific subject"""
     conn = get_connection()
@@ -368,6 +826,7 @@ def get_students_by_subject(subject_id):
     conn.close()
     return students
 
+@_cached_read('subjects')
 def get_subjects():
     """Get all subjects from the database"""
     conn = get_connection()
@@ -382,6 +841,7 @@ def get_subjects():
     
     return subjects
 
+@_cached_read('subjects')
 def get_subject_by_id(subject_id):
     """Get subject details by ID"""
     conn = get_connection()
@@ -401,8 +861,107 @@ def get_subject_by_id(subject_id):
     
     return subject
 
+def _get_or_create_session(cursor, subject_id, date, period, taken_by=None,
+                           capture_source=None, capture_metadata=None):
+    """Get the class session for a subject/date/period inside the caller's transaction, creating it if needed"""
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    metadata_json = json.dumps(capture_metadata) if capture_metadata is not None else None
+    
+    cursor.execute('''
+        INSERT OR IGNORE INTO class_sessions
+            (subject_id, date, period, taken_by, capture_source, capture_metadata, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (subject_id, date, period, taken_by, capture_source, metadata_json, now))
+    
+    if cursor.rowcount == 0 and (taken_by or capture_source or metadata_json):
+        # Session already held; record who retook it and how
+        cursor.execute('''
+            UPDATE class_sessions
+            SET taken_by = COALESCE(?, taken_by),
+                capture_source = COALESCE(?, capture_source),
+                capture_metadata = COALESCE(?, capture_metadata),
+                updated_at = ?
+            WHERE subject_id = ? AND date = ? AND period = ?
+        ''', (taken_by, capture_source, metadata_json, now, subject_id, date, period))
+    
+    cursor.execute('''
+        SELECT id FROM class_sessions WHERE subject_id = ? AND date = ? AND period = ?
+    ''', (subject_id, date, period))
+    return cursor.fetchone()[0]
+
+def get_class_sessions(subject_id=None, date_from=None, date_to=None):
+    """
+    Get the classes held, newest first
+    
+    Args:
+        subject_id: Optional subject to filter by
+        date_from: Optional start date (YYYY-MM-DD), inclusive
+        date_to: Optional end date (YYYY-MM-DD), inclusive
+        
+    Returns:
+        List of session dictionaries with subject code/name, attendance counts
+        and decoded capture_metadata
+    """
+    conditions = []
+    params = []
+    if subject_id is not None:
+        conditions.append("cs.subject_id = ?")
+        params.append(subject_id)
+    if date_from and date_to:
+        conditions.append("cs.date BETWEEN ? AND ?")
+        params.extend([date_from, date_to])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        attendance = _partition(conn, 'attendance', date_from, date_to)
+        cursor.execute(f'''
+            SELECT
+                cs.*,
+                sub.code as subject_code,
+                sub.name as subject_name,
+                (SELECT COUNT(*) FROM {attendance} a
+                 WHERE a.session_id = cs.id AND a.status = 'present') as present_count,
+                (SELECT COUNT(*) FROM {attendance} a WHERE a.session_id = cs.id) as marked_count
+            FROM {_partition(conn, 'class_sessions', date_from, date_to)} cs
+            JOIN subjects sub ON sub.id = cs.subject_id
+            {where}
+            ORDER BY cs.date DESC, cs.period DESC
+        ''', params)
+        sessions = []
+        for row in cursor.fetchall():
+            session = dict(row)
+            session['capture_metadata'] = json.loads(session['capture_metadata']) if session['capture_metadata'] else None
+            sessions.append(session)
+        return sessions
+    finally:
+        conn.close()
+
+def count_held_classes(date_from, date_to, subject_id=None):
+    """Count the classes held in a date range, optionally for one subject"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        sessions = _partition(conn, 'class_sessions', date_from, date_to)
+        if subject_id is None:
+            cursor.execute(f'''
+                SELECT COUNT(*) FROM {sessions} WHERE date BETWEEN ? AND ?
+            ''', (date_from, date_to))
+        else:
+            cursor.execute(f'''
+                SELECT COUNT(*) FROM {sessions} WHERE subject_id = ? AND date BETWEEN ? AND ?
+            ''', (subject_id, date_from, date_to))
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
 def mark_attendance(student_id, subject_id, date, period, status="present"):
-    """Mark attendance for a student and send email notification"""
+    """Mark attendance for a student and queue the email notification"""
+    from utils.email_outbox import enqueue_attendance_emails, notify_dispatcher
+    
     print(f"MARK_ATTENDANCE CALLED: student_id={student_id}, subject_id={subject_id}, date={date}, period={period}")
     conn = get_connection()
     cursor = conn.cursor()
@@ -410,13 +969,28 @@ def mark_attendance(student_id, subject_id, date, period, status="present"):
     try:
         # Log detailed information for debugging
         logger.info(f"Marking attendance: student_id={student_id}, subject_id={subject_id}, date={date}, period={period}, status={status}")
+        _check_not_archived(date)
         
+        cursor.execute('BEGIN IMMEDIATE')
+        versions_before = _listener_versions(cursor)
+        session_id = _get_or_create_session(cursor, subject_id, date, period)
         cursor.execute('''
-        INSERT OR REPLACE INTO attendance (student_id, subject_id, date, period, status)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (student_id, subject_id, date, period, status))
+        INSERT INTO attendance (student_id, subject_id, date, period, status, session_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (student_id, subject_id, date, period) DO UPDATE SET
+            status = excluded.status, session_id = excluded.session_id
+        ''', (student_id, subject_id, date, period, status, session_id))
+        
+        # The notification is committed together with the attendance row
+        queued = enqueue_attendance_emails(cursor, subject_id, date, period, {student_id: status})
+        versions_after = _listener_versions(cursor)
         
         conn.commit()
+        invalidate_reference_cache('attendance', 'class_sessions')
+        _notify_attendance_listeners(subject_id, date, period, {int(student_id): status},
+                                     versions_before, versions_after)
+        if queued:
+            notify_dispatcher()
         
         # Verify the insertion was successful by querying the record
         cursor.execute('''
@@ -428,35 +1002,6 @@ def mark_attendance(student_id, subject_id, date, period, status="present"):
         if result:
             print(f"Successfully marked attendance with ID: {result[0]}")
             logger.info(f"Successfully marked attendance with ID: {result[0]}")
-            
-            # Send email notification
-            try:
-                from utils.email_utils import send_attendance_email
-                from config import EMAIL_SEND_ON_PRESENT, EMAIL_SEND_ON_ABSENT
-                
-                # Check if email should be sent for this status
-                should_send = (status == "present" and EMAIL_SEND_ON_PRESENT) or \
-                             (status == "absent" and EMAIL_SEND_ON_ABSENT)
-                
-                if should_send:
-                    # Get student and subject details
-                    student = get_student_details(student_id)
-                    subject = get_subject_by_id(subject_id)
-                    
-                    if student and subject:
-                        send_attendance_email(
-                            student_email=student.get('email', ''),
-                            student_name=student.get('name', 'Student'),
-                            subject_name=subject.get('name', 'Unknown Subject'),
-                            date=date,
-                            period=period,
-                            status=status,
-                            roll_no=student.get('roll_no', '')
-                        )
-            except Exception as email_error:
-                # Don't fail attendance marking if email fails
-                logger.warning(f"Failed to send email notification: {str(email_error)}")
-            
             return True
         else:
             print("Attendance was not saved despite successful execution")
@@ -471,15 +1016,118 @@ def mark_attendance(student_id, subject_id, date, period, status="present"):
     finally:
         conn.close()
 
+def mark_attendance_bulk(subject_id, date, period, statuses, notify=True,
+                         taken_by=None, capture_source=None, capture_metadata=None):
+    """
+    Mark attendance for a whole period in a single transaction
+    
+    Args:
+        subject_id: ID of the subject
+        date: Date in YYYY-MM-DD format
+        period: Period label
+        statuses: Dictionary mapping student_id to status ("present" or "absent")
+        notify: Whether to email students whose attendance was created or changed;
+                the emails are queued in the email outbox in the same transaction
+        taken_by: Username of the teacher who took the attendance
+        capture_source: How attendance was captured ("recognition", "manual", "edit")
+        capture_metadata: Optional dictionary describing the capture (e.g. images,
+                          detected faces, recognition model), stored as JSON
+        
+    Returns:
+        Dictionary mapping student_id to the outcome for that row: "inserted",
+        "updated", "unchanged" or "failed" (unknown student or the write failed)
+    """
+    from utils.email_outbox import enqueue_attendance_emails, notify_dispatcher
+    
+    statuses = {int(student_id): status for student_id, status in statuses.items()}
+    if not statuses:
+        return {}
+    
+    outcomes = {}
+    queued = 0
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        _check_not_archived(date)
+        
+        # Take the write lock up front so the existing rows cannot change under us
+        cursor.execute('BEGIN IMMEDIATE')
+        versions_before = _listener_versions(cursor)
+        
+        session_id = _get_or_create_session(cursor, subject_id, date, period, taken_by,
+                                            capture_source, capture_metadata)
+        
+        cursor.execute('''
+            SELECT student_id, status FROM attendance
+            WHERE subject_id = ? AND date = ? AND period = ?
+        ''', (subject_id, date, period))
+        existing = {row['student_id']: row['status'] for row in cursor.fetchall()}
+        
+        student_ids = list(statuses)
+        cursor.execute(f'''
+            SELECT id FROM students WHERE id IN ({', '.join('?' * len(student_ids))})
+        ''', student_ids)
+        known_ids = {row['id'] for row in cursor.fetchall()}
+        
+        rows = []
+        for student_id, status in statuses.items():
+            if student_id not in known_ids:
+                logger.warning(f"Cannot mark attendance for unknown student_id={student_id}")
+                outcomes[student_id] = "failed"
+                continue
+            if student_id not in existing:
+                outcomes[student_id] = "inserted"
+            elif existing[student_id] != status:
+                outcomes[student_id] = "updated"
+            else:
+                # Row already holds this status, nothing to write
+                outcomes[student_id] = "unchanged"
+                continue
+            rows.append((student_id, subject_id, date, period, status, session_id))
+        
+        cursor.executemany('''
+            INSERT INTO attendance (student_id, subject_id, date, period, status, session_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (student_id, subject_id, date, period) DO UPDATE SET
+                status = excluded.status, session_id = excluded.session_id
+        ''', rows)
+        
+        # Notifications for new or changed rows are committed together with the attendance
+        if notify:
+            queued = enqueue_attendance_emails(cursor, subject_id, date, period,
+                                               {row[0]: row[4] for row in rows})
+        versions_after = _listener_versions(cursor)
+        
+        conn.commit()
+        invalidate_reference_cache('attendance', 'class_sessions')
+        _notify_attendance_listeners(subject_id, date, period, {row[0]: row[4] for row in rows},
+                                     versions_before, versions_after)
+        logger.info(f"Marked attendance for subject_id={subject_id}, date={date}, period={period}: "
+                    f"{len(rows)} rows written, {len(statuses) - len(rows)} unchanged or failed")
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error marking attendance in bulk: {str(e)}")
+        return {student_id: "failed" for student_id in statuses}
+    finally:
+        conn.close()
+    
+    if queued:
+        notify_dispatcher()
+    
+    return outcomes
+
 def get_attendance_report(subject_id, date):
     """Get attendance report for a specific subject and date"""
     conn = get_connection()
     cursor = conn.cursor()
     
+    attendance = _partition(conn, 'attendance', date, date)
+    
     # First, get the most common period for this date/subject (from actual attendance records)
-    cursor.execute('''
+    cursor.execute(f'''
     SELECT period, COUNT(*) as count
-    FROM attendance
+    FROM {attendance}
     WHERE subject_id = ? AND date = ?
     GROUP BY period
     ORDER BY count DESC
@@ -495,7 +1143,7 @@ def get_attendance_report(subject_id, date):
     # - 'present': Student was marked present
     # - 'absent': Student was explicitly marked absent
     # - 'not_marked': No attendance record exists (student wasn't marked at all)
-    cursor.execute('''
+    cursor.execute(f'''
     SELECT 
         s.id, 
         s.roll_no, 
@@ -512,7 +1160,7 @@ def get_attendance_report(subject_id, date):
     JOIN 
         student_subjects ss ON s.id = ss.student_id
     LEFT JOIN 
-        attendance a ON s.id = a.student_id AND a.date = ? AND a.subject_id = ?
+        {attendance} a ON s.id = a.student_id AND a.date = ? AND a.subject_id = ?
     WHERE 
         ss.subject_id = ?
     ORDER BY 
@@ -524,13 +1172,67 @@ def get_attendance_report(subject_id, date):
     
     return results
 
+def get_subject_attendance_matrix(subject_id, date_from, date_to):
+    """
+    Get a student x class attendance matrix for a subject over a date range
+    
+    The attendance comes from a single range scan (served by the
+    idx_attendance_subject_date covering index) and is pivoted directly in pandas.
+    
+    Args:
+        subject_id: ID of the subject
+        date_from: Start date (YYYY-MM-DD), inclusive
+        date_to: End date (YYYY-MM-DD), inclusive
+        
+    Returns:
+        pandas DataFrame with one row per enrolled student, indexed by
+        (student_id, roll_no, name) in roll number order, and one column per
+        class held, indexed by (date, period) in date order. Cells hold
+        "present", "absent" or None when the student was not marked in that class.
+    """
+    import pandas as pd
+    
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.id, s.roll_no, s.name
+            FROM students s
+            JOIN student_subjects ss ON s.id = ss.student_id
+            WHERE ss.subject_id = ?
+            ORDER BY s.roll_no
+        ''', (subject_id,))
+        roster = cursor.fetchall()
+        
+        cursor.execute(f'''
+            SELECT student_id, date, period, status
+            FROM {_partition(conn, 'attendance', date_from, date_to)}
+            WHERE subject_id = ? AND date BETWEEN ? AND ?
+        ''', (subject_id, date_from, date_to))
+        records = cursor.fetchall()
+    finally:
+        conn.close()
+    
+    index = pd.MultiIndex.from_tuples([tuple(row) for row in roster], names=["student_id", "roll_no", "name"])
+    if not records:
+        return pd.DataFrame(index=index, columns=pd.MultiIndex.from_tuples([], names=["date", "period"]), dtype=object)
+    
+    # (student, subject, date, period) is unique, so every cell has at most one record
+    matrix = pd.DataFrame([tuple(row) for row in records], columns=["student_id", "date", "period", "status"]) \
+        .pivot(index="student_id", columns=["date", "period"], values="status") \
+        .sort_index(axis=1)
+    matrix = matrix.reindex([row["id"] for row in roster]).astype(object)
+    matrix = matrix.where(matrix.notna(), None)
+    matrix.index = index
+    return matrix
+
 def get_class_attendance_report(date):
     """Get attendance report for all subjects on a specific date"""
     conn = get_connection()
     cursor = conn.cursor()
     
     # Show "not_marked" status instead of defaulting to 'absent'
-    cursor.execute('''
+    cursor.execute(f'''
     SELECT 
         s.id, 
         s.roll_no,
@@ -550,7 +1252,7 @@ def get_class_attendance_report(date):
     JOIN
         subjects sub ON ss.subject_id = sub.id
     LEFT JOIN 
-        attendance a ON s.id = a.student_id AND a.date = ? AND a.subject_id = sub.id
+        {_partition(conn, 'attendance', date, date)} a ON s.id = a.student_id AND a.date = ? AND a.subject_id = sub.id
     ORDER BY 
         s.roll_no, sub.name
     ''', (date,))
@@ -567,9 +1269,10 @@ def check_database_status():
     Returns:
         Dictionary with database status information
     """
+    db_path = current_db_path()
     status = {
         'database_exists': False,
-        'database_path': str(DB_PATH),
+        'database_path': db_path,
         'tables_exist': False,
         'students_count': 0,
         'subjects_count': 0,
@@ -579,10 +1282,10 @@ def check_database_status():
     
     try:
         # Check if database file exists
-        status['database_exists'] = os.path.exists(str(DB_PATH))
+        status['database_exists'] = os.path.exists(db_path)
         
         if not status['database_exists']:
-            status['error'] = f"Database file not found at: {DB_PATH}"
+            status['error'] = f"Database file not found at: {db_path}"
             return status
         
         # Try to connect and check tables
@@ -617,11 +1320,11 @@ def check_database_status():
     return status
 
 def get_student_attendance_report(student_id):
-    """Get detailed attendance report for a specific student"""
+    """Get detailed attendance report for a specific student, archived terms included"""
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
+    cursor.execute(f'''
     SELECT 
         a.date,
         sub.code as subject_code,
@@ -629,7 +1332,7 @@ def get_student_attendance_report(student_id):
         a.period,
         a.status
     FROM 
-        attendance a
+        {_partition(conn, 'attendance')} a
     JOIN
         subjects sub ON a.subject_id = sub.id
     WHERE 
@@ -674,36 +1377,42 @@ def calculate_expected_classes(subject_code_or_name, date_from, date_to):
         logger.warning(f"Error calculating expected classes for {subject_code_or_name}: {str(e)}")
         return 0
 
+@_cached_read(*_REPORT_TABLES)
 def get_student_attendance_summary(student_id, date_from=None, date_to=None):
     """Get summary of attendance for a student across all subjects"""
     conn = get_connection()
     cursor = conn.cursor()
     
-    # Build query with optional date filtering
-    date_filter = ""
-    params = [student_id, student_id]
+    # Build query with optional date filtering (parameters follow placeholder order)
+    session_date_filter = ""
+    date_params = []
     
     if date_from and date_to:
-        date_filter = "AND a.date BETWEEN ? AND ?"
-        params.extend([date_from, date_to])
+        session_date_filter = "AND cs.date BETWEEN ? AND ?"
+        date_params = [date_from, date_to]
+    
+    # Counts come from the pre-aggregated summary tables
+    counts_sql, counts_params = _summary_counts_sql(date_from, date_to, student_id, conn)
+    params = counts_params + date_params + [student_id]
     
     cursor.execute(f'''
+    WITH counts AS ({counts_sql})
     SELECT 
         sub.id as subject_id,
         sub.code as subject_code,
         sub.name as subject_name,
-        COUNT(CASE WHEN a.status = 'present' THEN 1 END) as present_count,
-        COUNT(a.id) as total_classes
+        COALESCE(c.present_count, 0) as present_count,
+        COALESCE(c.total_count, 0) as total_classes,
+        (SELECT COUNT(*) FROM {_partition(conn, 'class_sessions', date_from, date_to)} cs
+         WHERE cs.subject_id = sub.id {session_date_filter}) as held_classes
     FROM 
         subjects sub
     JOIN
         student_subjects ss ON sub.id = ss.subject_id
     LEFT JOIN 
-        attendance a ON sub.id = a.subject_id AND a.student_id = ? {date_filter}
+        counts c ON c.subject_id = sub.id
     WHERE 
         ss.student_id = ?
-    GROUP BY 
-        sub.id
     ORDER BY 
         sub.name
     ''', params)
@@ -725,6 +1434,7 @@ def get_student_attendance_summary(student_id, date_from=None, date_to=None):
     
     return results
 
+@_cached_read('students')
 def get_student_details(student_id):
     """Get detailed information about a student"""
     conn = get_connection()
@@ -756,34 +1466,107 @@ def get_student_details(student_id):
     
     return student
 
+@_cached_read(*_REPORT_TABLES)
 def get_class_attendance_summary(date_from, date_to):
     """Get attendance summary for all students in the class within a date range"""
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
+    # A student has at most one attendance row per class session, so the summed
+    # row counts from the summary tables are the classes they were marked in
+    counts_sql, counts_params = _summary_counts_sql(date_from, date_to, conn=conn)
+    cursor.execute(f'''
+    WITH counts AS ({counts_sql})
     SELECT 
         s.id,
         s.roll_no,
         s.name,
         s.division,
-        COUNT(CASE WHEN a.status = 'present' THEN 1 END) as present_count,
-        COUNT(DISTINCT a.date || a.period || a.subject_id) as total_classes
+        COALESCE(SUM(c.present_count), 0) as present_count,
+        COALESCE(SUM(c.total_count), 0) as total_classes
     FROM 
         students s
     LEFT JOIN 
-        attendance a ON s.id = a.student_id AND a.date BETWEEN ? AND ?
+        counts c ON s.id = c.student_id
     GROUP BY 
         s.id
     ORDER BY 
         s.roll_no
-    ''', (date_from, date_to))
+    ''', counts_params)
     
     results = [dict(row) for row in cursor.fetchall()]
     conn.close()
     
     return results
 
+def _call_routed(db_path, func, args):
+    """Run func(*args) on one database from a worker thread, closing its connections afterwards"""
+    try:
+        with routed_to(db_path):
+            return func(*args)
+    finally:
+        close_idle_connections()
+
+def for_each_shard(func, *args, department=None):
+    """
+    Run a reader on every division shard in parallel
+    
+    Each shard is read by its own worker thread and connection, so one slow
+    shard does not hold up the others. DB_PATH is read as well, since it still
+    holds the attendance saved before sharding was enabled. Without
+    SHARDING_ENABLED the reader runs once on DB_PATH.
+    
+    Args:
+        func: Reader of this module, e.g. get_class_attendance_summary
+        args: Arguments passed to func on every shard
+        department: Only read this department's shards (DB_PATH is always read;
+            its rows are not split by department)
+        
+    Returns:
+        List of (department, division, result): DB_PATH first, with department
+        and division None, then the shards in list_shards() order
+    """
+    if not SHARDING_ENABLED:
+        return [(None, None, func(*args))]
+    databases = [(None, None, DB_PATH)] + list_shards(department)
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(len(databases), os.cpu_count() or 4)) as pool:
+        futures = [pool.submit(_call_routed, path, func, args) for _, _, path in databases]
+        return [(shard_department, shard_division, future.result())
+                for (shard_department, shard_division, _), future in zip(databases, futures)]
+
+def _class_summary_with_departments(date_from, date_to):
+    """get_class_attendance_summary() of the routed database, with each student's department"""
+    rows = get_class_attendance_summary(date_from, date_to)
+    conn = get_connection()
+    try:
+        departments = {row['id']: row['department'] for row in conn.execute("SELECT id, department FROM students")}
+    finally:
+        conn.close()
+    for row in rows:
+        row['department'] = departments.get(row['id'])
+    return rows
+
+def get_college_attendance_summary(date_from, date_to, department=None):
+    """
+    get_class_attendance_summary() across every division shard (HOD reports)
+    
+    Rows carry each student's department and are ordered by shard, then roll
+    number. Rows of DB_PATH (the unsharded database) come first; the
+    department filter is applied to them by the students' departments.
+    """
+    summary = []
+    for shard_department, _, rows in for_each_shard(
+            _class_summary_with_departments, date_from, date_to, department=department):
+        for row in rows:
+            if shard_department is None and department is not None and row['department'] != department:
+                continue
+            # Shard file names only hold a file-name-safe form of the department
+            row['department'] = row['department'] or department or shard_department
+            summary.append(row)
+    return summary
+
+@_cached_read('subjects', 'student_subjects')
 def get_student_enrolled_subjects(student_id):
     """Get all subjects a student is enrolled in"""
     conn = get_connection()
@@ -814,30 +1597,15 @@ def enroll_student_in_all_subjects(student_id):
     cursor = conn.cursor()
     
     try:
-        # Get all subjects
-        cursor.execute('SELECT id FROM subjects')
-        all_subjects = cursor.fetchall()
-        
-        if not all_subjects:
-            logger.warning("No subjects found in database")
-            return False
-        
-        # Enroll student in all subjects (ignore if already enrolled)
-        enrolled_count = 0
-        for subject in all_subjects:
-            subject_id = subject['id']
-            try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
-                    VALUES (?, ?)
-                ''', (student_id, subject_id))
-                enrolled_count += 1
-            except sqlite3.IntegrityError:
-                # Already enrolled, skip
-                pass
+        cursor.execute('''
+            INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
+            SELECT ?, id FROM subjects
+        ''', (student_id,))
+        enrolled_count = cursor.rowcount
         
         conn.commit()
-        logger.info(f"Enrolled student {student_id} in {enrolled_count} subjects")
+        invalidate_reference_cache('student_subjects')
+        logger.info(f"Enrolled student {student_id} in {enrolled_count} new subjects")
         return True
     except Exception as e:
         logger.error(f"Error enrolling student in all subjects: {str(e)}")
@@ -847,47 +1615,28 @@ def enroll_student_in_all_subjects(student_id):
         conn.close()
 
 def enroll_all_students_in_all_subjects():
-    """Enroll all existing students in all available subjects"""
+    """
+    Enroll all existing students in all available subjects
+    
+    One INSERT ... SELECT over the students x subjects cross join; existing
+    enrollments are left alone.
+    
+    Returns:
+        Number of new enrollments created
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
     try:
-        # Get all students
-        cursor.execute('SELECT id FROM students')
-        all_students = cursor.fetchall()
-        
-        # Get all subjects
-        cursor.execute('SELECT id FROM subjects')
-        all_subjects = cursor.fetchall()
-        
-        if not all_students:
-            logger.info("No students found to enroll")
-            return 0
-        
-        if not all_subjects:
-            logger.warning("No subjects found in database")
-            return 0
-        
-        # Enroll each student in all subjects
-        total_enrollments = 0
-        for student in all_students:
-            student_id = student['id']
-            for subject in all_subjects:
-                subject_id = subject['id']
-                try:
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
-                        VALUES (?, ?)
-                    ''', (student_id, subject_id))
-                    # Check if row was actually inserted (changes() returns number of rows modified)
-                    if cursor.rowcount > 0:
-                        total_enrollments += 1
-                except sqlite3.IntegrityError:
-                    # Already enrolled, skip
-                    pass
+        cursor.execute('''
+            INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
+            SELECT s.id, sub.id FROM students s CROSS JOIN subjects sub
+        ''')
+        total_enrollments = cursor.rowcount
         
         conn.commit()
-        logger.info(f"Enrolled {len(all_students)} students in {len(all_subjects)} subjects ({total_enrollments} new enrollments created)")
+        invalidate_reference_cache('student_subjects')
+        logger.info(f"Enrolled all students in all subjects ({total_enrollments} new enrollments created)")
         return total_enrollments
     except Exception as e:
         logger.error(f"Error enrolling all students: {str(e)}")
@@ -896,6 +1645,54 @@ def enroll_all_students_in_all_subjects():
     finally:
         conn.close()
 
+def get_auto_enroll_policy():
+    """Whether new students and subjects are automatically enrolled in everything"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            SELECT enabled FROM enrollment_policy WHERE name = 'all_students_all_subjects'
+        ''')
+        row = cursor.fetchone()
+        return bool(row and row['enabled'])
+    finally:
+        conn.close()
+
+def set_auto_enroll_policy(enabled):
+    """
+    Switch automatic enrollment of new students and subjects on or off
+    
+    The enrollment triggers read this policy; switching it on also enrolls
+    everyone in everything in the same transaction.
+    
+    Returns:
+        True if the policy was saved, False otherwise
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            INSERT INTO enrollment_policy (name, enabled) VALUES ('all_students_all_subjects', ?)
+            ON CONFLICT (name) DO UPDATE SET enabled = excluded.enabled
+        ''', (1 if enabled else 0,))
+        if enabled:
+            cursor.execute('''
+                INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
+                SELECT s.id, sub.id FROM students s CROSS JOIN subjects sub
+            ''')
+        conn.commit()
+        invalidate_reference_cache('student_subjects')
+        logger.info(f"Automatic enrollment {'enabled' if enabled else 'disabled'}")
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error saving enrollment policy: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
 def update_student(student_id, roll_no=None, name=None, email=None, image_path=None, subject_ids=None):
     """Update student information in the database"""
     conn = get_connection()
@@ -934,13 +1731,13 @@ def update_student(student_id, roll_no=None, name=None, email=None, image_path=N
             cursor.execute('DELETE FROM student_subjects WHERE student_id = ?', (student_id,))
             
             # Add new enrollments
-            for subject_id in subject_ids:
-                cursor.execute('''
-                    INSERT INTO student_subjects (student_id, subject_id)
-                    VALUES (?, ?)
-                ''', (student_id, subject_id))
+            cursor.executemany('''
+                INSERT INTO student_subjects (student_id, subject_id)
+                VALUES (?, ?)
+            ''', [(student_id, subject_id) for subject_id in subject_ids])
         
         conn.commit()
+        invalidate_reference_cache('students', 'student_subjects')
         return True
     except sqlite3.IntegrityError as e:
         conn.rollback()
@@ -962,10 +1759,104 @@ def delete_student(student_id):
         # Delete student (cascade will handle student_subjects and attendance)
         cursor.execute('DELETE FROM students WHERE id = ?', (student_id,))
         conn.commit()
+        invalidate_reference_cache('students', 'student_subjects')
         return True
     except Exception as e:
         conn.rollback()
         logger.error(f"Error deleting student: {str(e)}")
         return False
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+# Pipeline stages stored as their own columns in recognition_runs
+RECOGNITION_STAGES = ('decode', 'detection', 'crop_align', 'embedding', 'gallery_load', 'matching', 'visualization')
+
+def save_recognition_run(pipeline_stats, total_time, recognized_count, job_id=None):
+    """
+    Persist the per-stage timing of one recognition run
+    
+    Args:
+        pipeline_stats: Stats dictionary filled by verify_faces ('stages', 'tags', 'embedding_per_face')
+        total_time: End-to-end processing time in seconds
+        recognized_count: Number of students recognized
+        job_id: Recognition job the run belongs to, if any
+        
+    Returns:
+        ID of the new recognition_runs row, or None on failure
+    """
+    stages = pipeline_stats.get('stages', {})
+    tags = pipeline_stats.get('tags', {})
+    
+    conn = get_directory_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute(f'''
+            INSERT INTO recognition_runs (
+                job_id, created_at, model_name, detector_backend, image_width, image_height,
+                face_count, roster_size, recognized_count, total_time,
+                {', '.join(f'{stage}_time' for stage in RECOGNITION_STAGES)}, embedding_per_face
+            )
+            VALUES ({', '.join('?' * (11 + len(RECOGNITION_STAGES)))})
+        ''', (
+            job_id,
+            datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            tags.get('model'),
+            tags.get('detector'),
+            tags.get('image_width'),
+            tags.get('image_height'),
+            tags.get('face_count', 0),
+            tags.get('roster_size', 0),
+            recognized_count,
+            total_time,
+            *[stages.get(stage) for stage in RECOGNITION_STAGES],
+            json.dumps(pipeline_stats.get('embedding_per_face', []))
+        ))
+        conn.commit()
+        return cursor.lastrowid
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error saving recognition run: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+def record_visualization_time(job_id, seconds):
+    """Add the app-side visualization time to the recognition run of a job"""
+    conn = get_directory_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            UPDATE recognition_runs
+            SET visualization_time = COALESCE(visualization_time, 0) + ?
+            WHERE job_id = ?
+        ''', (seconds, job_id))
+        conn.commit()
+        return cursor.rowcount > 0
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error recording visualization time: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+def get_recognition_runs(limit=200):
+    """Get the most recent recognition runs with their stage timings, newest first"""
+    conn = get_directory_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            SELECT * FROM recognition_runs
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (limit,))
+        runs = []
+        for row in cursor.fetchall():
+            run = dict(row)
+            run['embedding_per_face'] = json.loads(run['embedding_per_face'] or '[]')
+            runs.append(run)
+        return runs
+    finally:
+        conn.close()
@@ -1,7 +1,13 @@
 import os
+import io
+import json
+import time
+import base64
 import logging
+import urllib.request
+from contextlib import contextmanager
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -9,6 +15,14 @@ logging.basicConfig(level=logging.INFO,
                    filename='deepface.log')
 logger = logging.getLogger(__name__)
 
+# Shared inference server and detection settings (empty URL = run models in this process)
+try:
+    from config import INFERENCE_SERVER_URL, INFERENCE_TIMEOUT, DETECTION_MAX_EDGE
+except ImportError:
+    INFERENCE_SERVER_URL = os.getenv("INFERENCE_SERVER_URL", "")
+    INFERENCE_TIMEOUT = 30
+    DETECTION_MAX_EDGE = 1280
+
 # Try to import DeepFace with error handling
 deepface_available = False
 try:
@@ -18,16 +32,85 @@ try:
 except ImportError as e:
     logger.error(f"Error importing DeepFace: {str(e)}")
     
-def verify_faces(classroom_image_path, students, threshold=0.6, model_name="Facenet512", return_confidence=False, detector_backend="opencv"):
+def load_image(image_source):
+    """
+    Decode an image source into a BGR NumPy array (the layout DeepFace and OpenCV use)
+    
+    Args:
+        image_source: One of
+            - path to an image file (str or os.PathLike)
+            - raw encoded image bytes (e.g. JPEG from an upload or the ESP32-CAM)
+            - file-like object (anything with read() or getvalue(), e.g. a Streamlit upload)
+            - already decoded NumPy array in BGR order (returned unchanged)
+            
+    Returns:
+        BGR uint8 NumPy array of shape (height, width, 3)
+    """
+    if isinstance(image_source, np.ndarray):
+        return image_source
+    
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(image_source))
+    elif hasattr(image_source, 'getvalue'):
+        image = Image.open(io.BytesIO(image_source.getvalue()))
+    elif hasattr(image_source, 'read'):
+        image = Image.open(image_source)
+    else:
+        if not os.path.exists(image_source):
+            raise FileNotFoundError(f"Image not found: {image_source}")
+        image = Image.open(image_source)
+    
+    # Apply the EXIF orientation (as cv2.imread does) so portrait phone photos are upright
+    return np.asarray(ImageOps.exif_transpose(image).convert("RGB"))[:, :, ::-1].copy()
+
+class StageTimer:
+    """
+    Accumulates wall-clock time for the named stages of a recognition run
+    
+    Stage times are added to stats['stages'] (seconds per stage) together with
+    stats['tags'] describing the run (model, detector, image size, face count,
+    roster size), so callers get one structured record per run.
+    """
+    
+    def __init__(self, stats=None, **tags):
+        self.stats = stats if stats is not None else {}
+        self.stages = self.stats.setdefault('stages', {})
+        self.tags = self.stats.setdefault('tags', {})
+        self.tags.update(tags)
+    
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block and add it to the named stage"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+    
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+    
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+def verify_faces(classroom_image, students, threshold=0.6, model_name="Facenet512", return_confidence=False, detector_backend="opencv", progress_callback=None, stats=None):
     """
     Verify faces in a classroom image against registered student faces
     
     Args:
-        classroom_image_path: Path to the classroom image
+        classroom_image: Classroom image as a path, encoded bytes, file-like object
+                         or BGR NumPy array (see load_image); decoded only once
         students: List of student dictionaries with image_path
         threshold: Similarity threshold (0-1), lower means stricter matching
         model_name: Face recognition model to use
         return_confidence: Whether to return confidence scores
+        progress_callback: Optional callable(stage, progress, data) invoked as the
+                           pipeline advances; used by background jobs to publish
+                           partial results
+        stats: Optional dictionary that receives pipeline statistics: detection scale
+               and image size, per-stage timings in 'stages' (decode, detection,
+               crop_align, embedding, gallery_load, matching), per-face embedding
+               times in 'embedding_per_face' and the run's 'tags'
         
     Returns:
         If return_confidence=False:
@@ -35,21 +118,32 @@ def verify_faces(classroom_image_path, students, threshold=0.6, model_name="Face
         If return_confidence=True:
             Tuple of (present_students, confidence_scores)
     """
+    timer = StageTimer(stats, model=model_name, detector=detector_backend, roster_size=len(students))
+    stats = timer.stats
+    
     if not deepface_available:
         logger.error("DeepFace is not available. Cannot verify faces.")
         return ([], []) if return_confidence else []
     
-    # Ensure the image exists
-    if not os.path.exists(classroom_image_path):
-        logger.error(f"Classroom image not found: {classroom_image_path}")
+    # Decode the classroom image once; detection and cropping both work on the array
+    try:
+        with timer.stage('decode'):
+            image = load_image(classroom_image)
+        timer.tag(image_width=image.shape[1], image_height=image.shape[0])
+    except Exception as e:
+        logger.error(f"Could not load classroom image: {str(e)}")
         return ([], []) if return_confidence else []
     
     # Try to extract all faces from classroom image
     try:
         # Extract all faces from the classroom image
-        detected_faces, face_locations = detect_faces_with_details(classroom_image_path, detector_backend=detector_backend)
+        # Detection runs on a downscaled copy; facial areas come back in full-resolution coordinates
+        with timer.stage('detection'):
+            detected_faces, face_locations = detect_faces_with_details(image, detector_backend=detector_backend, stats=stats)
+        timer.tag(face_count=len(detected_faces))
         
         logger.info(f"Detected {len(detected_faces)} faces in classroom image")
+        _report_progress(progress_callback, "detected", 0.1, {"face_locations": face_locations})
         
         if not detected_faces:
             return ([], []) if return_confidence else []
@@ -65,96 +159,208 @@ def verify_faces(classroom_image_path, students, threshold=0.6, model_name="Face
     # Keep track of matched faces to avoid duplicates
     matched_face_indices = set()
     
+    # Cut every detected face's bounding box out of the full-resolution image. The crops are
+    # not aligned here: embedding (DeepFace.represent or the inference server) detects and
+    # aligns the face within each crop
+    with timer.stage('crop_align'):
+        face_crops = [_crop_face(image, face.get('facial_area', {})) for face in detected_faces]
+    
     # Extract face embeddings for all detected faces
-    detected_embeddings = []
-    for face in detected_faces:
+    inference_client = get_inference_client()
+    detected_embeddings = [None] * len(face_crops)
+    embedding_per_face = [0.0] * len(face_crops)
+    if inference_client is not None:
+        # Send every crop in one request; the inference server batches them with other sessions
         try:
-            # For each detected face, extract the region and save it to a temporary file
-            img = Image.open(classroom_image_path)
-            region = face.get('facial_area', {})
-            face_img = img.crop((
-                region.get('x', 0),
-                region.get('y', 0),
-                region.get('x', 0) + region.get('w', 0),
-                region.get('y', 0) + region.get('h', 0)
-            ))
-            temp_face_path = f"temp_face_{len(detected_embeddings)}.jpg"
-            face_img.save(temp_face_path)
-            
-            # Extract embedding for this face
-            embedding = extract_embedding(temp_face_path, model_name)
-            detected_embeddings.append(embedding)
-            
-            # Clean up temp file
-            try:
-                os.remove(temp_face_path)
-            except:
-                pass
+            with timer.stage('embedding'):
+                detected_embeddings = inference_client.embed(model_name, images=face_crops)
+            embedding_per_face = [timer.stages['embedding'] / len(face_crops)] * len(face_crops)
         except Exception as e:
-            logger.error(f"Error extracting embedding for detected face: {str(e)}")
-            detected_embeddings.append(None)
+            logger.warning(f"Inference server unavailable, embedding faces locally: {str(e)}")
+        _report_progress(progress_callback, "embedding", 0.5)
     
-    # For each student, find the best matching face that hasn't been matched yet
-    for student in students:
-        student_image_path = student["image_path"]
+    # Embed here whatever the server did not (every face when there is no server)
+    missing = [i for i, embedding in enumerate(detected_embeddings) if embedding is None]
+    if inference_client is not None and 0 < len(missing) < len(face_crops):
+        logger.warning(f"Inference server returned no embedding for {len(missing)} face(s), embedding them locally")
+    for done, i in enumerate(missing, 1):
+        # Crops are array views of the decoded image, so no temporary files are needed
+        start_time = time.perf_counter()
+        detected_embeddings[i] = extract_embedding(face_crops[i], model_name)
+        embedding_per_face[i] = time.perf_counter() - start_time
+        timer.add('embedding', embedding_per_face[i])
+        _report_progress(progress_callback, "embedding", 0.1 + 0.4 * done / len(missing))
+    stats['embedding_per_face'] = embedding_per_face
+    
+    # Load the student gallery embeddings, in a single request when the inference server is available
+    student_embeddings = {}
+    with timer.stage('gallery_load'):
+        gallery = []
+        for student in students:
+            if os.path.exists(student["image_path"]):
+                gallery.append(student)
+            else:
+                logger.warning(f"Student image not found: {student['image_path']}")
         
-        if not os.path.exists(student_image_path):
-            logger.warning(f"Student image not found: {student_image_path}")
-            continue
+        if inference_client is not None:
+            try:
+                embeddings = inference_client.embed(model_name, paths=[os.path.abspath(s["image_path"]) for s in gallery])
+                # Students the server could not embed are embedded locally below
+                student_embeddings = {s["image_path"]: e for s, e in zip(gallery, embeddings) if e is not None}
+            except Exception as e:
+                logger.warning(f"Inference server unavailable, embedding student faces locally: {str(e)}")
         
-        try:
-            # Extract embedding for student face
-            student_embedding = extract_embedding(student_image_path, model_name)
+        for student in gallery:
+            if student["image_path"] not in student_embeddings:
+                try:
+                    student_embeddings[student["image_path"]] = extract_embedding(student["image_path"], model_name)
+                except Exception as e:
+                    logger.error(f"Error processing student {student['name']}: {str(e)}")
+    
+    # For each student, find the best matching face that hasn't been matched yet
+    with timer.stage('matching'):
+        for student_idx, student in enumerate(students, 1):
+            _report_progress(progress_callback, "matching", 0.5 + 0.5 * student_idx / max(len(students), 1))
             
-            if student_embedding is None:
-                logger.warning(f"Could not extract embedding for student {student['name']}")
+            if student["image_path"] not in student_embeddings:
                 continue
-                
-            # Find best matching face among unmatched faces
-            best_match_index = -1
-            best_match_distance = float('inf')
             
-            for i, face_embedding in enumerate(detected_embeddings):
-                if i in matched_face_indices or face_embedding is None:
+            try:
+                student_embedding = student_embeddings[student["image_path"]]
+                
+                if student_embedding is None:
+                    logger.warning(f"Could not extract embedding for student {student['name']}")
                     continue
                     
-                # Calculate distance between student face and detected face
-                distance = cosine_distance(student_embedding, face_embedding)
-                
-                # If this is a better match than previous ones
-                if distance < best_match_distance and distance < threshold:
-                    best_match_distance = distance
-                    best_match_index = i
-            
-            # If we found a match
-            if best_match_index >= 0:
-                # Mark this face as matched
-                matched_face_indices.add(best_match_index)
-                
-                # Add student to present list
-                present_students.append(student)
-                
-                # Calculate confidence from distance
-                confidence = max(0, 1.0 - best_match_distance)
-                confidence_scores.append(confidence)
+                # Find best matching face among unmatched faces
+                best_match_index = -1
+                best_match_distance = float('inf')
                 
-                logger.info(f"Student {student['name']} (Roll No: {student['roll_no']}) matched to face #{best_match_index} - confidence: {confidence:.2f}")
+                for i, face_embedding in enumerate(detected_embeddings):
+                    if i in matched_face_indices or face_embedding is None:
+                        continue
+                        
+                    # Calculate distance between student face and detected face
+                    distance = cosine_distance(student_embedding, face_embedding)
+                    
+                    # If this is a better match than previous ones
+                    if distance < best_match_distance and distance < threshold:
+                        best_match_distance = distance
+                        best_match_index = i
                 
-        except Exception as e:
-            logger.error(f"Error processing student {student['name']}: {str(e)}")
-            continue
+                # If we found a match
+                if best_match_index >= 0:
+                    # Mark this face as matched
+                    matched_face_indices.add(best_match_index)
+                    
+                    # Add student to present list
+                    present_students.append(student)
+                    
+                    # Calculate confidence from distance
+                    confidence = max(0, 1.0 - best_match_distance)
+                    confidence_scores.append(confidence)
+                    
+                    logger.info(f"Student {student['name']} (Roll No: {student['roll_no']}) matched to face #{best_match_index} - confidence: {confidence:.2f}")
+                    _report_progress(progress_callback, "matched", 0.5 + 0.5 * student_idx / max(len(students), 1),
+                                     {"student": student, "confidence": confidence})
+                    
+            except Exception as e:
+                logger.error(f"Error processing student {student['name']}: {str(e)}")
+                continue
     
-    logger.info(f"Attendance result: {len(present_students)} students out of {len(detected_faces)} detected faces")
+    logger.info(f"Attendance result: {len(present_students)} students out of {len(detected_faces)} detected faces "
+                f"(stages: {', '.join(f'{name} {seconds:.2f}s' for name, seconds in timer.stages.items())})")
     
     if return_confidence:
         return present_students, confidence_scores
     return present_students
 
-def extract_embedding(image_path, model_name="Facenet512"):
-    """Extract facial embedding from an image"""
+def _report_progress(progress_callback, stage, progress, data=None):
+    """Invoke a progress callback without letting its failures break recognition"""
+    if progress_callback is None:
+        return
+    try:
+        progress_callback(stage, progress, data or {})
+    except Exception as e:
+        logger.warning(f"Progress callback failed at stage '{stage}': {str(e)}")
+
+def _crop_face(image, region):
+    """Crop a detected face region (x, y, w, h) out of a decoded image array"""
+    height, width = image.shape[:2]
+    x = max(0, int(region.get('x', 0)))
+    y = max(0, int(region.get('y', 0)))
+    x2 = min(width, x + int(region.get('w', 0)))
+    y2 = min(height, y + int(region.get('h', 0)))
+    return image[y:y2, x:x2]
+
+class InferenceClient:
+    """Client for the shared inference server (see utils/inference_server.py)."""
+    
+    # Seconds to skip the server after a failed request before trying it again
+    RETRY_AFTER = 30
+    # Seconds allowed on top of the server's INFERENCE_TIMEOUT wait for upload, decoding and the reply
+    REPLY_MARGIN = 10
+    
+    def __init__(self, base_url, timeout=INFERENCE_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        # The server waits up to INFERENCE_TIMEOUT for its batches; give up only after that
+        self.timeout = timeout + self.REPLY_MARGIN
+        self._unavailable_until = 0.0
+    
+    def embed(self, model_name, images=None, paths=None):
+        """
+        Get embeddings from the inference server
+        
+        Args:
+            model_name: Face recognition model to use
+            images: Face crops as BGR NumPy arrays
+            paths: Image paths readable by the server process
+            
+        Returns:
+            List of embeddings (None where a face could not be embedded), images first then paths
+        """
+        if time.time() < self._unavailable_until:
+            raise ConnectionError("Inference server marked unavailable")
+        
+        encoded_images = []
+        for image in images or []:
+            buffer = io.BytesIO()
+            Image.fromarray(np.ascontiguousarray(image[:, :, ::-1])).save(buffer, format="JPEG", quality=95)
+            encoded_images.append(base64.b64encode(buffer.getvalue()).decode("ascii"))
+        
+        payload = json.dumps({
+            "model_name": model_name,
+            "images": encoded_images,
+            "paths": list(paths or [])
+        }).encode()
+        request = urllib.request.Request(
+            f"{self.base_url}/embed",
+            data=payload,
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())["embeddings"]
+        except Exception:
+            self._unavailable_until = time.time() + self.RETRY_AFTER
+            raise
+
+_inference_client = None
+
+def get_inference_client():
+    """Get the shared inference server client, or None when no server is configured"""
+    global _inference_client
+    if not INFERENCE_SERVER_URL:
+        return None
+    if _inference_client is None:
+        _inference_client = InferenceClient(INFERENCE_SERVER_URL)
+    return _inference_client
+
+def extract_embedding(image, model_name="Facenet512"):
+    """Extract facial embedding from an image path or BGR NumPy array"""
     try:
         embedding_objs = DeepFace.represent(
-            img_path=image_path,
+            img_path=image,
             model_name=model_name,
             enforce_detection=False
         )
@@ -189,12 +395,12 @@ def cosine_distance(vector1, vector2):
         logger.error(f"Error calculating cosine distance: {str(e)}")
         return 1.0
 
-def detect_faces(image_path):
+def detect_faces(image):
     """
     Detect all faces in an image
     
     Args:
-        image_path: Path to the image
+        image: Image path, encoded bytes, file-like object or BGR NumPy array
         
     Returns:
         Number of faces detected
@@ -205,7 +411,7 @@ def detect_faces(image_path):
     try:
         # Extract all faces from the image
         detected_faces = DeepFace.extract_faces(
-            img_path=image_path,
+            img_path=load_image(image),
             enforce_detection=False
         )
         
@@ -214,18 +420,62 @@ def detect_faces(image_path):
         logger.error(f"Error detecting faces: {str(e)}")
         return 0
 
-def detect_faces_with_details(image_path, detector_backend="opencv"):
+def downscale_for_detection(image, max_edge=None):
+    """
+    Shrink an image so its longer edge is at most max_edge pixels
+    
+    Args:
+        image: BGR NumPy array
+        max_edge: Target long-edge size in pixels (None uses DETECTION_MAX_EDGE, 0 disables)
+        
+    Returns:
+        Tuple of (detection_image, scale) where scale = detection size / original size
+    """
+    if max_edge is None:
+        max_edge = DETECTION_MAX_EDGE
+    
+    height, width = image.shape[:2]
+    long_edge = max(height, width)
+    if not max_edge or long_edge <= max_edge:
+        return image, 1.0
+    
+    scale = max_edge / float(long_edge)
+    new_size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    try:
+        import cv2
+        small = cv2.resize(image, new_size, interpolation=cv2.INTER_AREA)
+    except ImportError:
+        small = np.asarray(Image.fromarray(image).resize(new_size, Image.BILINEAR))
+    return small, scale
+
+def _scale_region(region, scale, width, height):
+    """Map a facial area detected on a downscaled copy back to original image coordinates"""
+    x = int(round(region.get('x', 0) / scale))
+    y = int(round(region.get('y', 0) / scale))
+    w = int(round(region.get('w', 0) / scale))
+    h = int(round(region.get('h', 0) / scale))
+    x = min(max(0, x), width)
+    y = min(max(0, y), height)
+    return {**region, 'x': x, 'y': y, 'w': min(w, width - x), 'h': min(h, height - y)}
+
+def detect_faces_with_details(image, detector_backend="opencv", max_edge=None, stats=None):
     """
     Detect faces in an image and return detailed information
     
+    Detection runs on a copy downscaled to max_edge pixels on the long side; the
+    returned facial areas are mapped back to full-resolution coordinates, so crops
+    for embedding can be taken from the original image without losing quality.
+    
     Args:
-        image_path: Path to the image
+        image: Image path, encoded bytes, file-like object or BGR NumPy array
         detector_backend: Face detector to use ("opencv", "mtcnn", "retinaface", "ssd", "dlib")
                         - "mtcnn": Highest accuracy, slower
                         - "retinaface": Very accurate, good for challenging conditions
                         - "opencv": Fast but less accurate (default)
                         - "ssd": Fast but lower accuracy
                         - "dlib": Good balance
+        max_edge: Long-edge size used for detection (None uses DETECTION_MAX_EDGE, 0 disables)
+        stats: Optional dictionary that receives detection_scale, detection_time and image size
         
     Returns:
         Tuple of (detected_faces, face_locations)
@@ -236,20 +486,40 @@ def detect_faces_with_details(image_path, detector_backend="opencv"):
         return [], []
         
     try:
-        # Extract all faces from the image with details
+        full_image = load_image(image)
+        height, width = full_image.shape[:2]
+        
+        start_time = time.time()
+        detection_image, scale = downscale_for_detection(full_image, max_edge)
+        
+        # Extract all faces from the (possibly downscaled) image with details
         detected_faces = DeepFace.extract_faces(
-            img_path=image_path,
+            img_path=detection_image,
             enforce_detection=False,
             align=True,
             detector_backend=detector_backend
         )
+        detection_time = time.time() - start_time
+        
+        if stats is not None:
+            stats['image_width'] = width
+            stats['image_height'] = height
+            stats['detection_scale'] = scale
+            stats['detection_time'] = detection_time
+        
+        if scale != 1.0:
+            logger.info(f"Detected faces on {detection_image.shape[1]}x{detection_image.shape[0]} copy "
+                        f"of {width}x{height} image (scale {scale:.3f}) in {detection_time:.2f}s")
         
         # Extract face locations
         face_locations = []
         for face in detected_faces:
             try:
-                # Get the region information
+                # Get the region information, in original image coordinates
                 region = face.get('facial_area', {})
+                if region and scale != 1.0:
+                    region = _scale_region(region, scale, width, height)
+                    face['facial_area'] = region
                 if region:
                     face_locations.append({
                         'x': region.get('x', 0),
@@ -321,7 +591,9 @@ def save_session_stats(stats):
             'detected_faces': stats.get('detected_faces', 0),
             'recognized_students': stats.get('recognized_students', 0),
             'recognition_rate': stats.get('recognition_rate', 0),
-            'avg_confidence': stats.get('avg_confidence', 0)
+            'avg_confidence': stats.get('avg_confidence', 0),
+            'detection_scale': stats.get('detection_scale', 1.0),
+            'detection_time': stats.get('detection_time', 0)
         })
         
         # Keep last session details
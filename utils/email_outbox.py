@@ -0,0 +1,395 @@
+"""
+Transactional outbox for attendance notification emails.
+
+Attendance writes never talk to the SMTP server. Instead they add rows to the
+``email_outbox`` table in the same transaction as the attendance rows (see
+``enqueue_attendance_emails``), so a notification exists if and only if the
+attendance change was committed. A dispatcher thread drains the outbox in the
+background, retrying failed sends with exponential backoff.
+
+Every notification has an idempotency key (student, subject, date, period and
+status). Saving the same attendance twice while its email is still pending
+does not queue a second email, and retries of one notification reuse the same
+Message-ID so receiving servers can drop duplicates.
+
+The dispatcher normally runs inside the web process (see
+``start_email_dispatcher``), but the module can also be run on its own:
+
+    python -m utils.email_outbox
+"""
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from utils.db_utils import get_connection, database_paths, routed_to
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import (
+        EMAIL_ENABLED,
+        EMAIL_FROM,
+        EMAIL_SEND_ON_PRESENT,
+        EMAIL_SEND_ON_ABSENT,
+        EMAIL_OUTBOX_POLL_INTERVAL,
+        EMAIL_OUTBOX_BATCH_SIZE,
+        EMAIL_OUTBOX_MAX_ATTEMPTS,
+        EMAIL_OUTBOX_BACKOFF_BASE,
+        EMAIL_OUTBOX_BACKOFF_MAX,
+        EMAIL_OUTBOX_STALE_AFTER,
+        EMAIL_OUTBOX_RETENTION_DAYS
+    )
+except ImportError:
+    import os
+    EMAIL_ENABLED = os.getenv("EMAIL_ENABLED", "false").lower() == "true"
+    EMAIL_FROM = os.getenv("EMAIL_FROM", "attendance@example.com")
+    EMAIL_SEND_ON_PRESENT = os.getenv("EMAIL_SEND_ON_PRESENT", "true").lower() == "true"
+    EMAIL_SEND_ON_ABSENT = os.getenv("EMAIL_SEND_ON_ABSENT", "true").lower() == "true"
+    EMAIL_OUTBOX_POLL_INTERVAL = 5.0
+    EMAIL_OUTBOX_BATCH_SIZE = 20
+    EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+    EMAIL_OUTBOX_BACKOFF_BASE = 30
+    EMAIL_OUTBOX_BACKOFF_MAX = 3600
+    EMAIL_OUTBOX_STALE_AFTER = 300
+    EMAIL_OUTBOX_RETENTION_DAYS = 30
+
+# Outbox states
+OUTBOX_STATES = ('pending', 'sending', 'sent', 'failed')
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _idempotency_key(student_id: int, subject_id: int, date: str, period: str, status: str) -> str:
+    return f"attendance:{student_id}:{subject_id}:{date}:{period}:{status}"
+
+
+def _should_email(status: str) -> bool:
+    return EMAIL_ENABLED and ((status == "present" and EMAIL_SEND_ON_PRESENT) or
+                              (status == "absent" and EMAIL_SEND_ON_ABSENT))
+
+
+def enqueue_attendance_emails(cursor, subject_id: int, date: str, period: str, statuses: Dict[int, str]) -> int:
+    """
+    Queue attendance notifications using the caller's cursor.
+
+    Call this inside the transaction that writes the attendance rows; the emails
+    are then committed (or rolled back) together with the attendance. Students
+    without an email address and statuses that are not configured to send are
+    skipped here, so the dispatcher only sees deliverable messages.
+
+    Args:
+        cursor: Cursor of the connection holding the attendance transaction
+        subject_id: ID of the subject
+        date: Attendance date (YYYY-MM-DD)
+        period: Period label
+        statuses: Dictionary mapping student_id to the status that was saved
+
+    Returns:
+        Number of notifications queued
+    """
+    recipient_ids = [student_id for student_id, status in statuses.items() if _should_email(status)]
+    if not recipient_ids:
+        return 0
+
+    cursor.execute('SELECT name FROM subjects WHERE id = ?', (subject_id,))
+    subject = cursor.fetchone()
+    subject_name = subject['name'] if subject else 'Unknown Subject'
+
+    cursor.execute(f'''
+    SELECT id, roll_no, name, email FROM students
+    WHERE id IN ({', '.join('?' * len(recipient_ids))})
+    ''', recipient_ids)
+    students = {row['id']: row for row in cursor.fetchall()}
+
+    now = _now()
+    rows = []
+    for student_id in recipient_ids:
+        student = students.get(student_id)
+        if student is None or not (student['email'] or '').strip():
+            continue
+        payload = {
+            'student_email': student['email'],
+            'student_name': student['name'],
+            'subject_name': subject_name,
+            'date': date,
+            'period': period,
+            'status': statuses[student_id],
+            'roll_no': student['roll_no']
+        }
+        rows.append((_idempotency_key(student_id, subject_id, date, period, statuses[student_id]),
+                     student_id, subject_id, json.dumps(payload), now, now))
+
+    # A key that is already pending or being sent is left alone (deduplicated);
+    # one that was sent or gave up earlier is a new notification and is re-armed
+    cursor.executemany('''
+    INSERT INTO email_outbox (idempotency_key, student_id, subject_id, payload, state, created_at, next_attempt_at)
+    VALUES (?, ?, ?, ?, 'pending', ?, ?)
+    ON CONFLICT (idempotency_key) DO UPDATE SET
+        payload = excluded.payload, state = 'pending', attempts = 0, last_error = NULL,
+        created_at = excluded.created_at, next_attempt_at = excluded.next_attempt_at,
+        claimed_at = NULL, sent_at = NULL
+    WHERE email_outbox.state IN ('sent', 'failed')
+    ''', rows)
+    return len(rows)
+
+
+def claim_due_emails(limit: int = EMAIL_OUTBOX_BATCH_SIZE) -> List[Dict]:
+    """Atomically claim pending notifications whose next attempt is due"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        # IMMEDIATE takes the write lock up front so two dispatchers cannot claim the same row
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+        SELECT * FROM email_outbox
+        WHERE state = 'pending' AND next_attempt_at <= ?
+        ORDER BY next_attempt_at
+        LIMIT ?
+        ''', (_now(), limit))
+        rows = [dict(row) for row in cursor.fetchall()]
+        if not rows:
+            conn.rollback()
+            return []
+
+        cursor.executemany('''
+        UPDATE email_outbox SET state = 'sending', claimed_at = ?, attempts = attempts + 1
+        WHERE id = ? AND state = 'pending'
+        ''', [(_now(), row['id']) for row in rows])
+        conn.commit()
+
+        for row in rows:
+            row['payload'] = json.loads(row['payload'])
+            row['attempts'] += 1
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def mark_email_sent(outbox_id: int):
+    conn = get_connection()
+    try:
+        conn.execute('''
+        UPDATE email_outbox SET state = 'sent', sent_at = ?, last_error = NULL
+        WHERE id = ? AND state = 'sending'
+        ''', (_now(), outbox_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def mark_email_failed(outbox_id: int, attempts: int, error: str):
+    """Schedule a retry with exponential backoff, or give up after EMAIL_OUTBOX_MAX_ATTEMPTS"""
+    delay = min(EMAIL_OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), EMAIL_OUTBOX_BACKOFF_MAX)
+    next_attempt = (datetime.now() + timedelta(seconds=delay)).isoformat()
+    conn = get_connection()
+    try:
+        conn.execute('''
+        UPDATE email_outbox
+        SET state = CASE WHEN ? >= ? THEN 'failed' ELSE 'pending' END,
+            next_attempt_at = ?, last_error = ?, claimed_at = NULL
+        WHERE id = ? AND state = 'sending'
+        ''', (attempts, EMAIL_OUTBOX_MAX_ATTEMPTS, next_attempt, error, outbox_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def requeue_stale_emails() -> int:
+    """Return notifications stuck in 'sending' (the dispatcher died mid-send) to the queue"""
+    cutoff = (datetime.now() - timedelta(seconds=EMAIL_OUTBOX_STALE_AFTER)).isoformat()
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE email_outbox SET state = 'pending', claimed_at = NULL
+        WHERE state = 'sending' AND claimed_at < ?
+        ''', (cutoff,))
+        requeued = cursor.rowcount
+        conn.commit()
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale outbox email(s)")
+        return requeued
+    finally:
+        conn.close()
+
+
+def purge_sent_emails() -> int:
+    """Delete delivered notifications older than the retention window"""
+    cutoff = (datetime.now() - timedelta(days=EMAIL_OUTBOX_RETENTION_DAYS)).isoformat()
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM email_outbox WHERE state = 'sent' AND sent_at < ?", (cutoff,))
+        purged = cursor.rowcount
+        conn.commit()
+        return purged
+    finally:
+        conn.close()
+
+
+def get_outbox_stats() -> Dict[str, int]:
+    """Count notifications per outbox state"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT state, COUNT(*) AS count FROM email_outbox GROUP BY state')
+        stats = {state: 0 for state in OUTBOX_STATES}
+        stats.update({row['state']: row['count'] for row in cursor.fetchall()})
+        return stats
+    finally:
+        conn.close()
+
+
+def retry_failed_emails() -> int:
+    """Give notifications that exhausted their attempts another round"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE email_outbox SET state = 'pending', attempts = 0, next_attempt_at = ?
+        WHERE state = 'failed'
+        ''', (_now(),))
+        retried = cursor.rowcount
+        conn.commit()
+        return retried
+    finally:
+        conn.close()
+
+
+def _message_id(row: Dict) -> str:
+    """Stable Message-ID for one notification, shared by all of its retries"""
+    digest = hashlib.sha1(f"{row['idempotency_key']}|{row['created_at']}".encode()).hexdigest()[:24]
+    domain = EMAIL_FROM.split('@')[-1] if '@' in EMAIL_FROM else 'localhost'
+    return f"<attendance.{digest}@{domain}>"
+
+
+def dispatch_email(row: Dict) -> bool:
+    """Send one claimed notification and record the outcome"""
+    from utils.email_utils import send_attendance_email
+
+    try:
+        sent = send_attendance_email(message_id=_message_id(row), **row['payload'])
+        error = None if sent else "send_attendance_email returned False"
+    except Exception as e:
+        sent, error = False, str(e)
+
+    if sent:
+        mark_email_sent(row['id'])
+    else:
+        logger.warning(f"Outbox email {row['id']} to {row['payload'].get('student_email')} failed "
+                       f"(attempt {row['attempts']}/{EMAIL_OUTBOX_MAX_ATTEMPTS}): {error}")
+        mark_email_failed(row['id'], row['attempts'], error)
+    return sent
+
+
+class EmailDispatcher:
+    """Background thread draining the email outbox."""
+
+    def __init__(self, poll_interval: float = EMAIL_OUTBOX_POLL_INTERVAL, batch_size: int = EMAIL_OUTBOX_BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the dispatcher thread (no-op if already running)"""
+        if self._thread is not None:
+            return
+        for db_path in database_paths():
+            with routed_to(db_path):
+                requeue_stale_emails()
+                purge_sent_emails()
+        self._thread = threading.Thread(target=self._run, name="email-outbox-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info("Started email outbox dispatcher")
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask the dispatcher to stop after the current batch"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self):
+        """Wake the dispatcher because notifications were queued"""
+        self._wakeup.set()
+
+    def _run(self):
+        last_maintenance = time.time()
+        while not self._stop.is_set():
+            maintenance = time.time() - last_maintenance > EMAIL_OUTBOX_STALE_AFTER
+            if maintenance:
+                last_maintenance = time.time()
+
+            # Each division database has its own outbox (see db_utils.use_division)
+            dispatched = 0
+            for db_path in database_paths():
+                with routed_to(db_path):
+                    dispatched += self._drain(maintenance)
+
+            if not dispatched:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _drain(self, maintenance: bool) -> int:
+        """Send one batch from the outbox of the database the thread is routed to"""
+        try:
+            if maintenance:
+                requeue_stale_emails()
+            rows = claim_due_emails(self.batch_size)
+        except Exception as e:
+            logger.error(f"Email dispatcher could not claim notifications: {str(e)}")
+            rows = []
+
+        for row in rows:
+            try:
+                dispatch_email(row)
+            except Exception as e:
+                logger.error(f"Could not record outcome for outbox email {row['id']}: {str(e)}")
+        return len(rows)
+
+
+# Global dispatcher instance (one per process)
+_dispatcher: Optional[EmailDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def start_email_dispatcher() -> EmailDispatcher:
+    """Get or start the process-wide email dispatcher"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = EmailDispatcher()
+            _dispatcher.start()
+    return _dispatcher
+
+
+def notify_dispatcher():
+    """Wake this process's dispatcher after an attendance transaction queued emails"""
+    if _dispatcher is not None:
+        _dispatcher.notify()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from utils.db_utils import init_db
+    init_db()
+    dispatcher = start_email_dispatcher()
+    print("Email outbox dispatcher running. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        dispatcher.stop(timeout=5)
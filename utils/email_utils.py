@@ -41,7 +41,8 @@ def send_attendance_email(
     date: str,
     period: str,
     status: str,
-    roll_no: str
+    roll_no: str,
+    message_id: Optional[str] = None
 ) -> bool:
     """
     Send attendance notification email to a student.
@@ -54,6 +55,8 @@ def send_attendance_email(
         period: Period/time
         status: 'present' or 'absent'
         roll_no: Student roll number
+        message_id: Optional Message-ID header; retries of the same notification
+                    reuse it so receiving servers can discard duplicates
         
     Returns:
         True if email sent successfully, False otherwise
@@ -81,6 +84,8 @@ def send_attendance_email(
         msg['From'] = EMAIL_FROM
         msg['To'] = student_email
         msg['Subject'] = f"Attendance Marked - {subject_name} ({date})"
+        if message_id:
+            msg['Message-ID'] = message_id
         
         logger.debug(f"Email subject: {msg['Subject']}")
         
@@ -0,0 +1,344 @@
+"""
+Shared face-embedding inference server.
+
+A separate process that owns the DeepFace models and serves embedding
+requests from every Streamlit session over local HTTP. Concurrent requests
+are merged into dynamic batches (up to INFERENCE_MAX_BATCH faces, waiting at
+most INFERENCE_MAX_WAIT_MS for a batch to fill), so several teachers pressing
+"Take Attendance" at the start of a period share one model invocation instead
+of competing for the CPU in the web process.
+
+Start it next to the app and point the app at it:
+
+    python -m utils.inference_server
+    INFERENCE_SERVER_URL=http://127.0.0.1:8765 streamlit run app.py
+
+Endpoints:
+    GET  /health  -> {"status": "ok", "models": [...], "pending": n}
+    POST /embed   -> body {"model_name": str, "images": [base64 image], "paths": [str]}
+                     reply {"embeddings": [[float, ...] | null, ...]}, null where an
+                     image could not be decoded or embedded; 503 when the queue is
+                     full and 504 when the faces were not embedded in INFERENCE_TIMEOUT
+"""
+import io
+import json
+import time
+import base64
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import (
+        INFERENCE_SERVER_HOST,
+        INFERENCE_SERVER_PORT,
+        INFERENCE_MAX_BATCH,
+        INFERENCE_MAX_WAIT_MS,
+        INFERENCE_MAX_PENDING,
+        INFERENCE_TIMEOUT
+    )
+except ImportError:
+    INFERENCE_SERVER_HOST = "127.0.0.1"
+    INFERENCE_SERVER_PORT = 8765
+    INFERENCE_MAX_BATCH = 32
+    INFERENCE_MAX_WAIT_MS = 20
+    INFERENCE_MAX_PENDING = 512
+    INFERENCE_TIMEOUT = 30
+
+# Face detector DeepFace.represent uses by default; the in-process fallback
+# (deepface_utils.extract_embedding) relies on that default, so the server must
+# detect and align with the same backend for embeddings to match
+REPRESENT_DETECTOR_BACKEND = "opencv"
+
+
+class _EmbeddingRequest:
+    """A single face waiting for its embedding."""
+
+    __slots__ = ('image', 'embedding', 'error', 'done')
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self.embedding = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class EmbeddingModel:
+    """A loaded recognition model with DeepFace's preprocessing, able to embed a batch of faces."""
+
+    def __init__(self, model_name: str):
+        from deepface import DeepFace
+        from deepface.commons import functions
+
+        self.model_name = model_name
+        self._functions = functions
+        self.model = DeepFace.build_model(model_name)
+        self.target_size = functions.find_target_size(model_name=model_name)
+        self.is_keras = "keras" in str(type(self.model))
+        logger.info(f"Loaded {model_name} (target size {self.target_size}, batched={self.is_keras})")
+
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        """
+        Detect, align, resize and normalize the face in an image (BGR array)
+        the same way DeepFace.represent does with its default settings, so a
+        face gets the same embedding whether or not the server is running.
+        Registration photos and classroom crops both go through detection;
+        without a detectable face the whole image is used, as in represent.
+        """
+        img_objs = self._functions.extract_faces(
+            img=image,
+            target_size=self.target_size,
+            detector_backend=REPRESENT_DETECTOR_BACKEND,
+            grayscale=False,
+            enforce_detection=False,
+            align=True
+        )
+        face = img_objs[0][0]
+        return self._functions.normalize_input(img=face, normalization="base")
+
+    def embed_batch(self, images: List[np.ndarray]) -> List[List[float]]:
+        """Embed several faces with one forward pass where the model allows it"""
+        faces = [self.preprocess(image) for image in images]
+        if self.is_keras:
+            batch = np.concatenate(faces, axis=0)
+            return self.model(batch, training=False).numpy().tolist()
+        # Non-Keras models (e.g. SFace, Dlib) only take one face at a time
+        return [self.model.predict(face)[0].tolist() for face in faces]
+
+
+class DynamicBatcher:
+    """
+    Collects embedding requests for one model and runs them in batches.
+
+    The first waiting request opens a batch window; the batch is dispatched as
+    soon as it holds max_batch faces or max_wait has elapsed, whichever comes
+    first. That bounds the extra latency any request pays for batching.
+    """
+
+    def __init__(self, model: EmbeddingModel, max_batch: int = INFERENCE_MAX_BATCH,
+                 max_wait_ms: float = INFERENCE_MAX_WAIT_MS, max_pending: int = INFERENCE_MAX_PENDING):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_pending = max_pending
+        self._pending: List[_EmbeddingRequest] = []
+        self._cond = threading.Condition()
+        self.batches_run = 0
+        self.faces_embedded = 0
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{model.model_name}", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def submit(self, images: List[np.ndarray]) -> List[_EmbeddingRequest]:
+        """Queue faces for embedding. Raises OverflowError when the server is saturated."""
+        queued = [_EmbeddingRequest(image) for image in images]
+        with self._cond:
+            if len(self._pending) + len(queued) > self.max_pending:
+                raise OverflowError("Inference queue is full")
+            self._pending.extend(queued)
+            self._cond.notify()
+        return queued
+
+    def cancel(self, requests: List[_EmbeddingRequest]) -> int:
+        """Drop requests that have not been batched yet (e.g. their client gave up); returns how many"""
+        cancelled = set(map(id, requests))
+        with self._cond:
+            before = len(self._pending)
+            self._pending = [req for req in self._pending if id(req) not in cancelled]
+            return before - len(self._pending)
+
+    def _take_batch(self) -> List[_EmbeddingRequest]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                embeddings = self.model.embed_batch([req.image for req in batch])
+                for req, embedding in zip(batch, embeddings):
+                    req.embedding = embedding
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed for {self.model.model_name}: {str(e)}")
+                for req in batch:
+                    req.error = str(e)
+            finally:
+                self.batches_run += 1
+                self.faces_embedded += len(batch)
+                for req in batch:
+                    req.done.set()
+
+
+class InferenceService:
+    """Owns one batcher (and model) per recognition model name."""
+
+    def __init__(self, max_batch: int = INFERENCE_MAX_BATCH, max_wait_ms: float = INFERENCE_MAX_WAIT_MS,
+                 model_factory=EmbeddingModel):
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.model_factory = model_factory
+        self._batchers: Dict[str, DynamicBatcher] = {}
+        self._lock = threading.Lock()
+
+    def get_batcher(self, model_name: str) -> DynamicBatcher:
+        with self._lock:
+            if model_name not in self._batchers:
+                self._batchers[model_name] = DynamicBatcher(
+                    self.model_factory(model_name), max_batch=self.max_batch, max_wait_ms=self.max_wait_ms
+                )
+            return self._batchers[model_name]
+
+    def embed(self, model_name: str, images: List[Optional[np.ndarray]],
+              timeout: float = INFERENCE_TIMEOUT) -> List[Optional[List[float]]]:
+        """
+        Embed faces, returning None for entries that could not be decoded or embedded
+
+        Waits at most timeout seconds (INFERENCE_TIMEOUT, which clients extend
+        by their reply margin) so the reply reaches the client before it gives up.
+
+        Raises:
+            OverflowError: The batcher's queue is full
+            TimeoutError: Some faces were not embedded in time; those still
+                queued are dropped so the batcher does not work for nobody
+        """
+        batcher = self.get_batcher(model_name)
+        valid = [(i, image) for i, image in enumerate(images) if image is not None]
+        queued = batcher.submit([image for _, image in valid])
+        embeddings: List[Optional[List[float]]] = [None] * len(images)
+        deadline = time.monotonic() + timeout
+        for (i, _), req in zip(valid, queued):
+            if not req.done.wait(max(0.0, deadline - time.monotonic())):
+                unfinished = [req for req in queued if not req.done.is_set()]
+                dropped = batcher.cancel(unfinished)
+                raise TimeoutError(f"{len(unfinished)} of {len(queued)} face(s) not embedded within {timeout}s "
+                                   f"({dropped} dropped from the queue)")
+            if req.error is None:
+                embeddings[i] = req.embedding
+        return embeddings
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                'status': 'ok',
+                'models': list(self._batchers),
+                'pending': sum(b.pending for b in self._batchers.values()),
+                'batches_run': sum(b.batches_run for b in self._batchers.values()),
+                'faces_embedded': sum(b.faces_embedded for b in self._batchers.values())
+            }
+
+
+def _decode_image(data: bytes) -> Optional[np.ndarray]:
+    """Decode encoded image bytes into the BGR array layout DeepFace expects"""
+    try:
+        # Upright per the EXIF orientation, like cv2.imread and deepface_utils.load_image
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+        return np.asarray(image)[:, :, ::-1].copy()
+    except Exception as e:
+        logger.warning(f"Could not decode image: {str(e)}")
+        return None
+
+
+def _load_image(path: str) -> Optional[np.ndarray]:
+    try:
+        with open(path, "rb") as f:
+            return _decode_image(f.read())
+    except OSError as e:
+        logger.warning(f"Could not read image {path}: {str(e)}")
+        return None
+
+
+def _make_handler(service: InferenceService):
+    class InferenceRequestHandler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, payload: Dict):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, service.status())
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != "/embed":
+                self._reply(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length))
+                model_name = payload.get("model_name", "Facenet512")
+                images = [_decode_image(base64.b64decode(data)) for data in payload.get("images", [])]
+                images += [_load_image(path) for path in payload.get("paths", [])]
+                embeddings = service.embed(model_name, images)
+                self._reply(200, {'embeddings': embeddings})
+            except OverflowError as e:
+                self._reply(503, {'error': str(e)})
+            except TimeoutError as e:
+                logger.warning(f"Embedding request timed out: {str(e)}")
+                self._reply(504, {'error': str(e)})
+            except Exception as e:
+                logger.error(f"Error serving embedding request: {str(e)}")
+                self._reply(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s" % (self.address_string(), format % args))
+
+    return InferenceRequestHandler
+
+
+def serve(host: str = INFERENCE_SERVER_HOST, port: int = INFERENCE_SERVER_PORT,
+          max_batch: int = INFERENCE_MAX_BATCH, max_wait_ms: float = INFERENCE_MAX_WAIT_MS,
+          preload: Optional[List[str]] = None):
+    """Run the inference server until interrupted"""
+    service = InferenceService(max_batch=max_batch, max_wait_ms=max_wait_ms)
+    for model_name in preload or []:
+        service.get_batcher(model_name)
+
+    server = ThreadingHTTPServer((host, port), _make_handler(service))
+    server.daemon_threads = True
+    logger.info(f"Inference server listening on http://{host}:{port} (max batch {max_batch}, max wait {max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Shared face-embedding inference server")
+    parser.add_argument("--host", default=INFERENCE_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=INFERENCE_SERVER_PORT)
+    parser.add_argument("--max-batch", type=int, default=INFERENCE_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=INFERENCE_MAX_WAIT_MS)
+    parser.add_argument("--preload", nargs="*", default=[], help="Model names to load at startup")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.max_batch, args.max_wait_ms, args.preload)
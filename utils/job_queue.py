@@ -0,0 +1,686 @@
+"""
+Background recognition job queue.
+
+Recognition requests are persisted in the ``recognition_jobs`` table and
+processed by a pool of worker threads instead of inside the Streamlit script.
+The UI polls job status and partial results by job id, so a slow detector no
+longer blocks the teacher's session and a browser refresh does not throw the
+work away. Workers pick jobs fairly across queue keys (one per classroom /
+teacher), so concurrent requests take turns instead of piling up in order.
+
+Workers normally run inside the web process (see ``start_recognition_workers``),
+but the module can also be run on its own to host them in a separate process:
+
+    python -m utils.job_queue
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from utils.db_utils import (
+    get_directory_connection,
+    save_recognition_run,
+    current_db_path,
+    routed_to,
+    get_students_by_subject,
+    mark_attendance_bulk
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import (
+        RECOGNITION_WORKERS,
+        RECOGNITION_JOB_POLL_INTERVAL,
+        RECOGNITION_JOB_STALE_AFTER,
+        RECOGNITION_JOB_MAX_ATTEMPTS,
+        RECOGNITION_JOB_RETENTION_HOURS
+    )
+except ImportError:
+    RECOGNITION_WORKERS = 2
+    RECOGNITION_JOB_POLL_INTERVAL = 1.0
+    RECOGNITION_JOB_STALE_AFTER = 300
+    RECOGNITION_JOB_MAX_ATTEMPTS = 3
+    RECOGNITION_JOB_RETENTION_HOURS = 24
+
+# Statuses after which a job will not change any more
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+# Minimum seconds between progress writes for the same job
+PROGRESS_WRITE_INTERVAL = 0.5
+
+# Student fields copied into the job so workers do not depend on the caller's objects
+STUDENT_FIELDS = ('id', 'roll_no', 'name', 'email', 'image_path')
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _row_to_job(row) -> Dict:
+    """Convert a recognition_jobs row into a dictionary with decoded JSON fields"""
+    job = {key: row[key] for key in row.keys() if key != 'image'}
+    for field in ('params', 'partial_result', 'result', 'attendance_result'):
+        if job.get(field):
+            try:
+                job[field] = json.loads(job[field])
+            except (TypeError, ValueError):
+                logger.warning(f"Could not decode {field} for job {job.get('id')}")
+                job[field] = None
+    return job
+
+
+def submit_recognition_batch(images: List[bytes], students: List[Dict], params: Dict,
+                             queue_key: str, submitted_by: Optional[str] = None,
+                             context: Optional[Dict] = None) -> str:
+    """
+    Queue one recognition job per image and return the batch id.
+
+    Args:
+        images: Raw image bytes, one entry per classroom image
+        students: Student dictionaries to match against (id, roll_no, name, image_path)
+        params: Recognition settings (threshold, model_name, detector_backend)
+        queue_key: Fairness key, typically the teacher or classroom submitting the job
+        submitted_by: Username of the submitting user (used to recover jobs after a refresh)
+        context: Extra data the UI needs to render the result (subject, date, period, ...);
+            subject_id, selected_date and selected_period are also where the
+            batch's attendance is saved once every job has finished
+
+    Returns:
+        Batch id shared by all queued jobs
+    """
+    batch_id = uuid.uuid4().hex
+    job_params = dict(params)
+    job_params['students'] = [
+        {field: student.get(field) for field in STUDENT_FIELDS} for student in students
+    ]
+    # Attendance is saved to the database (division shard) the batch was submitted from
+    job_params['context'] = dict(context or {}, db_path=current_db_path())
+    encoded_params = json.dumps(job_params)
+    created_at = _now()
+
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        for image_bytes in images:
+            cursor.execute('''
+            INSERT INTO recognition_jobs (id, batch_id, queue_key, submitted_by, status, params, image, stage, created_at)
+            VALUES (?, ?, ?, ?, 'queued', ?, ?, 'queued', ?)
+            ''', (uuid.uuid4().hex, batch_id, queue_key, submitted_by, encoded_params,
+                  sqlite3.Binary(image_bytes), created_at))
+        conn.commit()
+    finally:
+        conn.close()
+
+    logger.info(f"Queued recognition batch {batch_id} with {len(images)} job(s) for queue '{queue_key}'")
+    _notify_workers()
+    return batch_id
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """Get a job's status, progress and (partial) result by id"""
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM recognition_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        return _row_to_job(row) if row else None
+    finally:
+        conn.close()
+
+
+def get_batch_jobs(batch_id: str) -> List[Dict]:
+    """Get all jobs of a batch in submission order"""
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT * FROM recognition_jobs WHERE batch_id = ? ORDER BY created_at, rowid
+        ''', (batch_id,))
+        return [_row_to_job(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def get_job_image(job_id: str) -> Optional[bytes]:
+    """Get the classroom image stored with a job"""
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT image FROM recognition_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        return bytes(row['image']) if row and row['image'] is not None else None
+    finally:
+        conn.close()
+
+
+def get_pending_batch_for_user(username: str) -> Optional[str]:
+    """
+    Find the most recent batch submitted by a user whose results have not been consumed.
+    Lets the UI pick up running jobs again after a browser refresh or reconnect.
+    """
+    if not username:
+        return None
+
+    since = (datetime.now() - timedelta(hours=RECOGNITION_JOB_RETENTION_HOURS)).isoformat()
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT batch_id FROM recognition_jobs
+        WHERE submitted_by = ? AND consumed_at IS NULL AND created_at >= ?
+        ORDER BY created_at DESC
+        LIMIT 1
+        ''', (username, since))
+        row = cursor.fetchone()
+        return row['batch_id'] if row else None
+    finally:
+        conn.close()
+
+
+def mark_batch_consumed(batch_id: str):
+    """Mark a batch's results as handled by the UI so they are not rendered again"""
+    conn = get_directory_connection()
+    try:
+        conn.execute('''
+        UPDATE recognition_jobs SET consumed_at = ? WHERE batch_id = ? AND consumed_at IS NULL
+        ''', (_now(), batch_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def cancel_batch(batch_id: str) -> int:
+    """Cancel the queued jobs of a batch and mark it consumed. Running jobs finish normally."""
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        now = _now()
+        cursor.execute('''
+        UPDATE recognition_jobs
+        SET status = 'cancelled', stage = 'cancelled', finished_at = ?, image = NULL
+        WHERE batch_id = ? AND status = 'queued'
+        ''', (now, batch_id))
+        cancelled = cursor.rowcount
+        cursor.execute('''
+        UPDATE recognition_jobs SET consumed_at = ? WHERE batch_id = ? AND consumed_at IS NULL
+        ''', (now, batch_id))
+        conn.commit()
+        return cancelled
+    finally:
+        conn.close()
+
+
+def get_queue_position(job_id: str) -> int:
+    """Number of queued jobs submitted before this one (0 when the job is not queued)"""
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT COUNT(*) FROM recognition_jobs
+        WHERE status = 'queued'
+          AND created_at < (SELECT created_at FROM recognition_jobs WHERE id = ? AND status = 'queued')
+        ''', (job_id,))
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def claim_next_job(worker_id: str) -> Optional[Dict]:
+    """
+    Atomically claim the next queued job for a worker.
+
+    Jobs are picked fairly across queue keys: the key with the fewest running jobs
+    goes first, ties go to the key that was served least recently, and only then
+    does submission order apply. A classroom that queued ten images therefore
+    cannot starve another classroom that queued one.
+    """
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        # IMMEDIATE takes the write lock up front so two workers (or processes)
+        # cannot claim the same job
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+        SELECT j.id FROM recognition_jobs j
+        WHERE j.status = 'queued'
+        ORDER BY
+            (SELECT COUNT(*) FROM recognition_jobs r
+             WHERE r.queue_key = j.queue_key AND r.status = 'running'),
+            COALESCE((SELECT MAX(r.started_at) FROM recognition_jobs r
+                      WHERE r.queue_key = j.queue_key), ''),
+            j.created_at
+        LIMIT 1
+        ''')
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+
+        now = _now()
+        cursor.execute('''
+        UPDATE recognition_jobs
+        SET status = 'running', stage = 'starting', worker_id = ?, attempts = attempts + 1,
+            started_at = ?, heartbeat_at = ?
+        WHERE id = ? AND status = 'queued'
+        ''', (worker_id, now, now, row['id']))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return None
+        conn.commit()
+
+        cursor.execute('SELECT * FROM recognition_jobs WHERE id = ?', (row['id'],))
+        job_row = cursor.fetchone()
+        job = _row_to_job(job_row)
+        job['image'] = bytes(job_row['image']) if job_row['image'] is not None else None
+        return job
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def update_job_progress(job_id: str, progress: float, stage: str, partial_result: Optional[Dict] = None):
+    """Record progress for a running job; doubles as the worker heartbeat"""
+    conn = get_directory_connection()
+    try:
+        conn.execute('''
+        UPDATE recognition_jobs
+        SET progress = ?, stage = ?, partial_result = COALESCE(?, partial_result), heartbeat_at = ?
+        WHERE id = ? AND status = 'running'
+        ''', (progress, stage, json.dumps(partial_result) if partial_result is not None else None,
+              _now(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def complete_job(job_id: str, worker_id: str, result: Dict) -> bool:
+    """
+    Store a job's final result
+
+    Only the worker currently holding the job can complete it: after a stale
+    job was requeued (and maybe claimed again) or cancelled, the original
+    worker's late result is dropped.
+
+    Returns:
+        True if the result was stored
+    """
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE recognition_jobs
+        SET status = 'completed', stage = 'completed', progress = 1.0, result = ?, finished_at = ?, heartbeat_at = ?
+        WHERE id = ? AND status = 'running' AND worker_id = ?
+        ''', (json.dumps(result), _now(), _now(), job_id, worker_id))
+        conn.commit()
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+
+def fail_job(job_id: str, worker_id: str, error: str) -> bool:
+    """
+    Record a failed attempt; the job is retried until RECOGNITION_JOB_MAX_ATTEMPTS is reached
+
+    Like complete_job, only the worker currently holding the job can fail it.
+
+    Returns:
+        True if the failure was recorded
+    """
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE recognition_jobs
+        SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+            stage = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+            error = ?, worker_id = NULL,
+            finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END
+        WHERE id = ? AND status = 'running' AND worker_id = ?
+        ''', (RECOGNITION_JOB_MAX_ATTEMPTS, RECOGNITION_JOB_MAX_ATTEMPTS, error,
+              RECOGNITION_JOB_MAX_ATTEMPTS, _now(), job_id, worker_id))
+        conn.commit()
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+
+def save_batch_attendance(batch_id: str) -> Optional[Dict]:
+    """
+    Save the attendance of a batch once every one of its jobs has finished
+
+    Students recognized in the batch's images are marked present and everyone
+    else enrolled in the subject absent, in the database the batch was
+    submitted from. This runs in the worker that finishes the batch, so the
+    attendance is saved whether or not the teacher is still on the page.
+    Batches with unfinished or cancelled jobs are left alone. If an image
+    failed, nothing is saved (its students would all be marked absent) and the
+    batch gets an error result asking for a retake instead.
+
+    The batch is claimed by setting attendance_saved_at and finished by setting
+    attendance_result. A claim older than RECOGNITION_JOB_STALE_AFTER without a
+    result belongs to a worker that died while saving and is taken over;
+    saving the same statuses again is harmless.
+
+    Returns:
+        The attendance_result stored on the batch's jobs ({'present', 'absent',
+        'failed'} counts or {'error'}), or None if the batch was not saved now
+    """
+    stale_claim = (datetime.now() - timedelta(seconds=RECOGNITION_JOB_STALE_AFTER)).isoformat()
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        # IMMEDIATE so exactly one of the workers finishing a batch claims it
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+        SELECT status, params, result, submitted_by, attendance_saved_at, attendance_result
+        FROM recognition_jobs WHERE batch_id = ? ORDER BY created_at, rowid
+        ''', (batch_id,))
+        rows = cursor.fetchall()
+        job_statuses = [row['status'] for row in rows]
+        if not rows or not set(job_statuses) <= set(FINISHED_STATUSES) or 'cancelled' in job_statuses \
+                or any(row['attendance_result'] for row in rows) \
+                or any(row['attendance_saved_at'] and row['attendance_saved_at'] >= stale_claim for row in rows):
+            conn.rollback()
+            return None
+
+        failed = job_statuses.count('failed')
+        if failed:
+            # Claim and result in one transaction: there is nothing to save
+            attendance = {'error': f"{failed} of {len(rows)} image(s) could not be processed, so attendance "
+                                   f"was not saved. Please retake the photo."}
+            cursor.execute('''
+            UPDATE recognition_jobs SET attendance_saved_at = ?, attendance_result = ? WHERE batch_id = ?
+            ''', (_now(), json.dumps(attendance), batch_id))
+            conn.commit()
+            logger.warning(f"Not saving attendance of recognition batch {batch_id}: {failed} image(s) failed")
+            return attendance
+
+        cursor.execute('''
+        UPDATE recognition_jobs SET attendance_saved_at = ? WHERE batch_id = ?
+        ''', (_now(), batch_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+    params = json.loads(rows[0]['params'])
+    context = params.get('context', {})
+    results = [json.loads(row['result'] or '{}') for row in rows if row['status'] == 'completed']
+    present_ids = {student['id'] for result in results for student in result.get('present_students', [])}
+
+    try:
+        if context.get('subject_id') is None:
+            raise ValueError("the batch has no subject")
+        with routed_to(context.get('db_path') or current_db_path()):
+            statuses = {student['id']: 'absent' for student in get_students_by_subject(context['subject_id'])}
+            statuses.update({student_id: 'present' for student_id in present_ids})
+            outcomes = mark_attendance_bulk(
+                context['subject_id'], context.get('selected_date'), context.get('selected_period'), statuses,
+                taken_by=rows[0]['submitted_by'],
+                capture_source='recognition',
+                capture_metadata={
+                    'batch_id': batch_id,
+                    'images': len(results),
+                    'detected_faces': sum(result.get('detected_faces', 0) for result in results),
+                    'model_name': params.get('model_name'),
+                    'detector_backend': params.get('detector_backend')
+                }
+            )
+        saved = {student_id for student_id, outcome in outcomes.items() if outcome != 'failed'}
+        present = sum(1 for student_id in saved if statuses[student_id] == 'present')
+        attendance = {'present': present, 'absent': len(saved) - present, 'failed': len(outcomes) - len(saved)}
+        logger.info(f"Saved attendance of recognition batch {batch_id}: {attendance['present']} present, "
+                    f"{attendance['absent']} absent, {attendance['failed']} failed")
+    except Exception as e:
+        logger.error(f"Could not save attendance of recognition batch {batch_id}: {str(e)}")
+        attendance = {'error': str(e)}
+
+    conn = get_directory_connection()
+    try:
+        conn.execute('''
+        UPDATE recognition_jobs SET attendance_result = ? WHERE batch_id = ?
+        ''', (json.dumps(attendance), batch_id))
+        conn.commit()
+    finally:
+        conn.close()
+    return attendance
+
+
+def save_finished_batches() -> int:
+    """
+    Save the attendance of finished batches a worker did not get to (e.g. it
+    was stopped), or died while saving
+    """
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT DISTINCT batch_id FROM recognition_jobs
+        WHERE status IN ('completed', 'failed') AND attendance_result IS NULL
+          AND (attendance_saved_at IS NULL OR attendance_saved_at < ?)
+        ''', ((datetime.now() - timedelta(seconds=RECOGNITION_JOB_STALE_AFTER)).isoformat(),))
+        batch_ids = [row['batch_id'] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return sum(1 for batch_id in batch_ids if save_batch_attendance(batch_id) is not None)
+
+
+def requeue_stale_jobs() -> int:
+    """
+    Put running jobs whose worker stopped sending heartbeats back in the queue.
+    This is what lets jobs survive a restart of the process hosting the workers.
+    """
+    cutoff = (datetime.now() - timedelta(seconds=RECOGNITION_JOB_STALE_AFTER)).isoformat()
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE recognition_jobs
+        SET status = 'queued', stage = 'queued', worker_id = NULL
+        WHERE status = 'running' AND heartbeat_at < ?
+        ''', (cutoff,))
+        requeued = cursor.rowcount
+        conn.commit()
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale recognition job(s)")
+        return requeued
+    finally:
+        conn.close()
+
+
+def purge_old_jobs() -> int:
+    """Delete finished jobs older than the retention window"""
+    cutoff = (datetime.now() - timedelta(hours=RECOGNITION_JOB_RETENTION_HOURS)).isoformat()
+    conn = get_directory_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        DELETE FROM recognition_jobs
+        WHERE status IN ('completed', 'failed', 'cancelled') AND created_at < ?
+        ''', (cutoff,))
+        purged = cursor.rowcount
+        conn.commit()
+        return purged
+    finally:
+        conn.close()
+
+
+def run_recognition_job(job: Dict) -> Dict:
+    """
+    Run face recognition for a claimed job and return its result.
+    Progress and matched students are published while the job runs.
+    """
+    from utils.deepface_utils import verify_faces
+
+    params = job['params'] or {}
+    students = params.get('students', [])
+    partial = {'face_locations': [], 'matched': []}
+    last_write = [0.0]
+
+    def on_progress(stage, progress, data):
+        if stage == 'detected':
+            partial['face_locations'] = data.get('face_locations', [])
+        elif stage == 'matched':
+            student = data.get('student', {})
+            partial['matched'].append({
+                'id': student.get('id'),
+                'roll_no': student.get('roll_no'),
+                'name': student.get('name'),
+                'confidence': data.get('confidence', 0)
+            })
+        # Always persist detections and matches, throttle plain progress ticks
+        now = time.time()
+        if stage in ('detected', 'matched') or now - last_write[0] >= PROGRESS_WRITE_INTERVAL:
+            last_write[0] = now
+            update_job_progress(job['id'], round(progress, 3), stage, partial)
+
+    # verify_faces decodes the stored bytes directly, nothing is staged on disk
+    pipeline_stats = {}
+    start_time = time.time()
+    present_students, confidence_scores = verify_faces(
+        classroom_image=job['image'] or b'',
+        students=students,
+        threshold=params.get('threshold', 0.6),
+        model_name=params.get('model_name', 'Facenet512'),
+        return_confidence=True,
+        detector_backend=params.get('detector_backend', 'opencv'),
+        progress_callback=on_progress,
+        stats=pipeline_stats
+    )
+    processing_time = time.time() - start_time
+    save_recognition_run(pipeline_stats, processing_time, len(present_students), job_id=job['id'])
+
+    return {
+        'present_students': present_students,
+        'confidence_scores': [float(c) for c in confidence_scores],
+        'detected_faces': len(partial['face_locations']),
+        'face_locations': partial['face_locations'],
+        'processing_time': processing_time,
+        'pipeline_stats': pipeline_stats
+    }
+
+
+class RecognitionWorkerPool:
+    """Pool of worker threads draining the recognition job queue."""
+
+    def __init__(self, num_workers: int = RECOGNITION_WORKERS, poll_interval: float = RECOGNITION_JOB_POLL_INTERVAL):
+        self.num_workers = max(1, num_workers)
+        self.poll_interval = poll_interval
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Start the worker threads (no-op if already running)"""
+        if self._threads:
+            return
+        requeue_stale_jobs()
+        save_finished_batches()
+        purge_old_jobs()
+        for i in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(f"{self.worker_prefix}:{i}",),
+                name=f"recognition-worker-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.num_workers} recognition worker(s)")
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask the workers to stop after their current job"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers because a job was queued"""
+        self._wakeup.set()
+
+    def _worker_loop(self, worker_id: str):
+        last_maintenance = time.time()
+        while not self._stop.is_set():
+            try:
+                if time.time() - last_maintenance > RECOGNITION_JOB_STALE_AFTER:
+                    requeue_stale_jobs()
+                    save_finished_batches()
+                    last_maintenance = time.time()
+
+                job = claim_next_job(worker_id)
+            except Exception as e:
+                logger.error(f"Recognition worker {worker_id} could not claim a job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            logger.info(f"Worker {worker_id} processing job {job['id']} (queue '{job['queue_key']}', attempt {job['attempts']})")
+            try:
+                result = run_recognition_job(job)
+                if not complete_job(job['id'], worker_id, result):
+                    logger.warning(f"Dropped result of job {job['id']}: it was requeued or cancelled meanwhile")
+                    continue
+                logger.info(f"Job {job['id']} completed: {len(result['present_students'])} students recognized "
+                            f"in {result['processing_time']:.2f}s")
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {str(e)}")
+                try:
+                    fail_job(job['id'], worker_id, str(e))
+                except Exception as db_error:
+                    logger.error(f"Could not record failure for job {job['id']}: {str(db_error)}")
+
+            # The worker finishing a batch saves its attendance
+            try:
+                save_batch_attendance(job['batch_id'])
+            except Exception as e:
+                logger.error(f"Could not save attendance of batch {job['batch_id']}: {str(e)}")
+
+
+# Global worker pool instance (one per process)
+_worker_pool: Optional[RecognitionWorkerPool] = None
+_worker_pool_lock = threading.Lock()
+
+
+def start_recognition_workers(num_workers: int = RECOGNITION_WORKERS) -> RecognitionWorkerPool:
+    """Get or start the process-wide recognition worker pool"""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = RecognitionWorkerPool(num_workers=num_workers)
+            _worker_pool.start()
+    return _worker_pool
+
+
+def _notify_workers():
+    if _worker_pool is not None:
+        _worker_pool.notify()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from utils.db_utils import init_db
+    init_db()
+    pool = start_recognition_workers()
+    print(f"Recognition workers running ({pool.num_workers}). Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop(timeout=5)
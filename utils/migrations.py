@@ -0,0 +1,561 @@
+"""
+Versioned schema migrations for the attendance database.
+
+Each migration is a numbered function that takes a cursor and brings the
+schema from the previous version to its own. Applied versions are recorded in
+the ``schema_version`` table, so starting the app on an up-to-date database
+costs a single ``SELECT MAX(version)``.
+
+Migrations are written to be safe on databases that predate this table
+(``CREATE ... IF NOT EXISTS``, column checks before ``ALTER TABLE``): such a
+database starts at version 0, replays every migration without changing what
+already exists and ends at the latest version.
+
+With SHARDING_ENABLED every division shard is migrated too. Users and
+recognition jobs only live in the directory database (DB_PATH), so
+migrations registered with ``directory_only=True`` and the sample users are
+skipped on shards; the version is still recorded there.
+
+Run pending migrations by hand with:
+
+    python -m utils.migrations            # apply
+    python -m utils.migrations --status   # show applied and pending versions
+"""
+import datetime
+import logging
+from typing import Callable, List, Tuple
+
+from utils import db_utils
+from utils.db_utils import get_connection, VERSIONED_TABLES, _SUMMARY_TRIGGERS, _rebuild_attendance_summaries
+
+logger = logging.getLogger(__name__)
+
+# (version, description, function) in the order they must be applied
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, description: str, directory_only: bool = False):
+    """
+    Register a schema migration; versions must be added in increasing order
+
+    Args:
+        directory_only: Only apply to the directory database (users, recognition
+            jobs); division shards just record the version
+    """
+    def register(func):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} registered after {MIGRATIONS[-1][0]}")
+        func.directory_only = directory_only
+        MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+
+def _directory_database() -> bool:
+    """Whether the database being migrated is DB_PATH rather than a division shard"""
+    return db_utils.current_db_path() == db_utils.DB_PATH
+
+
+def _columns(cursor, table: str) -> List[str]:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+
+@migration(1, "Core tables: users, students, subjects, enrollments, attendance")
+def _initial_schema(cursor):
+    if _directory_database():
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('HOD', 'Class Teacher', 'Teacher')),
+            name TEXT NOT NULL,
+            email TEXT,
+            department TEXT DEFAULT 'ENTC',
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP
+        )
+        ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        roll_no TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        email TEXT,
+        department TEXT DEFAULT 'ENTC',
+        year TEXT DEFAULT 'B.Tech',
+        division TEXT DEFAULT 'B',
+        image_path TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS subjects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS student_subjects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+        FOREIGN KEY (subject_id) REFERENCES subjects (id) ON DELETE CASCADE,
+        UNIQUE (student_id, subject_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        period TEXT NOT NULL,
+        status TEXT DEFAULT 'present',
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+        FOREIGN KEY (subject_id) REFERENCES subjects (id) ON DELETE CASCADE,
+        UNIQUE (student_id, subject_id, date, period)
+    )
+    ''')
+
+
+@migration(2, "Student email and division columns")
+def _student_contact_columns(cursor):
+    # Formerly utils/migrate_db.py; very old databases lack these columns
+    columns = _columns(cursor, "students")
+    for name, definition in (
+        ("email", "TEXT"),
+        ("department", "TEXT DEFAULT 'ENTC'"),
+        ("year", "TEXT DEFAULT 'B.Tech'"),
+        ("division", "TEXT DEFAULT 'B'"),
+    ):
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE students ADD COLUMN {name} {definition}")
+            logger.info(f"Added {name} column to students table")
+
+
+@migration(3, "Background recognition job queue", directory_only=True)
+def _recognition_jobs(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recognition_jobs (
+        id TEXT PRIMARY KEY,
+        batch_id TEXT NOT NULL,
+        queue_key TEXT NOT NULL,
+        submitted_by TEXT,
+        status TEXT NOT NULL DEFAULT 'queued'
+            CHECK(status IN ('queued', 'running', 'completed', 'failed', 'cancelled')),
+        params TEXT NOT NULL,
+        image BLOB,
+        progress REAL DEFAULT 0,
+        stage TEXT,
+        partial_result TEXT,
+        result TEXT,
+        error TEXT,
+        attempts INTEGER DEFAULT 0,
+        worker_id TEXT,
+        created_at TIMESTAMP NOT NULL,
+        started_at TIMESTAMP,
+        heartbeat_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        consumed_at TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_recognition_jobs_status
+    ON recognition_jobs (status, queue_key, created_at)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_recognition_jobs_batch
+    ON recognition_jobs (batch_id)
+    ''')
+
+
+@migration(4, "Per-stage timing of recognition runs", directory_only=True)
+def _recognition_runs(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recognition_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id TEXT,
+        created_at TIMESTAMP NOT NULL,
+        model_name TEXT,
+        detector_backend TEXT,
+        image_width INTEGER,
+        image_height INTEGER,
+        face_count INTEGER DEFAULT 0,
+        roster_size INTEGER DEFAULT 0,
+        recognized_count INTEGER DEFAULT 0,
+        total_time REAL,
+        decode_time REAL,
+        detection_time REAL,
+        crop_align_time REAL,
+        embedding_time REAL,
+        gallery_load_time REAL,
+        matching_time REAL,
+        visualization_time REAL,
+        embedding_per_face TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_recognition_runs_job
+    ON recognition_runs (job_id)
+    ''')
+
+
+@migration(5, "Transactional email outbox")
+def _email_outbox(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        student_id INTEGER,
+        subject_id INTEGER,
+        payload TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending'
+            CHECK(state IN ('pending', 'sending', 'sent', 'failed')),
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP NOT NULL,
+        next_attempt_at TIMESTAMP NOT NULL,
+        claimed_at TIMESTAMP,
+        sent_at TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+    ON email_outbox (state, next_attempt_at)
+    ''')
+
+
+@migration(6, "Covering indexes for report queries")
+def _report_indexes(cursor):
+    # The UNIQUE indexes only serve lookups that lead with student_id and subject_id
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_student_subjects_subject
+    ON student_subjects (subject_id, student_id)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_attendance_subject_date
+    ON attendance (subject_id, date, student_id, period, status)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_attendance_date
+    ON attendance (date, subject_id, student_id, period, status)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_attendance_student_date
+    ON attendance (student_id, date, subject_id, period, status)
+    ''')
+
+
+@migration(7, "Class sessions referenced by attendance")
+def _class_sessions(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS class_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        subject_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        period TEXT NOT NULL,
+        taken_by TEXT,
+        capture_source TEXT,
+        capture_metadata TEXT,
+        created_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP,
+        FOREIGN KEY (subject_id) REFERENCES subjects (id) ON DELETE CASCADE,
+        UNIQUE (subject_id, date, period)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_class_sessions_date
+    ON class_sessions (date, subject_id)
+    ''')
+
+    if 'session_id' not in _columns(cursor, "attendance"):
+        cursor.execute('''
+        ALTER TABLE attendance ADD COLUMN session_id INTEGER REFERENCES class_sessions (id) ON DELETE SET NULL
+        ''')
+        logger.info("Added session_id column to attendance table")
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_attendance_session
+    ON attendance (session_id, student_id, status)
+    ''')
+
+    # One session per (subject, date, period) already found in attendance
+    cursor.execute('''
+    INSERT OR IGNORE INTO class_sessions (subject_id, date, period, capture_source, created_at)
+    SELECT DISTINCT subject_id, date, period, 'backfill', ?
+    FROM attendance WHERE session_id IS NULL
+    ''', (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+    cursor.execute('''
+    UPDATE attendance SET session_id = (
+        SELECT cs.id FROM class_sessions cs
+        WHERE cs.subject_id = attendance.subject_id AND cs.date = attendance.date AND cs.period = attendance.period
+    )
+    WHERE session_id IS NULL
+    ''')
+    if cursor.rowcount > 0:
+        logger.info(f"Linked {cursor.rowcount} attendance records to class sessions")
+
+
+@migration(8, "Daily and weekly attendance summary tables")
+def _attendance_summaries(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_daily (
+        student_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        subject_id INTEGER NOT NULL,
+        present_count INTEGER NOT NULL DEFAULT 0,
+        total_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (student_id, date, subject_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_weekly (
+        student_id INTEGER NOT NULL,
+        week_start TEXT NOT NULL,
+        subject_id INTEGER NOT NULL,
+        present_count INTEGER NOT NULL DEFAULT 0,
+        total_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (student_id, week_start, subject_id)
+    ) WITHOUT ROWID
+    ''')
+    for statement in _SUMMARY_TRIGGERS:
+        cursor.execute(statement)
+    _rebuild_attendance_summaries(cursor)
+
+
+@migration(9, "Enrollment policy with set-based auto-enrollment triggers")
+def _enrollment_policy(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS enrollment_policy (
+        name TEXT PRIMARY KEY,
+        enabled INTEGER NOT NULL DEFAULT 1
+    )
+    ''')
+    # Every student takes every subject unless this policy is switched off
+    cursor.execute('''
+    INSERT OR IGNORE INTO enrollment_policy (name, enabled) VALUES ('all_students_all_subjects', 1)
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_enroll_new_student
+    AFTER INSERT ON students
+    WHEN (SELECT enabled FROM enrollment_policy WHERE name = 'all_students_all_subjects')
+    BEGIN
+        INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
+        SELECT NEW.id, id FROM subjects;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_enroll_new_subject
+    AFTER INSERT ON subjects
+    WHEN (SELECT enabled FROM enrollment_policy WHERE name = 'all_students_all_subjects')
+    BEGIN
+        INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
+        SELECT id, NEW.id FROM students;
+    END
+    ''')
+    # Enrollments the startup auto-enroll used to create on every rerun
+    cursor.execute('''
+    INSERT OR IGNORE INTO student_subjects (student_id, subject_id)
+    SELECT s.id, sub.id FROM students s CROSS JOIN subjects sub
+    ''')
+
+
+@migration(10, "Per-table change counters for cross-process cache coherence")
+def _table_version_counters(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    for table in VERSIONED_TABLES:
+        cursor.execute('''
+        INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)
+        ''', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+            END
+            ''')
+
+
+@migration(11, "Archived attendance terms")
+def _attendance_terms(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_terms (
+        term TEXT PRIMARY KEY,
+        date_from TEXT NOT NULL,
+        date_to TEXT NOT NULL,
+        table_suffix TEXT UNIQUE NOT NULL,
+        attendance_rows INTEGER NOT NULL DEFAULT 0,
+        session_rows INTEGER NOT NULL DEFAULT 0,
+        archived_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+
+@migration(12, "Division of each user, for routing to division databases", directory_only=True)
+def _user_division(cursor):
+    if 'division' not in _columns(cursor, 'users'):
+        # NULL: the user works across the whole department (e.g. the HOD)
+        cursor.execute("ALTER TABLE users ADD COLUMN division TEXT")
+
+
+@migration(13, "Attendance saved by recognition workers when a batch finishes", directory_only=True)
+def _recognition_batch_attendance(cursor):
+    columns = _columns(cursor, 'recognition_jobs')
+    for name, definition in (("attendance_saved_at", "TIMESTAMP"), ("attendance_result", "TEXT")):
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE recognition_jobs ADD COLUMN {name} {definition}")
+
+
+def _seed_defaults(cursor):
+    """Insert configured subjects and, on an empty directory users table, the sample accounts"""
+    try:
+        from config import DEFAULT_SUBJECTS
+        subjects = DEFAULT_SUBJECTS
+    except ImportError:
+        subjects = [
+            ("FOC", "Fiber Optic Communication"),
+            ("ME", "Microwave Engineering"),
+            ("MC", "Mobile Computing"),
+            ("Ewaste", "E-Waste Management"),
+            ("DSAJ", "Data Structures and Algorithms in Java"),
+            ("EEFM", "Engineering Economics and Financial Management"),
+            ("ME Lab", "Microwave Engineering Lab"),
+            ("Mini project", "Mini Project"),
+        ]
+
+    cursor.executemany('''
+    INSERT OR IGNORE INTO subjects (code, name) VALUES (?, ?)
+    ''', subjects)
+
+    if not _directory_database():
+        return
+    cursor.execute('SELECT COUNT(*) FROM users')
+    if cursor.fetchone()[0] > 0:
+        return
+
+    import hashlib
+
+    sample_users = [
+        ('admin', 'admin123', 'HOD', 'Head of Department', 'hod@example.com'),
+        ('classteacher', 'teacher123', 'Class Teacher', 'Class Teacher', 'classteacher@example.com'),
+        ('teacher', 'teacher123', 'Teacher', 'Subject Teacher', 'teacher@example.com'),
+    ]
+    for username, password, role, name, email in sample_users:
+        cursor.execute('''
+        INSERT INTO users (username, password_hash, role, name, email, department)
+        VALUES (?, ?, ?, ?, ?, 'ENTC')
+        ''', (username, hashlib.sha256(password.encode()).hexdigest(), role, name, email))
+        logger.info(f"Sample user created: {username} ({role}) - password: {password}")
+    logger.info("Sample authentication users created successfully!")
+
+
+def _ensure_version_table(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+
+def get_schema_version(cursor) -> int:
+    """Return the highest applied migration version (0 for an unversioned database)"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+    if cursor.fetchone() is None:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def migrate() -> List[int]:
+    """
+    Apply pending migrations, each in its own transaction, then seed defaults
+
+    Safe to run from several processes at once: the version is re-read after
+    taking the write lock, so each migration is applied exactly once.
+
+    Returns:
+        List of the migration versions applied by this call
+    """
+    applied = []
+    directory = _directory_database()
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        if get_schema_version(cursor) >= latest_version():
+            # Up to date; defaults are still synced so new configured subjects appear
+            cursor.execute('BEGIN IMMEDIATE')
+            _seed_defaults(cursor)
+            conn.commit()
+            return applied
+
+        for version, description, func in MIGRATIONS:
+            cursor.execute('BEGIN IMMEDIATE')
+            _ensure_version_table(cursor)
+            if get_schema_version(cursor) >= version:
+                conn.rollback()
+                continue
+            if func.directory_only and not directory:
+                logger.info(f"Recording migration {version} (directory database only): {description}")
+            else:
+                logger.info(f"Applying migration {version}: {description}")
+                func(cursor)
+            cursor.execute('''
+            INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)
+            ''', (version, description, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+            applied.append(version)
+
+        cursor.execute('BEGIN IMMEDIATE')
+        _seed_defaults(cursor)
+        conn.commit()
+
+        # Refresh planner statistics after schema changes
+        cursor.execute("PRAGMA optimize")
+        return applied
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def migration_status() -> List[Tuple[int, str, bool]]:
+    """Return (version, description, applied) for every known migration"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        current = get_schema_version(cursor)
+        return [(version, description, version <= current) for version, description, _ in MIGRATIONS]
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if "--status" in sys.argv:
+        for version, description, applied in migration_status():
+            print(f"{version:3d}  {'applied' if applied else 'pending':8s} {description}")
+    else:
+        from utils.db_utils import init_db
+        init_db()
@@ -0,0 +1,256 @@
+"""
+Per-statement timing for the SQLite connection layer.
+
+Every connection handed out by ``db_utils.get_connection()`` creates
+``TimedCursor`` cursors (``conn.execute`` goes through them too). Each
+statement is timed from ``execute`` through its fetches and recorded under its
+query shape: the SQL with whitespace collapsed and literals and ``IN (...)``
+lists replaced by ``?``. For every shape we keep the count, total and maximum
+time, the rows returned or changed, a latency histogram and which functions
+issued it.
+
+Statements slower than QUERY_SLOW_MS are logged together with their
+``EXPLAIN QUERY PLAN`` and kept in a short in-memory list for the admin
+"DB Performance" page. Statistics are per process; every Streamlit session of
+a worker shares them.
+"""
+import re
+import sys
+import time
+import logging
+import threading
+import sqlite3
+from collections import Counter, deque
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import QUERY_STATS_ENABLED, QUERY_SLOW_MS, QUERY_SLOW_LOG_SIZE
+except ImportError:
+    QUERY_STATS_ENABLED = True
+    QUERY_SLOW_MS = 100.0
+    QUERY_SLOW_LOG_SIZE = 100
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+_THIS_FILE = __file__.rsplit('.', 1)[0]
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_shapes: Dict[str, Dict] = {}
+_slow_queries = deque(maxlen=QUERY_SLOW_LOG_SIZE)
+_shape_cache: Dict[str, str] = {}
+
+
+def query_shape(sql: str) -> str:
+    """Normalize a statement so calls differing only in literals share one entry"""
+    shape = _shape_cache.get(sql)
+    if shape is None:
+        shape = _WHITESPACE.sub(" ", sql).strip()
+        shape = _STRING_LITERAL.sub("?", shape)
+        shape = _NUMBER_LITERAL.sub("?", shape)
+        shape = _IN_LIST.sub("IN (?, ...)", shape)
+        if len(_shape_cache) < 4096:
+            _shape_cache[sql] = shape
+    return shape
+
+
+def _calling_function() -> str:
+    """Name of the first function on the stack outside this module and sqlite3"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(_THIS_FILE) and "sqlite3" not in filename:
+            module = frame.f_globals.get("__name__", "?")
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+def _bucket(ms: float) -> int:
+    for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+        if ms < bound:
+            return i
+    return len(HISTOGRAM_BUCKETS_MS)
+
+
+def _record(shape: str, seconds: float, rows: int, caller: str):
+    ms = seconds * 1000
+    with _lock:
+        stats = _shapes.get(shape)
+        if stats is None:
+            stats = _shapes[shape] = {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                'histogram': [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+                'callers': Counter()
+            }
+        stats['count'] += 1
+        stats['total_ms'] += ms
+        stats['rows'] += rows
+        stats['max_ms'] = max(stats['max_ms'], ms)
+        stats['histogram'][_bucket(ms)] += 1
+        stats['callers'][caller] += 1
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records the duration, row count and caller of each statement"""
+
+    _statement = None
+
+    def execute(self, sql, parameters=()):
+        if not QUERY_STATS_ENABLED:
+            return super().execute(sql, parameters)
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not QUERY_STATS_ENABLED:
+            return super().executemany(sql, seq_of_parameters)
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            caller = _calling_function()
+            _record(query_shape(sql), elapsed, max(self.rowcount, 0), caller)
+            self._check_slow(sql, None, elapsed, caller)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - start, 0 if row is None else 1, done=row is None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self._fetched(time.perf_counter() - start, len(rows), done=not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - start, len(rows), done=True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Queries whose rows were iterated rather than fetched
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _begin(self, sql, parameters, elapsed):
+        if self.description is None:
+            # No result rows (INSERT/UPDATE/DDL): complete once executed
+            caller = _calling_function()
+            _record(query_shape(sql), elapsed, max(self.rowcount, 0), caller)
+            self._check_slow(sql, parameters, elapsed, caller)
+        else:
+            # Queries finish when their rows have been fetched
+            self._statement = [sql, parameters, elapsed, 0, _calling_function()]
+
+    def _fetched(self, elapsed, rows, done):
+        statement = self._statement
+        if statement is None:
+            return
+        statement[2] += elapsed
+        statement[3] += rows
+        if done:
+            self._finish()
+
+    def _finish(self):
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        sql, parameters, elapsed, rows, caller = statement
+        _record(query_shape(sql), elapsed, rows, caller)
+        self._check_slow(sql, parameters, elapsed, caller)
+
+    def _check_slow(self, sql, parameters, elapsed, caller):
+        ms = elapsed * 1000
+        if ms < QUERY_SLOW_MS:
+            return
+        plan = []
+        if parameters is not None and sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            try:
+                # A plain cursor, so explaining the query is not itself recorded
+                explain = sqlite3.Cursor(self.connection)
+                explain.execute("EXPLAIN QUERY PLAN " + sql, parameters or ())
+                plan = [row[3] for row in explain.fetchall()]
+                explain.close()
+            except sqlite3.Error as e:
+                plan = [f"(no plan: {e})"]
+        entry = {
+            'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'ms': round(ms, 2),
+            'caller': caller,
+            'shape': query_shape(sql),
+            'plan': plan
+        }
+        with _lock:
+            _slow_queries.append(entry)
+        logger.warning(f"Slow query ({entry['ms']} ms) from {entry['caller']}: {entry['shape']}"
+                       + (f" | plan: {'; '.join(plan)}" if plan else ""))
+
+
+def get_query_stats() -> List[Dict]:
+    """Per-shape statistics, slowest total time first"""
+    with _lock:
+        stats = [
+            {
+                'shape': shape,
+                'count': s['count'],
+                'total_ms': round(s['total_ms'], 2),
+                'avg_ms': round(s['total_ms'] / s['count'], 3) if s['count'] else 0.0,
+                'max_ms': round(s['max_ms'], 2),
+                'rows': s['rows'],
+                'histogram': list(s['histogram']),
+                'callers': dict(s['callers'].most_common())
+            }
+            for shape, s in _shapes.items()
+        ]
+    return sorted(stats, key=lambda s: s['total_ms'], reverse=True)
+
+
+def get_caller_stats() -> List[Dict]:
+    """Statement count and time per calling function, slowest first"""
+    totals: Dict[str, Dict] = {}
+    with _lock:
+        for s in _shapes.values():
+            for caller, count in s['callers'].items():
+                entry = totals.setdefault(caller, {'caller': caller, 'statements': 0, 'total_ms': 0.0})
+                entry['statements'] += count
+                # Time is attributed to callers in proportion to their statement count
+                entry['total_ms'] += s['total_ms'] * count / max(s['count'], 1)
+    for entry in totals.values():
+        entry['total_ms'] = round(entry['total_ms'], 2)
+    return sorted(totals.values(), key=lambda e: e['total_ms'], reverse=True)
+
+
+def get_slow_queries() -> List[Dict]:
+    """Most recent slow statements, newest first"""
+    with _lock:
+        return list(reversed(_slow_queries))
+
+
+def reset_query_stats():
+    """Forget all recorded statistics and slow queries"""
+    with _lock:
+        _shapes.clear()
+        _slow_queries.clear()
@@ -0,0 +1,230 @@
+"""
+Synthetic semester data for load testing and benchmarks.
+
+Generates a class of N students taking the configured DEFAULT_SUBJECTS, a
+weekly timetable giving every subject its SUBJECT_WEEKLY_CLASSES slots, and a
+full semester of attendance shaped by an absence pattern:
+
+- every student gets a base attendance rate from one of the pattern's groups
+  (regulars, irregulars, chronic absentees)
+- sick spells keep a student away from all classes for a few consecutive days
+- the last periods of the day lose some students
+- a few holidays and cancelled classes leave gaps in the timetable
+
+The data is written as CSV files and loaded with the bulk loader, so the same
+seed always produces the same database.
+
+    python -m utils.synthetic_data --students 300 --weeks 16 --pattern realistic
+"""
+import os
+import csv
+import random
+import logging
+import tempfile
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+from utils import db_utils
+from utils.bulk_loader import bulk_load
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import DEFAULT_SUBJECTS, SUBJECT_WEEKLY_CLASSES, DEPARTMENT, YEAR, DIVISION
+except ImportError:
+    DEFAULT_SUBJECTS = [("FOC", "Fiber Optic Communication"), ("ME", "Microwave Engineering"),
+                        ("MC", "Mobile Computing"), ("DSAJ", "Data Structures and Algorithms in Java")]
+    SUBJECT_WEEKLY_CLASSES = {"FOC": 4, "ME": 4, "MC": 4, "DSAJ": 4}
+    DEPARTMENT, YEAR, DIVISION = "ENTC", "B.Tech", "B"
+
+# Same period labels as the Take Attendance page
+PERIODS = ["10:15 - 11:15", "11:15 - 12:15", "01:15 - 02:15", "02:15 - 03:15", "03:30 - 04:30", "04:30 - 05:30"]
+TEACHING_DAYS = 5  # Monday to Friday
+
+# groups: (share of students, mean attendance rate, spread)
+# sick_spells: average spells per student per semester, each 1-5 teaching days
+# late_period_dip: extra absence probability in the last two periods
+ABSENCE_PATTERNS: Dict[str, Dict] = {
+    "steady": {"groups": [(1.0, 0.93, 0.03)], "sick_spells": 0.5, "late_period_dip": 0.0},
+    "realistic": {"groups": [(0.7, 0.88, 0.05), (0.2, 0.74, 0.08), (0.1, 0.50, 0.10)],
+                  "sick_spells": 2.0, "late_period_dip": 0.08},
+    "chronic": {"groups": [(0.5, 0.85, 0.05), (0.5, 0.55, 0.12)], "sick_spells": 3.0, "late_period_dip": 0.12},
+}
+# CSV files written, in load order; class_sessions stays empty so loading it clears old sessions
+SYNTHETIC_TABLES = ('subjects', 'students', 'student_subjects', 'class_sessions', 'attendance')
+HOLIDAY_SHARE = 0.04  # teaching days without classes
+CANCELLED_SHARE = 0.03  # timetable slots whose class was not held
+
+_FIRST_NAMES = ["Aarav", "Aditi", "Akash", "Ananya", "Arjun", "Diya", "Gaurav", "Isha", "Kunal", "Meera",
+                "Neha", "Omkar", "Pooja", "Rahul", "Riya", "Rohan", "Sakshi", "Sanket", "Shreya", "Tanvi"]
+_LAST_NAMES = ["Bhosale", "Chavan", "Deshmukh", "Gaikwad", "Jadhav", "Joshi", "Kale", "Kulkarni", "More",
+               "Patil", "Pawar", "Shinde", "Shirke", "Salunkhe", "Yadav"]
+
+
+def build_timetable(rng: random.Random) -> Dict[str, List[Tuple[int, str]]]:
+    """
+    Give every subject its weekly number of (weekday, period) slots
+
+    Returns:
+        Dictionary mapping subject code to a list of (weekday 0-4, period label)
+    """
+    slots = [(day, period) for day in range(TEACHING_DAYS) for period in PERIODS]
+    rng.shuffle(slots)
+    timetable = {}
+    for code, _ in DEFAULT_SUBJECTS:
+        weekly = SUBJECT_WEEKLY_CLASSES.get(code, 0)
+        timetable[code], slots = sorted(slots[:weekly]), slots[weekly:]
+    return timetable
+
+
+def _student_rates(rng: random.Random, students: int, pattern: Dict) -> List[float]:
+    weights = [share for share, _, _ in pattern["groups"]]
+    rates = []
+    for _ in range(students):
+        _, mean, spread = rng.choices(pattern["groups"], weights=weights)[0]
+        rates.append(min(max(rng.gauss(mean, spread), 0.05), 1.0))
+    return rates
+
+
+def generate_dataset(out_dir: str, students: int = 300, weeks: int = 16, start_date: str = "2025-07-07",
+                     pattern: str = "realistic", seed: int = 42, department: str = DEPARTMENT,
+                     year: str = YEAR, division: str = DIVISION) -> Dict:
+    """
+    Write a synthetic semester as CSV files the bulk loader accepts
+
+    Args:
+        out_dir: Directory for the CSV files (one per table in SYNTHETIC_TABLES)
+        students: Number of students
+        weeks: Length of the semester in weeks
+        start_date: First day of the semester (YYYY-MM-DD, moved back to its Monday)
+        pattern: Name of an entry in ABSENCE_PATTERNS
+        seed: Random seed; the same arguments always give the same data
+
+    Returns:
+        Dictionary with the CSV paths, row counts and the semester's date range
+    """
+    if pattern not in ABSENCE_PATTERNS:
+        raise ValueError(f"Unknown absence pattern '{pattern}'; use one of {', '.join(ABSENCE_PATTERNS)}")
+    profile = ABSENCE_PATTERNS[pattern]
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {table: os.path.join(out_dir, f"{table}.csv")
+             for table in SYNTHETIC_TABLES}
+
+    subject_ids = {code: i for i, (code, _) in enumerate(DEFAULT_SUBJECTS, start=1)}
+    with open(paths['subjects'], "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "code", "name"])
+        writer.writerows((subject_ids[code], code, name) for code, name in DEFAULT_SUBJECTS)
+
+    student_ids = list(range(1, students + 1))
+    with open(paths['students'], "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "roll_no", "name", "email", "department", "year", "division", "image_path"])
+        for student_id in student_ids:
+            roll_no = f"SY{division}{student_id:05d}"
+            writer.writerow([student_id, roll_no, f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}",
+                             f"{roll_no.lower()}@example.edu", department, year, division, ""])
+
+    with open(paths['student_subjects'], "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["student_id", "subject_id"])
+        writer.writerows((student_id, subject_id) for student_id in student_ids for subject_id in subject_ids.values())
+
+    with open(paths['class_sessions'], "w", newline="") as f:
+        csv.writer(f).writerow(["subject_id", "date", "period", "created_at"])
+
+    first_day = date.fromisoformat(start_date)
+    first_day -= timedelta(days=first_day.weekday())
+    teaching_days = [first_day + timedelta(days=week * 7 + day) for week in range(weeks) for day in range(TEACHING_DAYS)]
+    teaching_days = [day for day in teaching_days if rng.random() >= HOLIDAY_SHARE]
+
+    rates = _student_rates(rng, students, profile)
+    sick = {student_id: set() for student_id in student_ids}
+    for student_id in student_ids:
+        for _ in range(int(profile["sick_spells"] + rng.random())):
+            start = rng.randrange(len(teaching_days))
+            sick[student_id].update(teaching_days[start:start + rng.randint(1, 5)])
+
+    timetable = build_timetable(rng)
+    late_periods = set(PERIODS[-2:])
+    classes = 0
+    rows = 0
+    with open(paths['attendance'], "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["student_id", "subject_id", "date", "period", "status"])
+        for day in teaching_days:
+            day_str = day.isoformat()
+            for code, slots in timetable.items():
+                for weekday, period in slots:
+                    if weekday != day.weekday() or rng.random() < CANCELLED_SHARE:
+                        continue
+                    classes += 1
+                    dip = profile["late_period_dip"] if period in late_periods else 0.0
+                    subject_id = subject_ids[code]
+                    for student_id, rate in zip(student_ids, rates):
+                        present = day not in sick[student_id] and rng.random() < rate - dip
+                        writer.writerow((student_id, subject_id, day_str, period, "present" if present else "absent"))
+                    rows += students
+
+    return {
+        'paths': paths,
+        'students': students,
+        'subjects': len(subject_ids),
+        'classes': classes,
+        'attendance_rows': rows,
+        'date_from': teaching_days[0].isoformat() if teaching_days else start_date,
+        'date_to': teaching_days[-1].isoformat() if teaching_days else start_date,
+        'pattern': pattern,
+        'seed': seed
+    }
+
+
+def load_synthetic_semester(students: int = 300, weeks: int = 16, **kwargs) -> Dict:
+    """
+    Replace the students, subjects, enrollments and attendance in the live
+    database (db_utils.DB_PATH) with a generated semester
+
+    Accepts the same keyword arguments as generate_dataset.
+
+    Returns:
+        The dataset description from generate_dataset plus the bulk load result
+    """
+    with tempfile.TemporaryDirectory(prefix="synthetic-") as out_dir:
+        dataset = generate_dataset(out_dir, students=students, weeks=weeks, **kwargs)
+        paths = dataset.pop('paths')
+        result = bulk_load([paths[table] for table in SYNTHETIC_TABLES], truncate=True)
+    if result is None:
+        raise RuntimeError("Loading the synthetic semester failed")
+    dataset['load'] = result
+    logger.info(f"Loaded synthetic semester: {students} students, {dataset['classes']} classes, "
+                f"{dataset['attendance_rows']} attendance rows ({dataset['date_from']} to {dataset['date_to']})")
+    return dataset
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate a synthetic semester of attendance")
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--weeks", type=int, default=16)
+    parser.add_argument("--start-date", default="2025-07-07")
+    parser.add_argument("--pattern", choices=sorted(ABSENCE_PATTERNS), default="realistic")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--csv-dir", help="only write the CSV files to this directory")
+    parser.add_argument("--db", help="database to fill (defaults to the app database; its data is replaced)")
+    args = parser.parse_args()
+
+    options = dict(students=args.students, weeks=args.weeks, start_date=args.start_date,
+                   pattern=args.pattern, seed=args.seed)
+    if args.csv_dir:
+        dataset = generate_dataset(args.csv_dir, **options)
+        print(f"Wrote {dataset['attendance_rows']} attendance rows to {args.csv_dir}")
+    else:
+        if args.db:
+            db_utils.DB_PATH = args.db
+        dataset = load_synthetic_semester(**options)
+        print(f"Loaded {dataset['attendance_rows']} attendance rows into {db_utils.DB_PATH} "
+              f"in {dataset['load']['total_seconds']} sec")